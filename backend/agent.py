@@ -1,43 +1,119 @@
+import time
+_import_started = time.perf_counter()
+
 from typing import List, Dict, TypedDict, Optional, Literal, Any
-from langchain.tools import tool
-from supabase import create_client
 import os
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
 import uuid
 from langchain_core.tools import tool
-from langchain_groq import ChatGroq
 from langchain_core.prompts import ChatPromptTemplate
 from typing import Annotated
 from typing_extensions import TypedDict
-from langgraph.graph import StateGraph, START, END
+from langgraph.graph import StateGraph, END
 from langgraph.graph.message import add_messages
-from langchain_core.runnables import Runnable
-from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
+from langchain_core.runnables import Runnable, RunnableLambda
+from langchain_core.messages import HumanMessage, AIMessage
 from langgraph.prebuilt import ToolNode
 import json
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
-import uvicorn
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import APIRouter, FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Request, Response
+from sessions import create_checkpointer
+from catalog import SORT_ORDERS, ProductCache
+from recipe_cache import RecipeCache
+from context import ContextWindow
+from router import IntentRouter
+from cart_store import CartStore
+from reaper import SessionReaper
+from payloads import tool_result
+from search_cache import ResponseCache, decode_cursor, encode_cursor, etag_matches
+from suggest import KINDS, PrefixIndex
+from matcher import name_covers
+from semantic import SemanticIndex
+from nutrition import AMOUNTS, NutritionStore, nutrient_field
+from repository import CountingRepository, create_repository
+from metrics import observe_db_call, observe_llm_call, observe_route, render_latest, timed_tool, track_turn
 
 # Load environment variables
 load_dotenv(dotenv_path="../.env")
 
-# Initialize Supabase client
-supabase = create_client(
-    os.getenv("SUPABASE_URL"),
-    os.getenv("SUPABASE_KEY")
+# Data access for all tools: Supabase by default, or a local SQLite copy (DATA_BACKEND=sqlite)
+repository = CountingRepository(create_repository(), observer=observe_db_call)
+
+# Shared in-process copy of the product catalog for all read-only product lookups
+product_cache = ProductCache(
+    repository.list_products,
+    ttl_seconds=float(os.getenv("PRODUCT_CACHE_TTL_SECONDS", "300")),
+    aloader=repository.alist_products
+)
+
+# Character n-gram vectors of product names, for ingredient phrasings the fuzzy matcher cannot place
+semantic_index = SemanticIndex(dimensions=int(os.getenv("SEMANTIC_DIMENSIONS", "4096")))
+product_cache.on_reload(semantic_index.sync)
+SEMANTIC_MIN_SCORE = float(os.getenv("SEMANTIC_MIN_SCORE", "0.45"))
+
+# Nutrition columns of active products as a NumPy matrix, for comparisons and cart totals
+nutrition_store = NutritionStore()
+product_cache.on_reload(nutrition_store.sync)
+
+# Active carts live in memory and are written back in batches (see CartStore for durability modes)
+cart_store = CartStore(
+    repository,
+    durability=os.getenv("CART_DURABILITY", "batched"),
+    flush_interval=float(os.getenv("CART_FLUSH_INTERVAL_SECONDS", "2")),
+    max_pending=int(os.getenv("CART_FLUSH_MAX_PENDING", "20")),
+    idle_seconds=float(os.getenv("CART_IDLE_SECONDS", "1800"))
 )
 
-# use llm to get ingredients
-llm_ing = ChatGroq(
-    model="deepseek-r1-distill-llama-70b",
-    temperature=0,
-    max_tokens=None,
-    reasoning_format="parsed",
-    timeout=None,
-    max_retries=2,
+# Expires cart sessions and releases their carts in the background, in bounded batches
+session_reaper = SessionReaper(
+    repository,
+    cart_store,
+    interval=float(os.getenv("SESSION_REAPER_INTERVAL_SECONDS", "300")),
+    jitter=float(os.getenv("SESSION_REAPER_JITTER", "0.2")),
+    batch_size=int(os.getenv("SESSION_REAPER_BATCH_SIZE", "500")),
+    max_batches=int(os.getenv("SESSION_REAPER_MAX_BATCHES", "20"))
+)
+SESSION_REAPER_ENABLED = os.getenv("SESSION_REAPER_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# use llm to get ingredients; created on first use (assign a fake chat model here to run offline)
+llm_ing = None
+
+def ingredient_llm():
+    """The ingredient-extraction LLM, created on first use"""
+    global llm_ing
+    if llm_ing is None:
+        from langchain_groq import ChatGroq
+        llm_ing = ChatGroq(
+            model="deepseek-r1-distill-llama-70b",
+            temperature=0,
+            max_tokens=None,
+            reasoning_format="parsed",
+            timeout=float(os.getenv("INGREDIENT_LLM_TIMEOUT", "60")),
+            max_retries=2,
+        )
+    return llm_ing
+
+# Ingredient extractions are memoized per normalized recipe request, across restarts;
+# a relative RECIPE_CACHE_PATH is resolved against this directory and opened on first use
+recipe_cache = RecipeCache(
+    path=os.getenv("RECIPE_CACHE_PATH", "recipe_cache.sqlite"),
+    max_memory_entries=int(os.getenv("RECIPE_CACHE_MEMORY_ENTRIES", "256")),
+    max_disk_entries=int(os.getenv("RECIPE_CACHE_DISK_ENTRIES", "5000")),
+    ttl_seconds=float(os.getenv("RECIPE_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
 )
 
+INGREDIENT_PROMPT = ChatPromptTemplate.from_messages([
+    (
+        "system",
+        "You are a helpful assistant that extracts ingredients from the recipe mentioned by the user. "
+        "Return a JSON object in the following format ONLY:\n"
+        '{{"recipe": "<name_of_recipe>", "ingredients": ["ingredient1", "ingredient2", "..."]}}'
+    ),
+    ("human", "{recipe_request}"),
+])
+
 # State definition
 class State(TypedDict):
     messages: Annotated[list, add_messages]
@@ -45,58 +121,95 @@ class State(TypedDict):
     session_id: str
 
 
-@tool
-def extract_recipe_ingredients(recipe_request: str) -> str:
-    """Extract required ingredients from a recipe request using an LLM. Returns a JSON string."""
+def async_tool(sync_tool):
+    """Attach a native async implementation to a tool; ToolNode awaits it instead of using a worker thread"""
+    def register(coroutine):
+        sync_tool.coroutine = timed_tool(coroutine, name=sync_tool.name)
+        return coroutine
+    return register
 
-    prompt = ChatPromptTemplate.from_messages([
-        (
-            "system",
-            "You are a helpful assistant that extracts ingredients from the recipe mentioned by the user. "
-            "Return a JSON object in the following format ONLY:\n"
-            '{"recipe": "<name_of_recipe>", "ingredients": ["ingredient1", "ingredient2", "..."]}'
-        ),
-        ("human", "{recipe_request}"),
-    ])
-
-    chain: Runnable = prompt | llm_ing
-    result = chain.invoke({"recipe_request": recipe_request})
+def catalog_tool(sync_tool):
+    """Async implementation for tools that only read the product cache: refresh it off the loop, then run inline"""
+    func = sync_tool.func.__wrapped__
+
+    async def run_inline(**kwargs):
+        await product_cache.aensure_fresh()
+        return func(**kwargs)
 
+    sync_tool.coroutine = timed_tool(run_inline, name=sync_tool.name)
+    return sync_tool
+
+def _parse_ingredients(result: Any) -> Optional[dict]:
     try:
-        json_obj = json.loads(result)
-        return json.dumps(json_obj)
-    except json.JSONDecodeError:
+        json_obj = json.loads(result.content)
+        return json_obj if isinstance(json_obj, dict) else None
+    except (json.JSONDecodeError, AttributeError):
+        return None
+
+def _ingredients_result(json_obj: Optional[dict]) -> str:
+    if json_obj is None:
         return json.dumps({
             "recipe": "unknown",
             "ingredients": []
         })
+    return tool_result("extract_recipe_ingredients", json_obj)
+
+@tool
+@timed_tool
+def extract_recipe_ingredients(recipe_request: str) -> str:
+    """Extract required ingredients from a recipe request using an LLM. Returns a JSON string."""
+    cached = recipe_cache.get(recipe_request)
+    if cached is not None:
+        return tool_result("extract_recipe_ingredients", cached)
+
+    chain: Runnable = INGREDIENT_PROMPT | ingredient_llm()
+    started = time.perf_counter()
+    result = chain.invoke({"recipe_request": recipe_request})
+    observe_llm_call("ingredients", time.perf_counter() - started, result)
+    json_obj = _parse_ingredients(result)
+    # Only successful extractions are worth remembering
+    if json_obj and json_obj.get("ingredients"):
+        recipe_cache.put(recipe_request, json_obj, time.perf_counter() - started)
+    return _ingredients_result(json_obj)
+
+@async_tool(extract_recipe_ingredients)
+async def aextract_recipe_ingredients(recipe_request: str) -> str:
+    # Memory hits are served inline; the SQLite lookup runs in a worker thread
+    cached = await recipe_cache.aget(recipe_request)
+    if cached is not None:
+        return tool_result("extract_recipe_ingredients", cached)
+
+    chain: Runnable = INGREDIENT_PROMPT | ingredient_llm()
+    started = time.perf_counter()
+    result = await chain.ainvoke({"recipe_request": recipe_request})
+    observe_llm_call("ingredients", time.perf_counter() - started, result)
+    json_obj = _parse_ingredients(result)
+    if json_obj and json_obj.get("ingredients"):
+        await recipe_cache.aput(recipe_request, json_obj, time.perf_counter() - started)
+    return _ingredients_result(json_obj)
 
 
 @tool
-def check_ingredient_availability(ingredient_name: str, category: Optional[str] = None) -> str:
-    """Check if an ingredient exists in the products table and fetch available options. Returns a JSON string."""
+@timed_tool
+def check_ingredient_availability(ingredient_name: str, category: Optional[str] = None, full: bool = False) -> str:
+    """Check if an ingredient exists in the products table and fetch the best-matching options, each with a match score (options marked approximate are near matches to confirm with the user); full=True returns every column of every match. Returns a JSON string."""
     try:
-        query = supabase.table('products').select('*').eq('is_active', True)
-        query = query.ilike('item_name', f'%{ingredient_name}%')
-        if category:
-            query = query.eq('category', category)
-        
-        response = query.execute()
+        options = _ingredient_options([ingredient_name], category)[ingredient_name]
         
-        if response.data:
+        if options:
             result = {
                 "available": True,
-                "options": response.data,
-                "count": len(response.data)
+                "options": options,
+                "count": len(options)
             }
-            return json.dumps(result)
+            return tool_result("check_ingredient_availability", result, full)
         else:
             result = {
                 "available": False,
                 "options": [],
                 "count": 0
             }
-            return json.dumps(result)
+            return tool_result("check_ingredient_availability", result, full)
     except Exception as e:
         result = {
             "available": False,
@@ -106,34 +219,95 @@ def check_ingredient_availability(ingredient_name: str, category: Optional[str]
         return json.dumps(result)
 
 @tool
-def create_cart_session(user_id: str, session_type: str = "recipe_based") -> str:
-    """Create a new cart session for the user. Returns a JSON string."""
+@timed_tool
+def check_ingredients_availability(ingredient_names: List[str], category: Optional[str] = None, full: bool = False) -> str:
+    """Check a whole list of ingredients at once and fetch the best-matching options for each, grouped by ingredient (options marked approximate are near matches to confirm with the user); full=True returns every column. Returns a JSON string."""
     try:
-        session_data = {
-            "user_id": user_id,
-            "session_id": f"session_{user_id}_{datetime.now().strftime('%Y%m%d%H%M%S')}",
-            "session_type": session_type,
-            "active": True,
-            "expires_at": (datetime.now() + timedelta(hours=24)).isoformat(),
-            "metadata": {"created_from": "recipe_assistant"}
-        }
-        response = supabase.table('cart_sessions').insert(session_data).execute()
+        results = {}
+        unavailable = []
+        for ingredient_name, options in _ingredient_options(ingredient_names, category).items():
+            results[ingredient_name] = {
+                "available": bool(options),
+                "options": options,
+                "count": len(options)
+            }
+            if not options:
+                unavailable.append(ingredient_name)
+
         result = {
-            "success": True,
-            "session_id": response.data[0]["session_id"],
-            "data": response.data[0]
+            "results": results,
+            "available_count": len(results) - len(unavailable),
+            "unavailable": unavailable
         }
-        return json.dumps(result)
+        return tool_result("check_ingredients_availability", result, full)
+    except Exception as e:
+        return json.dumps({"results": {}, "error": str(e), "unavailable": list(ingredient_names)})
+
+def _ingredient_options(ingredient_names: List[str], category: Optional[str]) -> Dict[str, List[dict]]:
+    """Scored product options per ingredient: fuzzy matches first, then one batched semantic lookup for the rest.
+
+    Fuzzy matches must name the ingredient's head noun ('butter chicken' is not Butter). Semantic
+    matches must name every word of it and are marked approximate, for the agent to confirm.
+    """
+    options = {
+        name: [{**product, "match_score": score} for product, score in product_cache.match(name, category=category)
+               if name_covers(name, product.get("item_name") or "", head_only=True)]
+        for name in dict.fromkeys(ingredient_names)
+    }
+    missing = [name for name, found in options.items() if not found]
+    if missing:
+        for name, hits in zip(missing, semantic_index.top_k_many(missing, k=5, min_score=SEMANTIC_MIN_SCORE,
+                                                                  category=category, covering=True)):
+            scores = dict(hits)
+            options[name] = [{**product, "match_score": scores[product["sku"]], "approximate": True}
+                             for product in product_cache.get_many(scores)]
+    return options
+
+@tool
+@timed_tool
+def create_cart_session(user_id: str, session_type: str = "recipe_based") -> str:
+    """Create a new cart session for the user. Returns a JSON string."""
+    try:
+        session = repository.create_session(_new_session(user_id, session_type))
+        cart_store.remember_session(session["session_id"], session.get("expires_at"))
+        return _session_result(session)
+    except Exception as e:
+        return json.dumps({"success": False, "error": str(e)})
+
+@async_tool(create_cart_session)
+async def acreate_cart_session(user_id: str, session_type: str = "recipe_based") -> str:
+    try:
+        session = await repository.acreate_session(_new_session(user_id, session_type))
+        cart_store.remember_session(session["session_id"], session.get("expires_at"))
+        return _session_result(session)
     except Exception as e:
         return json.dumps({"success": False, "error": str(e)})
 
+def _new_session(user_id: str, session_type: str) -> dict:
+    return {
+        "user_id": user_id,
+        "session_id": f"session_{user_id}_{datetime.now().strftime('%Y%m%d%H%M%S')}",
+        "session_type": session_type,
+        "active": True,
+        "expires_at": (datetime.now() + timedelta(hours=24)).isoformat(),
+        "metadata": {"created_from": "recipe_assistant"}
+    }
+
+def _session_result(session: dict) -> str:
+    result = {
+        "success": True,
+        "session_id": session["session_id"],
+        "data": session
+    }
+    return tool_result("create_cart_session", result)
+
 @tool
-def get_product_details_for_comparison(skus: List[str]) -> str:
-    """Fetch detailed product information for comparison. Returns a JSON string."""
+@timed_tool
+def get_product_details_for_comparison(skus: List[str], full: bool = False) -> str:
+    """Fetch detailed product information for comparison; full=True adds category, per-unit price and stock flags. Returns a JSON string."""
     try:
-        response = supabase.table('products').select('*').in_('sku', skus).eq('is_active', True).execute()
         products = []
-        for item in response.data:
+        for item in product_cache.get_many(skus, active_only=True):
             products.append({
                 "id": item.get("id"),
                 "sku": item.get("sku"),
@@ -156,146 +330,192 @@ def get_product_details_for_comparison(skus: List[str]) -> str:
                 "in_stock": item.get("stock_quantity", 0) > 0
             })
         products.sort(key=lambda x: x["price"])
-        return json.dumps(products)
+        return tool_result("get_product_details_for_comparison", products, full)
     except Exception as e:
         print(f"Error fetching product details: {e}")
         return json.dumps([])
 
 @tool
+@timed_tool
 def add_to_cart(user_id: str, sku: str, quantity: int = 1, notes: str = "", session_id: str = None) -> str:
     """Add a selected product to the shopping cart with session tracking. Returns a JSON string."""
     try:
-        # Verify product exists
-        product_response = supabase.table('products').select('*').eq('sku', sku).single().execute()
-        product = product_response.data
-        if not product:
-            return json.dumps({"success": False, "error": "Product not found"})
-        
-        if product.get('stock_quantity', 0) < quantity:
-            return json.dumps({"success": False, "error": f"Insufficient stock. Only {product.get('stock_quantity')} available"})
-        
-        # Verify or create session_id
-        if not session_id:
-            return json.dumps({"success": False, "error": "session_id is required (foreign key constraint)"})
-        
-        # Check if session exists
-        session_check = supabase.table('cart_sessions').select('session_id').eq('session_id', session_id).execute()
-        if not session_check.data:
-            return json.dumps({"success": False, "error": f"Session {session_id} does not exist. Please create a cart session first."})
-        
-        existing = supabase.table('shopping_carts').select('*').match({'user_id': user_id, 'sku': sku, 'status': 'active', 'session_id': session_id}).execute()
-        unit_price = float(product.get('price', 0))
+        product, error = _check_cart_line(sku, quantity, session_id)
+        if error:
+            return error
         
-        if existing.data:
-            new_quantity = existing.data[0]['quantity'] + quantity
-            response = supabase.table('shopping_carts').update({
-                'quantity': new_quantity,
-                'updated_at': datetime.now().isoformat()
-            }).eq('id', existing.data[0]['id']).execute()
-            action = "updated"
-        else:
-            cart_item = {
-                'user_id': user_id,
-                'sku': sku,
-                'product_name': product.get('item_name'),
-                'brand': product.get('brand'),
-                'quantity': quantity,
-                'unit_price': unit_price,
-                'notes': notes or '',
-                'status': 'active',
-                'session_id': session_id
-            }
-            response = supabase.table('shopping_carts').insert(cart_item).execute()
-            action = "added"
-        
-        result = {"success": True, "message": f"Item {action} to cart", "data": response.data[0]}
-        return json.dumps(result)
+        # Applied to the in-memory cart and queued for the next flush; the first line of a
+        # session the store has not seen is written through so its foreign key is checked now
+        upsert = cart_store.add(
+            user_id, session_id, sku, quantity,
+            product.get('item_name'), product.get('brand'), float(product.get('price', 0)), notes
+        )
+        return _cart_line_result(upsert)
     except Exception as e:
         return json.dumps({"success": False, "error": str(e)})
 
+@async_tool(add_to_cart)
+async def aadd_to_cart(user_id: str, sku: str, quantity: int = 1, notes: str = "", session_id: str = None) -> str:
+    try:
+        await product_cache.aensure_fresh()
+        product, error = _check_cart_line(sku, quantity, session_id)
+        if error:
+            return error
+
+        upsert = await cart_store.aadd(
+            user_id, session_id, sku, quantity,
+            product.get('item_name'), product.get('brand'), float(product.get('price', 0)), notes
+        )
+        return _cart_line_result(upsert)
+    except Exception as e:
+        return json.dumps({"success": False, "error": str(e)})
+
+def _check_cart_line(sku: str, quantity: int, session_id: Optional[str]):
+    """Validate a cart line against the cached catalog; returns (product, None) or (None, error JSON)"""
+    # Verify product exists
+    product = product_cache.get(sku)
+    if not product:
+        return None, json.dumps({"success": False, "error": "Product not found"})
+    
+    if product.get('stock_quantity', 0) < quantity:
+        return None, json.dumps({"success": False, "error": f"Insufficient stock. Only {product.get('stock_quantity')} available"})
+    
+    # Verify or create session_id
+    if not session_id:
+        return None, json.dumps({"success": False, "error": "session_id is required (foreign key constraint)"})
+    return product, None
+
+def _cart_line_result(upsert: dict) -> str:
+    if not upsert.get("success"):
+        return json.dumps({"success": False, "error": upsert.get("error")})
+    action = "added" if upsert["inserted"] else "updated"
+    
+    result = {"success": True, "message": f"Item {action} to cart", "data": upsert["data"]}
+    return tool_result("add_to_cart", result)
+
 @tool
-def get_user_cart(user_id: str, status: str = "active") -> str:
-    """Retrieve the current cart contents for a user. Returns a JSON string."""
+@timed_tool
+def get_user_cart(user_id: str, status: str = "active", include_items: bool = True) -> str:
+    """Retrieve the current cart contents for a user; include_items=False returns only the totals. Returns a JSON string."""
     try:
-        response = supabase.table('shopping_carts').select('*').match({'user_id': user_id, 'status': status}).execute()
-        cart_items = response.data
-        total_price = sum(float(item.get('unit_price', 0)) * item.get('quantity', 0) for item in cart_items)
-        total_items = sum(item.get('quantity', 0) for item in cart_items)
-        
-        brands = {}
-        for item in cart_items:
-            brand = item.get('brand', 'Unknown')
-            if brand not in brands:
-                brands[brand] = 0
-            brands[brand] += 1
-        
-        result = {
-            "user_id": user_id, "items": cart_items, "item_count": len(cart_items), "total_items": total_items,
-            "total_price": round(total_price, 2), "brands_summary": brands, "status": status
-        }
-        return json.dumps(result)
+        # Active carts keep running totals in memory; other statuses are aggregated by the database
+        summary = cart_store.summary(user_id) if status == "active" else repository.cart_summary(user_id, status)
+        return _cart_result(user_id, status, summary, include_items)
+    except Exception as e:
+        return json.dumps({"error": str(e), "items": [], "total_price": 0})
+
+@async_tool(get_user_cart)
+async def aget_user_cart(user_id: str, status: str = "active", include_items: bool = True) -> str:
+    try:
+        summary = await cart_store.asummary(user_id) if status == "active" else await repository.acart_summary(user_id, status)
+        return _cart_result(user_id, status, summary, include_items)
     except Exception as e:
         return json.dumps({"error": str(e), "items": [], "total_price": 0})
 
+def _cart_result(user_id: str, status: str, summary: dict, include_items: bool) -> str:
+    result = {"user_id": user_id, "status": status, **summary}
+    result["total_price"] = round(float(result["total_price"]), 2)
+    if not include_items:
+        del result["items"]
+    return tool_result("get_user_cart", result)
+
 @tool
+@timed_tool
 def remove_from_cart(user_id: str, sku: str) -> str:
     """Remove an item from the user's cart by marking it as removed. Returns a JSON string."""
     try:
-        response = supabase.table('shopping_carts').update({'status': 'removed', 'updated_at': datetime.now().isoformat()}).match({'user_id': user_id, 'sku': sku, 'status': 'active'}).execute()
-        if response.data:
-            return json.dumps({"success": True, "message": "Item removed from cart"})
-        else:
-            return json.dumps({"success": False, "message": "Item not found in cart"})
+        return _removed_result(cart_store.remove(user_id, sku))
+    except Exception as e:
+        return json.dumps({"success": False, "error": str(e)})
+
+@async_tool(remove_from_cart)
+async def aremove_from_cart(user_id: str, sku: str) -> str:
+    try:
+        return _removed_result(await cart_store.aremove(user_id, sku))
     except Exception as e:
         return json.dumps({"success": False, "error": str(e)})
 
+def _removed_result(removed: List[dict]) -> str:
+    if removed:
+        return json.dumps({"success": True, "message": "Item removed from cart"})
+    else:
+        return json.dumps({"success": False, "message": "Item not found in cart"})
+
 @tool
+@timed_tool
 def update_cart_quantity(user_id: str, sku: str, new_quantity: int) -> str:
     """Update the quantity of an item in the cart. Returns a JSON string."""
     try:
         if new_quantity <= 0:
-            return remove_from_cart(user_id, sku)
-        
-        cart_item = supabase.table('shopping_carts').select('*').match({'user_id': user_id, 'sku': sku, 'status': 'active'}).single().execute()
-        if not cart_item.data:
-            return json.dumps({"success": False, "error": "Item not found in cart"})
+            return remove_from_cart.invoke({"user_id": user_id, "sku": sku})
         
-        product = supabase.table('products').select('stock_quantity').eq('sku', sku).single().execute()
-        if product.data.get('stock_quantity', 0) < new_quantity:
-            return json.dumps({"success": False, "error": f"Insufficient stock. Only {product.data.get('stock_quantity')} available"})
+        cart_item = cart_store.get_line(user_id, sku)
+        error = _check_quantity_update(cart_item, sku, new_quantity)
+        if error:
+            return error
         
-        response = supabase.table('shopping_carts').update({'quantity': new_quantity, 'updated_at': datetime.now().isoformat()}).eq('id', cart_item.data['id']).execute()
-        return json.dumps({"success": True, "message": "Quantity updated", "data": response.data[0]})
+        updated = cart_store.set_quantity(user_id, sku, new_quantity)
+        return tool_result("update_cart_quantity", {"success": True, "message": "Quantity updated", "data": updated})
+    except Exception as e:
+        return json.dumps({"success": False, "error": str(e)})
+
+@async_tool(update_cart_quantity)
+async def aupdate_cart_quantity(user_id: str, sku: str, new_quantity: int) -> str:
+    try:
+        if new_quantity <= 0:
+            return await remove_from_cart.ainvoke({"user_id": user_id, "sku": sku})
+
+        await product_cache.aensure_fresh()
+        cart_item = await cart_store.aget_line(user_id, sku)
+        error = _check_quantity_update(cart_item, sku, new_quantity)
+        if error:
+            return error
+
+        updated = await cart_store.aset_quantity(user_id, sku, new_quantity)
+        return tool_result("update_cart_quantity", {"success": True, "message": "Quantity updated", "data": updated})
     except Exception as e:
         return json.dumps({"success": False, "error": str(e)})
 
+def _check_quantity_update(cart_item: Optional[dict], sku: str, new_quantity: int) -> Optional[str]:
+    """Error JSON if the cart line is missing or the new quantity exceeds stock, else None"""
+    if not cart_item:
+        return json.dumps({"success": False, "error": "Item not found in cart"})
+    
+    product = product_cache.get(sku)
+    if not product:
+        return json.dumps({"success": False, "error": "Product not found"})
+    if product.get('stock_quantity', 0) < new_quantity:
+        return json.dumps({"success": False, "error": f"Insufficient stock. Only {product.get('stock_quantity')} available"})
+    return None
+
 @tool
-def search_alternatives(ingredient_name: str, exclude_skus: List[str] = [], category: str = None) -> str:
-    """Search for alternative products. Returns a JSON string."""
+@timed_tool
+def search_alternatives(ingredient_name: str, exclude_skus: List[str] = [], category: str = None, full: bool = False) -> str:
+    """Search for alternative products; full=True adds category and stock flags. Returns a JSON string."""
     try:
-        query = supabase.table('products').select('*').eq('is_active', True)
+        excluded = set(exclude_skus or [])
+        candidates = [product for product, _ in product_cache.match(ingredient_name, top_k=20)]
         if category:
-            query = query.or_(f'item_name.ilike.%{ingredient_name}%,category.eq.{category}')
-        else:
-            query = query.ilike('item_name', f'%{ingredient_name}%')
-        if exclude_skus:
-            query = query.not_.in_('sku', exclude_skus)
-        query = query.gt('stock_quantity', 0)
-        response = query.limit(5).execute()
+            candidates += product_cache.by_category(category)
+        matches = [
+            product for product in {p['sku']: p for p in candidates}.values()
+            if product.get('sku') not in excluded and product.get('stock_quantity', 0) > 0
+        ]
         
         alternatives = []
-        for product in response.data:
+        for product in matches[:5]:
             alternatives.append({
                 "sku": product.get("sku"), "item_name": product.get("item_name"), "brand": product.get("brand"),
                 "price": float(product.get("price", 0)), "quantity": f"{product.get('quantity')} {product.get('unit')}",
                 "category": product.get("category"), "in_stock": product.get("stock_quantity", 0) > 0
             })
-        return json.dumps(alternatives)
+        return tool_result("search_alternatives", alternatives, full)
     except Exception as e:
         print(f"Error finding alternatives: {e}")
         return json.dumps([])
 
 @tool
+@timed_tool
 def checkout_cart(user_id: str, shipping_address: str = "Default Address", delivery_date: str = None, special_instructions: str = "") -> str:
     """Convert active cart items to an order. Returns a JSON string."""
     try:
@@ -303,128 +523,163 @@ def checkout_cart(user_id: str, shipping_address: str = "Default Address", deliv
         if not user_id:
             return json.dumps({"success": False, "error": "User ID is required"})
         
-        if not shipping_address or shipping_address.strip() == "":
-            shipping_address = "Default Delivery Address"
-        
-        # Fetch cart items
-        cart_response = supabase.table('shopping_carts').select('*').match({'user_id': user_id, 'status': 'active'}).execute()
-        
-        if not cart_response.data:
-            return json.dumps({"success": False, "error": "Cart is empty"})
-        
-        # Calculate totals
-        total_amount = sum(float(item.get('unit_price', 0)) * item.get('quantity', 0) for item in cart_response.data)
-        order_number = f"ORD-{user_id}-{datetime.now().strftime('%Y%m%d%H%M%S')}"
-        
-        # Parse delivery_date properly (schema expects 'date' type)
-        parsed_delivery_date = None
-        if delivery_date:
-            try:
-                parsed_delivery_date = datetime.fromisoformat(delivery_date).date().isoformat()
-            except:
-                parsed_delivery_date = datetime.now().date().isoformat()
-        else:
-            parsed_delivery_date = datetime.now().date().isoformat()
-        
-        # Create order (no created_at field in schema, will use default)
-        order_data = {
-            'user_id': user_id,
-            'order_number': order_number,
-            'total_amount': round(total_amount, 2),
-            'order_status': 'pending',
-            'shipping_address': shipping_address,
-            'delivery_date': parsed_delivery_date,
-            'special_instructions': special_instructions or ''
-        }
-        
-        order_response = supabase.table('orders').insert(order_data).execute()
-        
-        if not order_response.data:
-            return json.dumps({"success": False, "error": "Failed to create order"})
-        
-        order_id = order_response.data[0]['id']
-        
-        # Create order items (DO NOT include total_price as it's a generated column)
-        order_items = [
-            {
-                'order_id': order_id,
-                'sku': item.get('sku'),
-                'product_name': item.get('product_name'),
-                'brand': item.get('brand'),
-                'quantity': item.get('quantity'),
-                'unit_price': float(item.get('unit_price'))
-            }
-            for item in cart_response.data
-        ]
-        
-        supabase.table('order_items').insert(order_items).execute()
-        
-        # Update cart status (add order_id as per schema foreign key)
-        cart_ids = [item['id'] for item in cart_response.data]
-        supabase.table('shopping_carts').update({
-            'status': 'purchased',
-            'order_id': order_id,
-            'updated_at': datetime.now().isoformat()
-        }).in_('id', cart_ids).execute()
-        
-        # Update product stock
-        for item in cart_response.data:
-            try:
-                product_response = supabase.table('products').select('stock_quantity').eq('sku', item['sku']).single().execute()
-                new_stock = product_response.data['stock_quantity'] - item['quantity']
-                supabase.table('products').update({
-                    'stock_quantity': max(0, new_stock),
-                    'updated_at': datetime.now().isoformat()
-                }).eq('sku', item['sku']).execute()
-            except Exception as stock_error:
-                print(f"Warning: Could not update stock for SKU {item['sku']}: {stock_error}")
-        
-        result = {
-            "success": True,
-            "order_id": order_id,
-            "order_number": order_number,
-            "total_amount": round(total_amount, 2),
-            "item_count": len(order_items),
-            "message": f"Order placed successfully! Order number: {order_number}"
-        }
-        return json.dumps(result)
+        # Queued cart edits must be stored before the order is built from shopping_carts
+        if not cart_store.flush(user_id):
+            return json.dumps({"success": False, "error": "Checkout failed: cart changes could not be saved, please try again"})
+
+        # Order, order items, cart status and stock are all written by one
+        # server-side transaction (see checkout_cart in supabase.sql)
+        result = repository.checkout(user_id, *_checkout_details(shipping_address, delivery_date), special_instructions)
+        return _checkout_result(user_id, result)
     
     except Exception as e:
         print(f"Checkout error: {str(e)}")
         return json.dumps({"success": False, "error": f"Checkout failed: {str(e)}"})
 
+@async_tool(checkout_cart)
+async def acheckout_cart(user_id: str, shipping_address: str = "Default Address", delivery_date: str = None, special_instructions: str = "") -> str:
+    try:
+        if not user_id:
+            return json.dumps({"success": False, "error": "User ID is required"})
+
+        if not await cart_store.aflush(user_id):
+            return json.dumps({"success": False, "error": "Checkout failed: cart changes could not be saved, please try again"})
+
+        result = await repository.acheckout(user_id, *_checkout_details(shipping_address, delivery_date), special_instructions)
+        return _checkout_result(user_id, result)
+
+    except Exception as e:
+        print(f"Checkout error: {str(e)}")
+        return json.dumps({"success": False, "error": f"Checkout failed: {str(e)}"})
+
+def _checkout_details(shipping_address: str, delivery_date: Optional[str]) -> tuple:
+    """Normalized (shipping_address, delivery_date) for the checkout RPC"""
+    if not shipping_address or shipping_address.strip() == "":
+        shipping_address = "Default Delivery Address"
+    
+    # Parse delivery_date properly (schema expects 'date' type)
+    parsed_delivery_date = None
+    if delivery_date:
+        try:
+            parsed_delivery_date = datetime.fromisoformat(delivery_date).date().isoformat()
+        except:
+            parsed_delivery_date = datetime.now().date().isoformat()
+    else:
+        parsed_delivery_date = datetime.now().date().isoformat()
+    return shipping_address, parsed_delivery_date
+
+def _checkout_result(user_id: str, result: dict) -> str:
+    if result.get("success"):
+        result["total_amount"] = round(float(result["total_amount"]), 2)
+        # The active lines were turned into order items
+        cart_store.checked_out(user_id)
+        # Stock levels changed, so the cached catalog is stale
+        product_cache.invalidate()
+    return tool_result("checkout_cart", result)
+
 @tool
-def get_nutrition_comparison(skus: List[str]) -> str:
-    """Compare nutritional information for multiple products. Returns a JSON string."""
+@timed_tool
+def get_nutrition_comparison(skus: List[str], sort_by: Optional[str] = None) -> str:
+    """Compare nutrition per 100g of several products; sort_by (calories, protein, fat, carbs or sugar) lists them lowest first. Returns a JSON string."""
     try:
-        response = supabase.table('products').select('sku, item_name, brand, calories_per_100g, protein_g, fat_g, carbs_g, sugar_g, allergens').in_('sku', skus).execute()
+        products = {product["sku"]: product for product in product_cache.get_many(skus, active_only=True)}
+        order = [sku for sku, _ in nutrition_store.rank(products, sort_by)] if sort_by else list(products)
         comparisons = []
-        for product in response.data:
+        for sku, per_100g in nutrition_store.per_100g(order).items():
+            product = products[sku]
             comparisons.append({
-                "sku": product.get("sku"), "name": f"{product.get('brand')} {product.get('item_name')}",
-                "nutrition_per_100g": {"calories": product.get("calories_per_100g", 0), "protein": f"{product.get('protein_g', 0)}g", "fat": f"{product.get('fat_g', 0)}g", "carbs": f"{product.get('carbs_g', 0)}g", "sugar": f"{product.get('sugar_g', 0)}g"},
+                "sku": sku, "name": f"{product.get('brand')} {product.get('item_name')}",
+                "nutrition_per_100g": per_100g,
                 "allergens": product.get("allergens", "None").split(",") if product.get("allergens") else ["None"]
             })
-        return json.dumps(comparisons)
+        return tool_result("get_nutrition_comparison", comparisons)
+    except ValueError as e:
+        return json.dumps({"error": str(e)})
     except Exception as e:
         print(f"Error comparing nutrition: {e}")
         return json.dumps([])
 
 @tool
-def clear_expired_sessions() -> str:
-    """Clean up expired cart sessions. Returns a JSON string."""
+@timed_tool
+def find_best_nutrition_options(ingredient_names: List[str], nutrient: str = "sugar", highest: bool = False,
+                                category: Optional[str] = None) -> str:
+    """For each ingredient, the in-stock product lowest in a nutrient per 100g (calories, protein, fat, carbs or sugar); highest=True picks the highest, e.g. for protein. Returns a JSON string."""
     try:
-        response = supabase.table('cart_sessions').update({'active': False}).lt('expires_at', datetime.now().isoformat()).eq('active', True).execute()
-        return json.dumps({"success": True, "sessions_expired": len(response.data)})
+        field = nutrient_field(nutrient)
+        options = _ingredient_options(ingredient_names, category)
+        candidates = {
+            name: [product["sku"] for product in products if (product.get("stock_quantity") or 0) > 0]
+            for name, products in options.items()
+        }
+        products = {product["sku"]: product for found in options.values() for product in found}
+        results = {}
+        for name, best in nutrition_store.best_per_group(candidates, field, highest).items():
+            if best is not None:
+                # The product row already carries every nutrition column
+                results[name] = {**products[best[0]], "options_compared": len(candidates[name])}
+        result = {
+            "nutrient": field,
+            "prefer": "highest" if highest else "lowest",
+            "results": results,
+            "unavailable": [name for name in candidates if name not in results]
+        }
+        return tool_result("find_best_nutrition_options", result)
+    except ValueError as e:
+        return json.dumps({"error": str(e)})
     except Exception as e:
-        return json.dumps({"success": False, "error": str(e)})
+        print(f"Error ranking nutrition options: {e}")
+        return json.dumps({"error": str(e), "results": {}})
+
+@tool
+@timed_tool
+def get_cart_nutrition(user_id: str) -> str:
+    """Total calories, protein, fat, carbs and sugar in the user's active cart, weighted by pack size and quantity. Returns a JSON string."""
+    try:
+        product_cache.ensure_fresh()
+        return _cart_nutrition_result(user_id, cart_store.summary(user_id))
+    except Exception as e:
+        return json.dumps({"error": str(e), "totals": {}})
 
+@async_tool(get_cart_nutrition)
+async def aget_cart_nutrition(user_id: str) -> str:
+    try:
+        await product_cache.aensure_fresh()
+        return _cart_nutrition_result(user_id, await cart_store.asummary(user_id))
+    except Exception as e:
+        return json.dumps({"error": str(e), "totals": {}})
+
+def _cart_nutrition_result(user_id: str, summary: dict) -> str:
+    names = {item["sku"]: item["product_name"] for item in summary["items"]}
+    nutrition = nutrition_store.totals((item["sku"], item["quantity"]) for item in summary["items"])
+    result = {
+        "user_id": user_id,
+        "item_count": summary["item_count"],
+        "total_grams": round(nutrition["grams"]),
+        "totals": {key: round(value, 1) for key, value in nutrition["totals"].items()},
+        "items": [
+            {"sku": line["sku"], "product_name": names[line["sku"]], "grams": round(line["grams"]),
+             **{key: round(line[key], 1) for key in AMOUNTS if line[key] is not None}}
+            for line in nutrition["lines"]
+        ],
+        # Packs sold by count (eggs, coconut) have no weight to scale by
+        "not_counted": [names[sku] for sku in nutrition["unweighted"] + nutrition["unknown"]],
+        # Products the catalog has no data for, per nutrient; the totals leave them out
+        "missing_data": {names[sku]: keys for sku, keys in nutrition["missing"].items()}
+    }
+    return tool_result("get_cart_nutrition", result)
+
+# Tools that only read the product cache run inline on the event loop when awaited
+for catalog_only_tool in (check_ingredient_availability, check_ingredients_availability,
+                          get_product_details_for_comparison, search_alternatives, get_nutrition_comparison,
+                          find_best_nutrition_options):
+    catalog_tool(catalog_only_tool)
 
 # Create the tool list for LangGraph
 tools = [
     extract_recipe_ingredients,
     create_cart_session,
     check_ingredient_availability,
+    check_ingredients_availability,
     get_product_details_for_comparison,
     add_to_cart,
     get_user_cart,
@@ -433,20 +688,30 @@ tools = [
     search_alternatives,
     checkout_cart,
     get_nutrition_comparison,
-    clear_expired_sessions
+    find_best_nutrition_options,
+    get_cart_nutrition
 ]
 
 
-llm = ChatGroq(
-    model="llama-3.3-70b-versatile",
-    temperature=0,
-    max_tokens=None,
-    timeout=30,
-    max_retries=2,
-)
-
-# Bind tools to LLM
-llm_with_tools = llm.bind_tools(tools)
+# Agent LLM bound to the tools; created on first use (assign a fake chat model here to run offline)
+llm = None
+llm_with_tools = None
+
+def agent_llm():
+    """The tool-calling agent LLM, created and bound to the tools on first use"""
+    global llm, llm_with_tools
+    if llm_with_tools is None:
+        from langchain_groq import ChatGroq
+        llm = ChatGroq(
+            model="llama-3.3-70b-versatile",
+            temperature=0,
+            max_tokens=None,
+            timeout=30,
+            max_retries=2,
+        )
+        # Bind tools to LLM
+        llm_with_tools = llm.bind_tools(tools)
+    return llm_with_tools
 
 SYSTEM_PROMPT = """You are a helpful and highly conversational shopping assistant. Your primary goal is to guide a user through adding ingredients for a recipe to their cart, one step at a time. You MUST be conversational.
 
@@ -462,7 +727,9 @@ When displaying prices, always use the Indian Rupee symbol (₹) instead of doll
 **Rule 2: Finding Ingredient Options**
 - When the user confirms, proceed with the first ingredient. Use the `check_ingredient_availability` tool for that ONE ingredient.
 - **CRITICAL:** After the tool returns the available products, you MUST stop and present these options to the user. DO NOT move on to the next ingredient.
-- Your response should be a clear, numbered list of choices with prices in ₹. Ask the user to pick one.
+- Your response should be a clear, numbered list of choices with prices in ₹. Number each choice with its `option` value from the tool result and keep that order; if you leave a choice out, do not renumber the others. Ask the user to pick one.
+- If the user wants to see options for several ingredients at once (or asks which ingredients are available), use `check_ingredients_availability` with the whole list in ONE call instead of calling `check_ingredient_availability` repeatedly.
+- For nutrition questions, use `get_cart_nutrition` for the totals of the cart and `find_best_nutrition_options` to pick the lowest-sugar (or other nutrient) product for each ingredient, instead of comparing products one by one.
 
 **Rule 3: Adding to Cart**
 - When the user makes a choice, use the `add_to_cart` tool with the correct SKU and session_id.
@@ -479,30 +746,59 @@ When displaying prices, always use the Indian Rupee symbol (₹) instead of doll
 - NEVER call get_user_cart after checkout - the cart will be empty because items are marked as purchased.
 """
 
-def cartbot(state: State):
-    """Main chatbot that handles the conversation"""
-    messages = state["messages"]
-
-    # Add system message if not already present
-    if not messages or not isinstance(messages[0], SystemMessage):
-        messages = [SystemMessage(content=SYSTEM_PROMPT)] + messages
+# Keeps the prompt within a token budget as the shopping session grows
+context_window = ContextWindow(
+    token_budget=int(os.getenv("PROMPT_TOKEN_BUDGET", "6000")),
+    max_turns=int(os.getenv("PROMPT_MAX_TURNS", "6")),
+    max_tool_chars=int(os.getenv("PROMPT_MAX_TOOL_CHARS", "800"))
+)
 
+def _prompt_messages(state: State) -> list:
+    """Build the bounded message list sent to the LLM for the current state"""
     # Add user_id and session_id to the context
-    context_info = []
+    context_info = {}
     if state.get("user_id"):
-        context_info.append(f"user_id={state['user_id']}")
+        context_info["user_id"] = state["user_id"]
     if state.get("session_id"):
-        context_info.append(f"session_id={state['session_id']}")
+        context_info["session_id"] = state["session_id"]
 
-    if context_info:
-        context = f"\n\nCurrent context: {', '.join(context_info)}"
-        messages.append(SystemMessage(content=context))
+    return context_window.build(SYSTEM_PROMPT, state["messages"], context_info)
 
-    # Invoke the LLM with tools
-    response = llm_with_tools.invoke(messages)
+def cartbot(state: State):
+    """Main chatbot that handles the conversation"""
+    messages = _prompt_messages(state)
+    started = time.perf_counter()
+    response = agent_llm().invoke(messages)
+    observe_llm_call("agent", time.perf_counter() - started, response)
+    return {"messages": [response]}
 
+async def acartbot(state: State):
+    """Async variant of cartbot, used when the graph runs via ainvoke/astream"""
+    messages = _prompt_messages(state)
+    started = time.perf_counter()
+    response = await agent_llm().ainvoke(messages)
+    observe_llm_call("agent", time.perf_counter() - started, response)
     return {"messages": [response]}
 
+# Answers structured turns ("2", "yes", "checkout", "remove paneer") with a direct tool call
+intent_router = IntentRouter()
+INTENT_ROUTER_ENABLED = os.getenv("INTENT_ROUTER_ENABLED", "true").lower() in ("1", "true", "yes")
+
+def route_intent(state: State):
+    """Dispatch a tool directly for recognizable intents; the agent LLM then only words the reply"""
+    if not INTENT_ROUTER_ENABLED:
+        return {}
+    decision = intent_router.route(state["messages"], state.get("user_id"), state.get("session_id"))
+    observe_route(decision.response_metadata["router"] if decision else "llm")
+    return {"messages": [decision]} if decision else {}
+
+def after_router(state: State) -> Literal["tools", "agent"]:
+    """Routed turns go straight to the tools; everything else goes to the LLM"""
+    last_message = state["messages"][-1]
+    if isinstance(last_message, AIMessage) and last_message.tool_calls:
+        return "tools"
+    return "agent"
+
 # routing function
 def should_continue(state: State) -> Literal["tools", "end"]:
     """Determine if the conversation should continue based on the last message"""
@@ -522,12 +818,14 @@ def build_graph():
     graph_builder = StateGraph(State)
 
     # Add nodes
-    graph_builder.add_node("agent", cartbot)
+    graph_builder.add_node("router", route_intent)
+    graph_builder.add_node("agent", RunnableLambda(cartbot, afunc=acartbot, name="agent"))
     tool_node = ToolNode(tools=tools)
     graph_builder.add_node("tools", tool_node)
 
-    # Set entry point
-    graph_builder.set_entry_point("agent")
+    # Every turn enters through the intent router
+    graph_builder.set_entry_point("router")
+    graph_builder.add_conditional_edges("router", after_router, {"tools": "tools", "agent": "agent"})
 
     # Simplified routing - no self-loops
     graph_builder.add_conditional_edges(
@@ -592,75 +890,354 @@ def chat_with_recipe_bot(user_id: str, thread_id: str = None):
     
     return thread_id
 
-graph = build_graph()
-graph = graph.compile()
+# Conversation state is checkpointed per thread_id instead of being held by the endpoint;
+# both are created on first use or by warm_up()
+checkpointer = None
+graph = None
+
+def get_graph():
+    """The compiled chat graph and its checkpointer, built on first use"""
+    global checkpointer, graph
+    if graph is None:
+        checkpointer = create_checkpointer()
+        graph = build_graph().compile(checkpointer=checkpointer)
+    return graph
+
+# Maximum number of graph runs executing at once per process; further turns queue
+MAX_CONCURRENT_GRAPH_RUNS = int(os.getenv("MAX_CONCURRENT_GRAPH_RUNS", "16"))
+
+class GraphRunLimiter:
+    """Bounds the number of concurrent graph runs and tracks the queue depth"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._semaphore = asyncio.Semaphore(limit)
+        self.running = 0
+        self.waiting = 0
+        self.completed = 0
+
+    @asynccontextmanager
+    async def slot(self):
+        """Wait for a free slot, then hold it for the duration of the block"""
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.running += 1
+        try:
+            yield
+        finally:
+            self.running -= 1
+            self.completed += 1
+            self._semaphore.release()
+
+    async def ainvoke(self, graph_input: dict, config: Optional[dict] = None) -> dict:
+        """Run one chat turn through the graph without blocking the event loop"""
+        async with self.slot():
+            with track_turn("invoke") as step_counter:
+                config = {**(config or {}), "callbacks": [step_counter]}
+                return await get_graph().ainvoke(graph_input, config=config)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "limit": self.limit,
+            "running": self.running,
+            "queue_depth": self.waiting,
+            "completed": self.completed
+        }
+
+graph_runs = GraphRunLimiter(MAX_CONCURRENT_GRAPH_RUNS)
 
-app = FastAPI(title="Simple Recipe Chatbot API")
+api = APIRouter()
 
-conversation_history = []
+# Serialized /api/search pages keyed by catalog fingerprint and query
+search_cache = ResponseCache(
+    max_entries=int(os.getenv("SEARCH_CACHE_ENTRIES", "1024")),
+    ttl_seconds=float(os.getenv("SEARCH_CACHE_TTL_SECONDS", "30"))
+)
+SEARCH_MAX_LIMIT = int(os.getenv("SEARCH_MAX_LIMIT", "50"))
+
+@api.get("/api/search")
+async def search_products(request: Request, q: str = "", category: Optional[str] = None, sort: str = "name",
+                          limit: int = 10, cursor: Optional[str] = None):
+    """Search products by name (and/or browse a category) a page at a time; pass next_cursor back for the next page"""
+    if sort not in SORT_ORDERS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of {sorted(SORT_ORDERS)}")
+    if not q.strip() and not category:
+        return {"products": [], "count": 0, "next_cursor": None}
+    limit = max(1, min(limit, SEARCH_MAX_LIMIT))
 
-@app.get("/api/search")
-async def search_products(q: str = ""):
-    """Search for products in the database"""
-    if not q.strip():
-        return {"products": [], "count": 0}
-    
     try:
-        response = supabase.table('products').select('*').eq('is_active', True).ilike('item_name', f'%{q}%').limit(10).execute()
-        
-        products = []
-        for item in response.data:
-            products.append({
-                "id": item.get("id"),
-                "sku": item.get("sku"),
-                "name": item.get("item_name"),
-                "brand": item.get("brand"),
-                "price": float(item.get("price", 0)),
-                "category": item.get("category"),
-                "in_stock": item.get("stock_quantity", 0) > 0,
-                "stock_quantity": item.get("stock_quantity", 0)
-            })
-        
-        return {"products": products, "count": len(products)}
+        await product_cache.aensure_fresh()
+        key = (product_cache.fingerprint, q.strip().lower(), category, sort, limit, cursor)
+        cached = search_cache.get(key)
+        if cached is None:
+            cached = search_cache.put(key, _search_page(q.strip(), category, sort, limit, cursor))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/")
+    etag, content = cached
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={int(search_cache.ttl_seconds)}"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        search_cache.not_modified += 1
+        return Response(status_code=304, headers=headers)
+    return Response(content=content, media_type="application/json", headers=headers)
+
+def _search_page(q: str, category: Optional[str], sort: str, limit: int, cursor: Optional[str]) -> dict:
+    after = decode_cursor(cursor) if cursor else None
+    try:
+        rows, next_key = product_cache.search_page(q, category=category, sort=sort, after=after, limit=limit)
+    except TypeError:
+        # A cursor issued for a different sort order
+        raise ValueError("Invalid cursor")
+    products = []
+    for item in rows:
+        products.append({
+            "id": item.get("id"),
+            "sku": item.get("sku"),
+            "name": item.get("item_name"),
+            "brand": item.get("brand"),
+            "price": float(item.get("price", 0)),
+            "category": item.get("category"),
+            "in_stock": item.get("stock_quantity", 0) > 0,
+            "stock_quantity": item.get("stock_quantity", 0)
+        })
+    return {
+        "products": products, "count": len(products), "sort": sort,
+        "next_cursor": encode_cursor(next_key) if next_key else None
+    }
+
+# Type-ahead index over the cached catalog, updated incrementally on every catalog reload
+suggest_index = PrefixIndex()
+product_cache.on_reload(suggest_index.sync)
+_background_refreshes = set()
+
+@api.get("/api/suggest")
+async def suggest(q: str = "", limit: int = 8, kind: Optional[str] = None):
+    """Ranked completions for product names, brands and categories; answered from memory only"""
+    if kind and kind not in KINDS:
+        raise HTTPException(status_code=400, detail=f"kind must be one of {list(KINDS)}")
+    if product_cache.version == 0:
+        await product_cache.aensure_fresh()
+    elif not product_cache.is_fresh():
+        # Reload in the background; this keystroke is answered from the current index
+        task = asyncio.create_task(product_cache.aensure_fresh())
+        _background_refreshes.add(task)
+        task.add_done_callback(_background_refreshes.discard)
+
+    started = time.perf_counter()
+    suggestions = suggest_index.suggest(q, limit=max(1, min(limit, 20)), kinds=[kind] if kind else None)
+    return {"query": q, "suggestions": suggestions, "took_us": round((time.perf_counter() - started) * 1e6, 1)}
+
+@api.get("/metrics")
+async def metrics():
+    """Tool, database, LLM and per-turn metrics in the Prometheus text format"""
+    content, content_type = render_latest()
+    return Response(content=content, media_type=content_type)
+
+@api.get("/")
 async def root():
     return {"message": "Recipe Chatbot API is running"}
 
-@app.websocket("/ws")
+@api.get("/api/status")
+async def status():
+    """Report graph run concurrency, queue depth and session store usage"""
+    result = {"graph_runs": graph_runs.stats()}
+    if hasattr(checkpointer, "stats"):
+        result["sessions"] = checkpointer.stats()
+    result["product_cache"] = product_cache.stats()
+    result["recipe_cache"] = recipe_cache.stats()
+    result["search_cache"] = search_cache.stats()
+    result["suggest_index"] = suggest_index.stats()
+    result["semantic_index"] = semantic_index.stats()
+    result["nutrition_store"] = nutrition_store.stats()
+    result["session_reaper"] = session_reaper.stats()
+    result["prompt_context"] = context_window.stats()
+    result["intent_router"] = intent_router.stats()
+    result["cart_store"] = cart_store.stats()
+    result["startup"] = startup_timings
+    return result
+
+# Progress messages pushed to streaming clients when a tool starts
+TOOL_PROGRESS_MESSAGES = {
+    "extract_recipe_ingredients": "Working out the ingredients…",
+    "create_cart_session": "Starting your cart…",
+    "check_ingredient_availability": "Checking availability of {ingredient_name}…",
+    "check_ingredients_availability": "Checking availability of your ingredients…",
+    "get_product_details_for_comparison": "Comparing products…",
+    "add_to_cart": "Adding {sku} to your cart…",
+    "get_user_cart": "Fetching your cart…",
+    "remove_from_cart": "Removing {sku} from your cart…",
+    "update_cart_quantity": "Updating {sku} quantity…",
+    "search_alternatives": "Looking for alternatives to {ingredient_name}…",
+    "checkout_cart": "Placing your order…",
+    "get_nutrition_comparison": "Comparing nutrition…",
+    "find_best_nutrition_options": "Finding the best option for each ingredient…",
+    "get_cart_nutrition": "Adding up your cart's nutrition…"
+}
+
+def describe_tool_call(name: str, args: Any) -> str:
+    """Render a short human-readable progress line for a tool call"""
+    template = TOOL_PROGRESS_MESSAGES.get(name, f"Running {name}…")
+    args = args if isinstance(args, dict) else {}
+    try:
+        return template.format(**args)
+    except (KeyError, IndexError):
+        return template.split(" {")[0] + "…"
+
+async def stream_turn(websocket: WebSocket, graph_input: dict, config: dict) -> None:
+    """Run one chat turn and push LLM tokens and tool progress as they happen"""
+    ai_response = ""
+    async with graph_runs.slot():
+        with track_turn("stream") as step_counter:
+            config = {**config, "callbacks": [step_counter]}
+            async for event in get_graph().astream_events(graph_input, config=config, version="v2"):
+                kind = event["event"]
+                node = event.get("metadata", {}).get("langgraph_node")
+
+                # Only the agent's tokens are user-facing; the ingredient LLM runs inside a tool
+                if kind == "on_chat_model_stream" and node == "agent":
+                    content = event["data"]["chunk"].content
+                    if content:
+                        await websocket.send_json({"type": "token", "content": content})
+                elif kind == "on_tool_start":
+                    await websocket.send_json({
+                        "type": "tool",
+                        "status": "start",
+                        "name": event["name"],
+                        "message": describe_tool_call(event["name"], event["data"].get("input"))
+                    })
+                elif kind == "on_tool_end":
+                    await websocket.send_json({"type": "tool", "status": "end", "name": event["name"]})
+                elif kind == "on_chain_end" and not event.get("parent_ids"):
+                    ai_response = event["data"]["output"]["messages"][-1].content
+
+    await websocket.send_json({"type": "done", "response": ai_response})
+
+# Who a /ws connection acts for: "supabase" takes the user from the Supabase access token
+# (?access_token=...); "none" trusts ?user_id, for local and offline runs only
+WS_AUTH = os.getenv("WS_AUTH", "supabase" if os.getenv("DATA_BACKEND", "supabase") == "supabase" else "none")
+
+async def connection_user(websocket: WebSocket) -> Optional[str]:
+    """User id of a /ws connection, or None if it cannot be authenticated"""
+    if WS_AUTH == "none":
+        return websocket.query_params.get("user_id") or f"guest_{uuid.uuid4().hex[:12]}"
+    token = websocket.query_params.get("access_token")
+    return await repository.aauthenticate(token) if token else None
+
+@api.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
-    """A single endpoint for the chatbot."""
+    """A single endpoint for the chatbot.
+
+    Clients may send {"message": ..., "stream": true} (or connect with ?stream=1) to
+    receive token and tool-progress frames before the final {"response": ...} frame.
+    """
+    user_id = await connection_user(websocket)
+    if user_id is None:
+        await websocket.close(code=1008, reason="Not authenticated")
+        return
+    # Each connection gets its own conversation thread unless the client resumes one of its own
+    resumed = "thread_id" in websocket.query_params
+    thread_id = websocket.query_params.get("thread_id") or f"{user_id}:{uuid.uuid4().hex}"
+    if not thread_id.startswith(f"{user_id}:"):
+        await websocket.close(code=1008, reason="Thread belongs to another user")
+        return
     await websocket.accept()
-    global conversation_history
-    conversation_history = []
+
+    config = {"configurable": {"thread_id": thread_id}, "recursion_limit": 50}
+    stream_default = websocket.query_params.get("stream") in ("1", "true")
 
     try:
         while True:
             data = await websocket.receive_text()
-            user_input = json.loads(data).get("message")
+            payload = json.loads(data)
+            user_input = payload.get("message")
 
             if not user_input:
                 continue
 
-            conversation_history.append(HumanMessage(content=user_input))
-
             graph_input = {
-                "messages": conversation_history,
-                "user_id": 'user123'
+                "messages": [HumanMessage(content=user_input)],
+                "user_id": user_id
             }
 
-            final_state = graph.invoke(graph_input)
+            if payload.get("stream", stream_default):
+                await stream_turn(websocket, graph_input, config)
+                continue
+
+            final_state = await graph_runs.ainvoke(graph_input, config=config)
             ai_response = final_state["messages"][-1].content
-            conversation_history = final_state["messages"]
 
             await websocket.send_json({"response": ai_response})
 
     except WebSocketDisconnect:
-        print("Client disconnected. Chat history has been reset.")
+        print(f"Client disconnected from thread {thread_id}.")
     except Exception as e:
         print(f"An error occurred: {e}")
 
         await websocket.send_json({"response": "Sorry, an error occurred. Please try again."})
-
+    finally:
+        # Threads that cannot be resumed are dead once the socket closes
+        if not resumed and checkpointer is not None:
+            await checkpointer.adelete_thread(thread_id)
+
+# Startup cost of this worker: module import, then the lifespan warm-up
+startup_timings: Dict[str, Any] = {"import_seconds": round(time.perf_counter() - _import_started, 3)}
+
+async def warm_up() -> Dict[str, Any]:
+    """Create the LLM clients, compile the graph and load the product catalog before serving traffic"""
+    started = time.perf_counter()
+    steps = {}
+    for name, step in (("llm_clients", lambda: (ingredient_llm(), agent_llm())), ("graph", get_graph)):
+        step_started = time.perf_counter()
+        step()
+        steps[name] = round(time.perf_counter() - step_started, 3)
+
+    step_started = time.perf_counter()
+    try:
+        await product_cache.aensure_fresh()
+        steps["product_catalog"] = round(time.perf_counter() - step_started, 3)
+    except Exception as e:
+        # Not fatal: the first request retries the load
+        print(f"Warm-up could not load the product catalog: {e}")
+
+    startup_timings["warm_up_steps"] = steps
+    startup_timings["warm_up_seconds"] = round(time.perf_counter() - started, 3)
+    print(f"Imported in {startup_timings['import_seconds']}s, warmed up in {startup_timings['warm_up_seconds']}s {steps}")
+    return startup_timings
+
+def create_app(warm: Optional[bool] = None) -> FastAPI:
+    """Application factory; clients, graph and catalog are warmed up in the lifespan unless WARM_UP_ON_STARTUP=false"""
+    if warm is None:
+        warm = os.getenv("WARM_UP_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        if warm:
+            await warm_up()
+        flusher = asyncio.create_task(cart_store.run_flusher())
+        reaper = asyncio.create_task(session_reaper.run()) if SESSION_REAPER_ENABLED else None
+        yield
+        background = [task for task in (flusher, reaper) if task is not None]
+        for task in background:
+            task.cancel()
+        # Let a flush interrupted by the cancel requeue its batch before the final flush
+        await asyncio.gather(*background, return_exceptions=True)
+        # Persist every acknowledged cart edit before the process exits
+        if not await cart_store.aflush():
+            print("Some cart changes could not be saved at shutdown")
+        await repository.aclose()
+
+    application = FastAPI(title="Simple Recipe Chatbot API", lifespan=lifespan)
+    application.include_router(api)
+    return application
+
+# Module-level app for `uvicorn agent:app`; `uvicorn agent:create_app --factory` also works
+app = create_app()
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("PORT", "8000")))
@@ -0,0 +1,245 @@
+"""Offline benchmark suite for the agent tools.
+
+Runs every tool in `agent.tools` against the local SQLite repository and a
+stubbed ingredient LLM, then reports latency percentiles, repository round
+trips, allocations and result size (bytes and estimated prompt tokens) per call.
+Compare TOOL_RESULT_MODE=full with the default compact mode to see payload savings.
+
+    python benchmark.py                      # run and compare with bench_baseline.json
+    python benchmark.py --save-baseline      # record the current results as the baseline
+    python benchmark.py --no-baseline        # only report, e.g. on a machine without a baseline
+    python benchmark.py --only checkout_cart --iterations 500
+
+The process exits with status 1 when a tool is slower than the baseline by more
+than --tolerance, needs more round trips than it did, or returns a result more
+than --tolerance times larger, and with status 2 when there is no baseline to
+compare with (unless --no-baseline is given). Timings depend on the machine, so
+record the baseline on the machine (or CI runner) that runs the comparison.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+from typing import Callable, Dict, List
+
+# Must be configured before the agent module is imported
+os.environ["DATA_BACKEND"] = "sqlite"
+os.environ["SQLITE_DB_PATH"] = ":memory:"
+os.environ["RECIPE_CACHE_PATH"] = ""
+
+import agent
+from fakes import FakeIngredientModel, RECIPE_INGREDIENTS
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+
+# Differences below this are timer noise, whatever the ratio
+MIN_REGRESSION_US = 50.0
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    index = min(len(sorted_values) - 1, max(0, round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class Fixtures:
+    """Creates users, sessions and carts directly through the repository"""
+
+    def __init__(self):
+        self.skus = [product["sku"] for product in agent.repository.list_products() if product.get("is_active", True)]
+        self._users = 0
+
+    def new_user(self, prefix: str) -> str:
+        self._users += 1
+        return f"bench_{prefix}_{self._users}"
+
+    def session(self, user_id: str) -> str:
+        return json.loads(agent.create_cart_session.invoke({"user_id": user_id}))["session_id"]
+
+    def cart(self, prefix: str, lines: int) -> str:
+        user_id = self.new_user(prefix)
+        session_id = self.session(user_id)
+        for sku in self.skus[:lines]:
+            agent.repository.add_cart_item(user_id, session_id, sku, 1, sku, "Bench", 10.0)
+        return user_id
+
+
+class Case:
+    """One benchmarked tool call; `make_args(i)` runs untimed before each call"""
+
+    def __init__(self, name: str, tool, make_args: Callable[[int], dict]):
+        self.name = name
+        self.tool = tool
+        self.make_args = make_args
+
+
+def build_cases(fixtures: Fixtures) -> List[Case]:
+    ingredients = [ingredient for names in RECIPE_INGREDIENTS.values() for ingredient in names]
+    compare_skus = fixtures.skus[:3]
+
+    add_user = fixtures.new_user("add")
+    add_session = fixtures.session(add_user)
+    small_cart_user = fixtures.cart("cart", 10)
+
+    def remove_args(i: int) -> dict:
+        # Through the tool, so the line is in the in-memory cart the removal reads
+        agent.add_to_cart.invoke({"user_id": small_cart_user, "sku": fixtures.skus[20], "session_id": add_session})
+        return {"user_id": small_cart_user, "sku": fixtures.skus[20]}
+
+    return [
+        Case("extract_recipe_ingredients[miss]", agent.extract_recipe_ingredients,
+             lambda i: {"recipe_request": f"I want to make dish number {i}"}),
+        Case("extract_recipe_ingredients[hit]", agent.extract_recipe_ingredients,
+             lambda i: {"recipe_request": "I want to make biryani"}),
+        Case("create_cart_session", agent.create_cart_session,
+             lambda i: {"user_id": fixtures.new_user("session")}),
+        Case("check_ingredient_availability", agent.check_ingredient_availability,
+             lambda i: {"ingredient_name": ingredients[i % len(ingredients)]}),
+        Case("check_ingredients_availability[10]", agent.check_ingredients_availability,
+             lambda i: {"ingredient_names": RECIPE_INGREDIENTS["biryani"]}),
+        Case("get_product_details_for_comparison", agent.get_product_details_for_comparison,
+             lambda i: {"skus": compare_skus}),
+        Case("add_to_cart", agent.add_to_cart,
+             lambda i: {"user_id": add_user, "sku": fixtures.skus[i % 20], "quantity": 1, "session_id": add_session}),
+        Case("get_user_cart[10]", agent.get_user_cart,
+             lambda i: {"user_id": small_cart_user}),
+        Case("update_cart_quantity", agent.update_cart_quantity,
+             lambda i: {"user_id": small_cart_user, "sku": fixtures.skus[i % 10], "new_quantity": i % 5 + 1}),
+        Case("remove_from_cart", agent.remove_from_cart, remove_args),
+        Case("search_alternatives", agent.search_alternatives,
+             lambda i: {"ingredient_name": ingredients[i % len(ingredients)], "exclude_skus": compare_skus}),
+        Case("get_nutrition_comparison", agent.get_nutrition_comparison,
+             lambda i: {"skus": compare_skus}),
+        Case("find_best_nutrition_options[10]", agent.find_best_nutrition_options,
+             lambda i: {"ingredient_names": RECIPE_INGREDIENTS["biryani"], "nutrient": "sugar"}),
+        Case("get_cart_nutrition[10]", agent.get_cart_nutrition,
+             lambda i: {"user_id": small_cart_user}),
+        Case("checkout_cart[1]", agent.checkout_cart,
+             lambda i: {"user_id": fixtures.cart("checkout1", 1)}),
+        Case("checkout_cart[10]", agent.checkout_cart,
+             lambda i: {"user_id": fixtures.cart("checkout10", 10)}),
+        Case("checkout_cart[100]", agent.checkout_cart,
+             lambda i: {"user_id": fixtures.cart("checkout100", 100)}),
+    ]
+
+
+def run_case(case: Case, iterations: int, warmup: int, alloc_iterations: int) -> Dict[str, float]:
+    for i in range(warmup):
+        case.tool.invoke(case.make_args(i))
+
+    timings, round_trips, result_bytes = [], 0, 0
+    for i in range(iterations):
+        args = case.make_args(warmup + i)
+        before = agent.repository.round_trips
+        started = time.perf_counter()
+        result = case.tool.invoke(args)
+        timings.append((time.perf_counter() - started) * 1e6)
+        round_trips += agent.repository.round_trips - before
+        result_bytes += len(result.encode("utf-8"))
+
+    # Allocations are measured in a separate pass because tracing distorts timings
+    allocated = 0
+    tracemalloc.start()
+    for i in range(alloc_iterations):
+        args = case.make_args(warmup + iterations + i)
+        tracemalloc.reset_peak()
+        baseline, _ = tracemalloc.get_traced_memory()
+        case.tool.invoke(args)
+        allocated += tracemalloc.get_traced_memory()[1] - baseline
+    tracemalloc.stop()
+
+    timings.sort()
+    return {
+        "iterations": iterations,
+        "p50_us": round(percentile(timings, 0.50), 1),
+        "p95_us": round(percentile(timings, 0.95), 1),
+        "p99_us": round(percentile(timings, 0.99), 1),
+        "mean_us": round(sum(timings) / len(timings), 1),
+        "round_trips": round(round_trips / iterations, 2),
+        "alloc_kib": round(allocated / max(1, alloc_iterations) / 1024, 1),
+        "result_bytes": round(result_bytes / iterations),
+        "result_tokens": round(result_bytes / iterations / 4)
+    }
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> List[str]:
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        if current["round_trips"] > previous["round_trips"]:
+            regressions.append(f"{name}: round trips {previous['round_trips']} -> {current['round_trips']}")
+        if current["result_tokens"] > previous.get("result_tokens", current["result_tokens"]) * tolerance:
+            regressions.append(f"{name}: result tokens {previous['result_tokens']} -> {current['result_tokens']}")
+        for key in ("p50_us", "p95_us"):
+            if current[key] > previous[key] * tolerance and current[key] - previous[key] > MIN_REGRESSION_US:
+                regressions.append(f"{name}: {key} {previous[key]} -> {current[key]} (> {tolerance}x)")
+    return regressions
+
+
+def print_table(results: Dict[str, dict], baseline: Dict[str, dict]) -> None:
+    header = (f"{'tool':40} {'p50 us':>9} {'p95 us':>9} {'p99 us':>9} {'trips':>6} {'KiB':>7} "
+              f"{'out B':>7} {'tokens':>7} {'base p50':>9} {'base tok':>9}")
+    print(header)
+    print("-" * len(header))
+    for name, result in results.items():
+        base = baseline.get(name, {}).get("p50_us", "-")
+        base_tokens = baseline.get(name, {}).get("result_tokens", "-")
+        print(f"{name:40} {result['p50_us']:>9} {result['p95_us']:>9} {result['p99_us']:>9} "
+              f"{result['round_trips']:>6} {result['alloc_kib']:>7} {result['result_bytes']:>7} "
+              f"{result['result_tokens']:>7} {base:>9} {base_tokens:>9}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--alloc-iterations", type=int, default=20)
+    parser.add_argument("--only", help="run only cases whose name starts with this prefix")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--no-baseline", action="store_true", help="report without comparing, even if a baseline exists")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="allowed slowdown factor before failing")
+    parser.add_argument("--json", help="also write results to this file")
+    args = parser.parse_args(argv)
+    if not (args.save_baseline or args.no_baseline or os.path.exists(args.baseline)):
+        print(f"No baseline at {args.baseline}: record one with --save-baseline, or pass --no-baseline to only report")
+        return 2
+
+    agent.llm_ing = FakeIngredientModel()
+    cases = build_cases(Fixtures())
+    if args.only:
+        cases = [case for case in cases if case.name.startswith(args.only)]
+
+    results = {case.name: run_case(case, args.iterations, args.warmup, args.alloc_iterations) for case in cases}
+
+    baseline = {}
+    if not (args.save_baseline or args.no_baseline):
+        with open(args.baseline) as handle:
+            baseline = json.load(handle)
+
+    print_table(results, baseline)
+
+    if args.json:
+        with open(args.json, "w") as handle:
+            json.dump(results, handle, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as handle:
+            json.dump(results, handle, indent=2, sort_keys=True)
+        print(f"\nBaseline saved to {args.baseline}")
+        return 0
+
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print("\nREGRESSIONS:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
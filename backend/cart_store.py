@@ -0,0 +1,548 @@
+import time
+import uuid
+import asyncio
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+# Fields of a cart line sent to apply_cart_changes
+CHANGE_FIELDS = ("id", "session_id", "sku", "status", "quantity", "product_name", "brand", "unit_price", "notes")
+
+# Columns of each line in a cart summary (same projection as get_cart_summary in supabase.sql)
+SUMMARY_FIELDS = ("sku", "product_name", "brand", "quantity", "unit_price", "total_price")
+
+
+def _timestamp(value: Optional[str]) -> Optional[float]:
+    """Epoch seconds of an ISO timestamp (naive ones are local time); None if missing or unparsable"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+
+class _Cart:
+    __slots__ = ("lines", "pending", "flushing", "in_flight", "stored", "reload", "last_used", "total_items",
+                 "total_price", "brands")
+
+    def __init__(self, rows: List[dict]):
+        # Active lines keyed by (session_id, sku), shaped like shopping_carts rows
+        self.lines: Dict[Tuple[str, str], dict] = {}
+        # Latest state of every line changed since the last flush, same key
+        self.pending: Dict[Tuple[str, str], dict] = {}
+        self.flushing = False
+        # The batch being written while flushing, and ids of lines known to be in the database
+        self.in_flight: Dict[Tuple[str, str], dict] = {}
+        self.stored = {row["id"] for row in rows}
+        # Set when the database refused some changes: memory no longer matches it
+        self.reload = False
+        self.last_used = time.monotonic()
+        # Running totals over `lines`, kept up to date by put() and drop()
+        self.total_items = 0
+        self.total_price = 0.0
+        self.brands: Dict[str, int] = {}
+        for row in rows:
+            self.put((row["session_id"], row["sku"]), row)
+
+    def _account(self, line: dict, sign: int) -> None:
+        self.total_items += sign * line["quantity"]
+        self.total_price += sign * line["quantity"] * float(line["unit_price"])
+        brand = line.get("brand") or "Unknown"
+        self.brands[brand] = self.brands.get(brand, 0) + sign
+        if not self.brands[brand]:
+            del self.brands[brand]
+
+    def put(self, key: Tuple[str, str], line: dict) -> None:
+        """Insert or replace a line; change quantities of stored lines through requantify()"""
+        old = self.lines.get(key)
+        if old is not None:
+            self._account(old, -1)
+        self.lines[key] = line
+        self._account(line, 1)
+
+    def requantify(self, line: dict, quantity: int) -> None:
+        self._account(line, -1)
+        line["quantity"] = quantity
+        line["total_price"] = round(quantity * float(line["unit_price"]), 2)
+        self._account(line, 1)
+
+    def drop(self, key: Tuple[str, str]) -> dict:
+        line = self.lines.pop(key)
+        self._account(line, -1)
+        return line
+
+    def clear(self) -> None:
+        self.lines.clear()
+        self.total_items, self.total_price, self.brands = 0, 0.0, {}
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "item_count": len(self.lines),
+            "total_items": self.total_items,
+            "total_price": round(self.total_price, 2),
+            "brands_summary": dict(self.brands),
+            "items": [{field: line.get(field) for field in SUMMARY_FIELDS} for line in self.lines.values()]
+        }
+
+
+class CartStore:
+    """Write-behind, in-memory copy of each user's active cart.
+
+    A user's active lines are read from shopping_carts once, on first access.
+    After that, reads are served from memory and mutations apply locally. Each
+    changed line's latest state is queued. Queued states go to the database
+    with one apply_cart_changes call per user, which is a single transaction.
+
+    Durability is set by `durability` (CART_DURABILITY):
+
+    - "sync": every mutation is flushed before the tool returns, so an
+      acknowledged cart edit is never lost.
+    - "batched": queues are flushed by `run_flusher()` every `flush_interval`
+      seconds, as soon as a user has `max_pending` queued lines, before
+      checkout, and at shutdown.
+
+    Crash recovery: a crash other than a clean shutdown loses at most the last
+    `flush_interval` seconds of acknowledged edits. Because every flush is one
+    transaction, the database is never half-applied. On restart, carts are
+    re-read as of the last successful flush. A failed or cancelled flush keeps
+    its changes queued and retries them on the next flush; checkout is refused
+    until they are stored. A batch the database rejects outright (a constraint
+    violation) is not retried: its changes are written one at a time, the ones
+    refused are dropped and counted in `rejected_changes`, and the cart is
+    re-read from the database once nothing is queued.
+
+    The first line added to a session this process has not seen, or to one
+    past its expiry, is written through immediately, so the database checks
+    that the session exists and is still open before the user is told the
+    item was added. Carts are per process: route a user
+    to one worker (sticky sessions) or use "sync" mode when several workers
+    may serve the same cart. Writes that bypass the store are not seen until
+    the cart is evicted after `idle_seconds`.
+    """
+
+    def __init__(self, repository, durability: str = "batched", flush_interval: float = 2.0,
+                 max_pending: int = 20, idle_seconds: float = 1800, flush_wait: float = 10.0):
+        if durability not in ("sync", "batched"):
+            raise ValueError(f"Unknown cart durability mode: {durability}")
+        self._repository = repository
+        self.durability = durability
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.idle_seconds = idle_seconds
+        # Longest a flush waits for another flush of the same cart before giving up
+        self.flush_wait = flush_wait
+        self._carts: Dict[str, _Cart] = {}
+        # Sessions known to be open, with their expiry as a timestamp (None: no expiry)
+        self._sessions: Dict[str, Optional[float]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.loads = 0
+        self.flushes = 0
+        self.flushed_changes = 0
+        self.flush_failures = 0
+        self.stale_lines = 0
+        self.rejected_changes = 0
+
+    # sessions
+
+    def remember_session(self, session_id: str, expires_at: Optional[str] = None) -> None:
+        """Record a session known to be open, so adds to it can be queued until it expires"""
+        with self._lock:
+            self._sessions[session_id] = _timestamp(expires_at)
+
+    def _session_open(self, session_id: str) -> bool:
+        with self._lock:
+            if session_id not in self._sessions:
+                return False
+            expires = self._sessions[session_id]
+            return expires is None or expires > time.time()
+
+    # loading
+
+    def _loaded(self, user_id: str) -> Optional[_Cart]:
+        with self._lock:
+            cart = self._carts.get(user_id)
+            if cart is not None and cart.reload and not cart.pending and not cart.flushing:
+                # Some changes were refused; the database holds the cart as it really is
+                del self._carts[user_id]
+                cart = None
+            if cart is not None:
+                cart.last_used = time.monotonic()
+                self.hits += 1
+            return cart
+
+    def _install(self, user_id: str, rows: List[dict]) -> _Cart:
+        with self._lock:
+            # Another caller may have loaded the cart meanwhile; keep its (possibly newer) state
+            cart = self._carts.get(user_id)
+            if cart is None:
+                cart = self._carts[user_id] = _Cart(rows)
+                self.loads += 1
+            return cart
+
+    def _load(self, user_id: str) -> _Cart:
+        return self._loaded(user_id) or self._install(user_id, self._repository.get_cart(user_id, "active"))
+
+    async def _aload(self, user_id: str) -> _Cart:
+        return self._loaded(user_id) or self._install(user_id, await self._repository.aget_cart(user_id, "active"))
+
+    # local mutations
+
+    def _queue(self, cart: _Cart, key: Tuple[str, str], line: dict) -> None:
+        cart.pending[key] = {field: line.get(field) for field in CHANGE_FIELDS}
+
+    def _apply_add(self, cart: _Cart, user_id: str, session_id: str, sku: str, quantity: int,
+                   product_name: str, brand: str, unit_price: float, notes: str) -> dict:
+        now = datetime.now().isoformat()
+        with self._lock:
+            key = (session_id, sku)
+            line = cart.lines.get(key)
+            inserted = line is None
+            if inserted:
+                line = {
+                    "id": str(uuid.uuid4()), "user_id": user_id, "sku": sku, "product_name": product_name,
+                    "brand": brand, "quantity": 0, "unit_price": unit_price, "total_price": 0.0, "notes": notes or "",
+                    "added_at": now, "status": "active", "session_id": session_id, "order_id": None
+                }
+                cart.put(key, line)
+            cart.requantify(line, line["quantity"] + quantity)
+            line["updated_at"] = now
+            self._queue(cart, key, line)
+            return {"success": True, "inserted": inserted, "data": dict(line)}
+
+    def _active_line(self, cart: _Cart, sku: str) -> Optional[dict]:
+        with self._lock:
+            line = next((line for (_, line_sku), line in cart.lines.items() if line_sku == sku), None)
+            return dict(line) if line else None
+
+    def _apply_quantity(self, cart: _Cart, sku: str, quantity: int) -> Optional[dict]:
+        with self._lock:
+            key = next((key for key in cart.lines if key[1] == sku), None)
+            if key is None:
+                return None
+            line = cart.lines[key]
+            cart.requantify(line, quantity)
+            line["updated_at"] = datetime.now().isoformat()
+            self._queue(cart, key, line)
+            return dict(line)
+
+    def _apply_remove(self, cart: _Cart, sku: str) -> List[dict]:
+        removed = []
+        with self._lock:
+            for key in [key for key in cart.lines if key[1] == sku]:
+                line = cart.drop(key)
+                line.update(status="removed", updated_at=datetime.now().isoformat())
+                self._queue(cart, key, line)
+                removed.append(line)
+        return removed
+
+    # public API: sync and async twins
+
+    def summary(self, user_id: str) -> Dict[str, Any]:
+        """Running totals and projected lines of the user's active cart; same shape as Repository.cart_summary"""
+        cart = self._load(user_id)
+        with self._lock:
+            return cart.summary()
+
+    async def asummary(self, user_id: str) -> Dict[str, Any]:
+        cart = await self._aload(user_id)
+        with self._lock:
+            return cart.summary()
+
+    def get_line(self, user_id: str, sku: str) -> Optional[dict]:
+        return self._active_line(self._load(user_id), sku)
+
+    async def aget_line(self, user_id: str, sku: str) -> Optional[dict]:
+        return self._active_line(await self._aload(user_id), sku)
+
+    def add(self, user_id: str, session_id: str, sku: str, quantity: int,
+            product_name: str, brand: str, unit_price: float, notes: str = "") -> dict:
+        """Add-or-increment a line; same result shape as Repository.add_cart_item"""
+        if not self._session_open(session_id):
+            return self._add_through(user_id, self._repository.add_cart_item(
+                user_id, session_id, sku, quantity, product_name, brand, unit_price, notes))
+        result = self._apply_add(self._load(user_id), user_id, session_id, sku, quantity, product_name, brand, unit_price, notes)
+        self._flush_if_due(user_id)
+        return result
+
+    async def aadd(self, user_id: str, session_id: str, sku: str, quantity: int,
+                   product_name: str, brand: str, unit_price: float, notes: str = "") -> dict:
+        if not self._session_open(session_id):
+            return self._add_through(user_id, await self._repository.aadd_cart_item(
+                user_id, session_id, sku, quantity, product_name, brand, unit_price, notes))
+        result = self._apply_add(await self._aload(user_id), user_id, session_id, sku, quantity, product_name, brand, unit_price, notes)
+        await self._aflush_if_due(user_id)
+        return result
+
+    def _add_through(self, user_id: str, result: dict) -> dict:
+        # Written straight to the database, which validated the session; mirror the stored row
+        if result.get("success"):
+            row = result["data"]
+            with self._lock:
+                self._sessions[row["session_id"]] = _timestamp(result.get("session_expires_at"))
+                cart = self._carts.get(user_id)
+                if cart is not None:
+                    cart.put((row["session_id"], row["sku"]), dict(row))
+                    cart.stored.add(row["id"])
+        return result
+
+    def set_quantity(self, user_id: str, sku: str, quantity: int) -> Optional[dict]:
+        """Set the quantity of the user's active line for a SKU; None if there is none"""
+        line = self._apply_quantity(self._load(user_id), sku, quantity)
+        self._flush_if_due(user_id)
+        return line
+
+    async def aset_quantity(self, user_id: str, sku: str, quantity: int) -> Optional[dict]:
+        line = self._apply_quantity(await self._aload(user_id), sku, quantity)
+        await self._aflush_if_due(user_id)
+        return line
+
+    def remove(self, user_id: str, sku: str) -> List[dict]:
+        """Remove the user's active lines for a SKU; returns the removed lines"""
+        removed = self._apply_remove(self._load(user_id), sku)
+        self._flush_if_due(user_id)
+        return removed
+
+    async def aremove(self, user_id: str, sku: str) -> List[dict]:
+        removed = self._apply_remove(await self._aload(user_id), sku)
+        await self._aflush_if_due(user_id)
+        return removed
+
+    def checked_out(self, user_id: str) -> None:
+        """Drop the user's cart after a successful checkout purchased its lines.
+
+        Lines added while the checkout ran (ids never stored before it, queued or in a
+        flush still in flight) were not purchased: they stay, queued, in a fresh cart.
+        Their changes are sent again on the next flush, which reports any that the
+        checkout did purchase as stale. Edits to stored lines are dropped with them.
+        Without such lines the next read reloads the cart.
+        """
+        with self._lock:
+            cart = self._carts.pop(user_id, None)
+            if cart is None:
+                return
+            kept = {key: change for key, change in {**cart.in_flight, **cart.pending}.items()
+                    if change["status"] == "active" and change["id"] not in cart.stored}
+            if kept:
+                fresh = self._carts[user_id] = _Cart([cart.lines[key] for key in kept if key in cart.lines])
+                fresh.stored.clear()
+                fresh.pending = kept
+
+    def release_sessions(self, session_ids: List[str]) -> int:
+        """Drop the lines and queued changes of sessions the reaper expired; returns how many lines.
+
+        A flush already in flight can still write a line of such a session; that line
+        stays active in the database until the user's next checkout.
+        """
+        expired = set(session_ids)
+        released = 0
+        with self._lock:
+            for session_id in expired:
+                self._sessions.pop(session_id, None)
+            for cart in self._carts.values():
+                for key in [key for key in cart.lines if key[0] in expired]:
+                    cart.drop(key)
+                    released += 1
+                for key in [key for key in cart.pending if key[0] in expired]:
+                    del cart.pending[key]
+        return released
+
+    # flushing
+
+    def _due(self, user_id: str) -> bool:
+        with self._lock:
+            cart = self._carts.get(user_id)
+            return bool(cart and cart.pending) and (self.durability == "sync" or len(cart.pending) >= self.max_pending)
+
+    def _flush_if_due(self, user_id: str) -> None:
+        if self._due(user_id):
+            self.flush(user_id)
+
+    async def _aflush_if_due(self, user_id: str) -> None:
+        if self._due(user_id):
+            await self.aflush(user_id)
+
+    def _take_batch(self, user_id: str) -> Tuple[Optional[Dict], bool]:
+        """(queued changes, None if nothing to do) and whether another flush is in flight"""
+        with self._lock:
+            cart = self._carts.get(user_id)
+            if cart is None or cart.flushing:
+                return None, bool(cart and cart.flushing)
+            if not cart.pending:
+                return None, False
+            batch, cart.pending, cart.flushing = cart.pending, {}, True
+            cart.in_flight = batch
+            return batch, False
+
+    def _finish_batch(self, user_id: str, batch: Dict, result: Any) -> bool:
+        ok = isinstance(result, dict) and result.get("success")
+        with self._lock:
+            cart = self._carts.get(user_id)
+            if cart is None or cart.in_flight is not batch:
+                # The cart was dropped or replaced by checkout meanwhile; the database and
+                # the replacement's own queue hold its state
+                return ok
+            cart.flushing = False
+            cart.in_flight = {}
+            rejected = (result.get("rejected") or {}) if ok else {}
+            if ok:
+                self.flushes += 1
+                self.flushed_changes += len(batch) - len(rejected)
+                cart.stored.update(change["id"] for change in batch.values() if change["id"] not in rejected)
+                self._drop_stale(cart, set(result.get("stale") or ()))
+                if rejected:
+                    self.rejected_changes += len(rejected)
+                    cart.reload = True
+            else:
+                self.flush_failures += 1
+                # Put the batch back; edits made since it was taken are newer and win
+                for key, change in batch.items():
+                    cart.pending.setdefault(key, change)
+        if not ok:
+            print(f"Cart flush for {user_id} failed: {result}")
+        for line_id, error in rejected.items():
+            print(f"Cart change {line_id} for {user_id} rejected and dropped: {error}")
+        return ok
+
+    @staticmethod
+    def _refused(result: Any) -> bool:
+        """A definitive answer from the database (e.g. a constraint violation), unlike an exception"""
+        return isinstance(result, dict) and not result.get("success")
+
+    @staticmethod
+    def _merge(outcome: dict, change: dict, result: dict) -> None:
+        if result.get("success"):
+            outcome["stale"].extend(result.get("stale") or ())
+        else:
+            outcome["rejected"][change["id"]] = result.get("error")
+
+    def _isolate(self, user_id: str, batch: Dict, result: dict) -> dict:
+        """Write a refused batch one change at a time, so only the changes the database refuses are dropped"""
+        outcome = {"success": True, "stale": [], "rejected": {}}
+        changes = list(batch.values())
+        if len(changes) == 1:
+            self._merge(outcome, changes[0], result)
+            return outcome
+        for change in changes:
+            self._merge(outcome, change, self._repository.apply_cart_changes(user_id, [change]))
+        return outcome
+
+    async def _aisolate(self, user_id: str, batch: Dict, result: dict) -> dict:
+        outcome = {"success": True, "stale": [], "rejected": {}}
+        changes = list(batch.values())
+        if len(changes) == 1:
+            self._merge(outcome, changes[0], result)
+            return outcome
+        for change in changes:
+            self._merge(outcome, change, await self._repository.aapply_cart_changes(user_id, [change]))
+        return outcome
+
+    def _drop_stale(self, cart: _Cart, stale_ids: set) -> None:
+        """Forget lines the database no longer holds as active, with any edits queued for them"""
+        if not stale_ids:
+            return
+        self.stale_lines += len(stale_ids)
+        for key in [key for key, line in cart.lines.items() if line["id"] in stale_ids]:
+            cart.drop(key)
+        for key in [key for key, change in cart.pending.items() if change["id"] in stale_ids]:
+            del cart.pending[key]
+
+    def _users(self, user_id: Optional[str]) -> List[str]:
+        with self._lock:
+            return [user_id] if user_id else [user for user, cart in self._carts.items() if cart.pending or cart.flushing]
+
+    def flush(self, user_id: Optional[str] = None) -> bool:
+        """Persist queued changes for one user (or everyone); True if nothing is left unsaved"""
+        ok = True
+        for user in self._users(user_id):
+            deadline = time.monotonic() + self.flush_wait
+            while True:
+                batch, busy = self._take_batch(user)
+                if batch is None:
+                    if not busy:
+                        break
+                    if time.monotonic() > deadline:
+                        ok = False
+                        break
+                    time.sleep(0.005)
+                    continue
+                # Anything short of a result (including an interrupt) puts the batch back
+                result = "interrupted"
+                try:
+                    result = self._repository.apply_cart_changes(user, list(batch.values()))
+                    if self._refused(result):
+                        result = self._isolate(user, batch, result)
+                except Exception as e:
+                    result = str(e)
+                finally:
+                    finished = self._finish_batch(user, batch, result)
+                if not finished:
+                    ok = False
+                    break
+        return ok
+
+    async def aflush(self, user_id: Optional[str] = None) -> bool:
+        ok = True
+        for user in self._users(user_id):
+            deadline = time.monotonic() + self.flush_wait
+            while True:
+                batch, busy = self._take_batch(user)
+                if batch is None:
+                    if not busy:
+                        break
+                    if time.monotonic() > deadline:
+                        ok = False
+                        break
+                    await asyncio.sleep(0.005)
+                    continue
+                # A cancelled flush (e.g. the flusher at shutdown) requeues its batch
+                result = "cancelled"
+                try:
+                    result = await self._repository.aapply_cart_changes(user, list(batch.values()))
+                    if self._refused(result):
+                        result = await self._aisolate(user, batch, result)
+                except Exception as e:
+                    result = str(e)
+                finally:
+                    finished = self._finish_batch(user, batch, result)
+                if not finished:
+                    ok = False
+                    break
+        return ok
+
+    def _evict_idle(self) -> None:
+        cutoff = time.monotonic() - self.idle_seconds
+        with self._lock:
+            for user in [user for user, cart in self._carts.items()
+                         if cart.last_used < cutoff and not cart.pending and not cart.flushing]:
+                del self._carts[user]
+
+    async def run_flusher(self) -> None:
+        """Background task: flush every flush_interval seconds and drop idle, clean carts"""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.aflush()
+                self._evict_idle()
+            except Exception as e:
+                print(f"Cart flusher error: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            pending = sum(len(cart.pending) for cart in self._carts.values())
+            dirty = sum(1 for cart in self._carts.values() if cart.pending)
+            carts = len(self._carts)
+        return {
+            "durability": self.durability,
+            "carts": carts,
+            "dirty_carts": dirty,
+            "pending_changes": pending,
+            "hits": self.hits,
+            "loads": self.loads,
+            "flushes": self.flushes,
+            "flushed_changes": self.flushed_changes,
+            "flush_failures": self.flush_failures,
+            "stale_lines": self.stale_lines,
+            "rejected_changes": self.rejected_changes
+        }
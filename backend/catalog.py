@@ -0,0 +1,204 @@
+import time
+import bisect
+import asyncio
+import hashlib
+import threading
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from matcher import ProductMatcher
+
+# Stable orderings for paginated search; every key ends with the SKU so it is unique
+SORT_ORDERS: Dict[str, Callable[[dict], tuple]] = {
+    "name": lambda row: ((row.get("item_name") or "").lower(), row["sku"]),
+    "price": lambda row: (float(row.get("price") or 0), row["sku"]),
+    "price_desc": lambda row: (-float(row.get("price") or 0), row["sku"]),
+}
+
+# Columns whose change alters what a search returns
+FINGERPRINT_COLUMNS = ("sku", "item_name", "brand", "category", "price", "stock_quantity", "is_active")
+
+
+class ProductCache:
+    """Process-wide, read-mostly cache of the products table.
+
+    Rows are keyed by SKU with secondary indexes by category and brand. The whole
+    catalog is reloaded through `loader` once `ttl_seconds` have passed or after
+    `invalidate()`; lookups in between never leave the process. Async callers
+    can `await aensure_fresh()` first so a reload goes through `aloader`
+    instead of blocking the event loop.
+
+    `fingerprint` hashes the searchable columns of every row. Unlike `version`, it
+    only changes when a reload actually changed the data, so it can key HTTP caches.
+    """
+
+    def __init__(self, loader: Callable[[], List[dict]], ttl_seconds: float = 300,
+                 aloader: Optional[Callable[[], Awaitable[List[dict]]]] = None):
+        self._loader = loader
+        self._aloader = aloader
+        self._async_lock: Optional[asyncio.Lock] = None
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._rows: List[dict] = []
+        self._by_sku: Dict[str, dict] = {}
+        self._by_category: Dict[str, List[dict]] = {}
+        self._by_brand: Dict[str, List[dict]] = {}
+        self._matcher = ProductMatcher([])
+        self._sorted: Dict[str, Tuple[List[tuple], List[dict]]] = {}
+        self._listeners: List[Callable[[List[dict]], None]] = []
+        self._loaded_at: Optional[float] = None
+        self.fingerprint = ""
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+
+    def _is_fresh(self) -> bool:
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl_seconds
+
+    def _ensure_fresh(self) -> None:
+        if self._is_fresh():
+            self.hits += 1
+            return
+
+        with self._lock:
+            # Another thread may have reloaded while we waited for the lock
+            if self._is_fresh():
+                self.hits += 1
+                return
+            self.misses += 1
+            self._load(self._loader())
+
+    async def aensure_fresh(self) -> None:
+        """Reload a stale catalog without blocking the event loop; the reads that follow then hit"""
+        if self._is_fresh():
+            return
+        if self._async_lock is None:
+            self._async_lock = asyncio.Lock()
+        async with self._async_lock:
+            if self._is_fresh():
+                return
+            self.misses += 1
+            if self._aloader is not None:
+                rows = await self._aloader()
+            else:
+                rows = await asyncio.to_thread(self._loader)
+            with self._lock:
+                self._load(rows)
+
+    def _load(self, rows: List[dict]) -> None:
+        by_sku, by_category, by_brand = {}, {}, {}
+        for row in rows:
+            by_sku[row["sku"]] = row
+            by_category.setdefault(row.get("category"), []).append(row)
+            by_brand.setdefault(row.get("brand"), []).append(row)
+
+        active = [row for row in rows if row.get("is_active", True)]
+        matcher = ProductMatcher(active)
+        ordered = {}
+        for sort, sort_key in SORT_ORDERS.items():
+            keyed = sorted(((sort_key(row), row) for row in active), key=lambda pair: pair[0])
+            ordered[sort] = ([key for key, _ in keyed], [row for _, row in keyed])
+        digest = hashlib.sha1()
+        for sku in sorted(by_sku):
+            digest.update(repr([by_sku[sku].get(column) for column in FINGERPRINT_COLUMNS]).encode())
+
+        # Swap the indexes in one go so readers never see a half-built catalog
+        self._rows, self._by_sku, self._by_category, self._by_brand = rows, by_sku, by_category, by_brand
+        self._matcher, self._sorted, self.fingerprint = matcher, ordered, digest.hexdigest()[:16]
+        self._loaded_at = time.monotonic()
+        self.version += 1
+        self.reloads += 1
+        for listener in self._listeners:
+            try:
+                listener(rows)
+            except Exception as e:
+                print(f"Catalog reload listener failed: {e}")
+
+    def on_reload(self, listener: Callable[[List[dict]], None]) -> None:
+        """Call `listener(rows)` after every (re)load, e.g. to update a derived index"""
+        self._listeners.append(listener)
+        if self._loaded_at is not None:
+            listener(self._rows)
+
+    def is_fresh(self) -> bool:
+        return self._is_fresh()
+
+    def ensure_fresh(self) -> None:
+        """Reload a stale catalog now, e.g. before reading an index kept current through on_reload"""
+        self._ensure_fresh()
+
+    def invalidate(self) -> None:
+        """Force the next read to reload the catalog"""
+        self._loaded_at = None
+
+    def get(self, sku: str, active_only: bool = False) -> Optional[dict]:
+        self._ensure_fresh()
+        row = self._by_sku.get(sku)
+        if row is None or (active_only and not row.get("is_active", True)):
+            return None
+        return row
+
+    def get_many(self, skus: Iterable[str], active_only: bool = False) -> List[dict]:
+        self._ensure_fresh()
+        rows = []
+        for sku in dict.fromkeys(skus):
+            row = self._by_sku.get(sku)
+            if row is not None and (not active_only or row.get("is_active", True)):
+                rows.append(row)
+        return rows
+
+    def all(self, active_only: bool = True) -> List[dict]:
+        self._ensure_fresh()
+        return [row for row in self._rows if not active_only or row.get("is_active", True)]
+
+    def by_category(self, category: str, active_only: bool = True) -> List[dict]:
+        self._ensure_fresh()
+        return [row for row in self._by_category.get(category, []) if not active_only or row.get("is_active", True)]
+
+    def by_brand(self, brand: str, active_only: bool = True) -> List[dict]:
+        self._ensure_fresh()
+        return [row for row in self._by_brand.get(brand, []) if not active_only or row.get("is_active", True)]
+
+    def search(self, text: str, category: Optional[str] = None, active_only: bool = True) -> List[dict]:
+        """Case-insensitive substring match on item_name, like `ilike '%text%'`"""
+        rows = self.by_category(category, active_only) if category else self.all(active_only)
+        needle = text.lower()
+        return [row for row in rows if needle in (row.get("item_name") or "").lower()]
+
+    def search_page(self, text: str = "", category: Optional[str] = None, sort: str = "name",
+                    after: Optional[tuple] = None, limit: int = 10) -> Tuple[List[dict], Optional[tuple]]:
+        """One page of active products matching `text` (substring) and `category`, in `sort` order.
+
+        Keyset pagination: `after` is the sort key of the last row of the previous page.
+        Returns the rows and the key to pass for the next page, or None on the last page.
+        """
+        self._ensure_fresh()
+        keys, rows = self._sorted[sort]
+        start = bisect.bisect_right(keys, after) if after is not None else 0
+        needle = text.lower()
+        page: List[Tuple[tuple, dict]] = []
+        for index in range(start, len(rows)):
+            row = rows[index]
+            if category and row.get("category") != category:
+                continue
+            if needle and needle not in (row.get("item_name") or "").lower():
+                continue
+            if len(page) == limit:
+                return [row for _, row in page], page[-1][0]
+            page.append((keys[index], row))
+        return [row for _, row in page], None
+
+    def match(self, ingredient: str, top_k: int = 10, category: Optional[str] = None) -> List[Tuple[dict, float]]:
+        """Fuzzy-match an ingredient name to active products, best first, with scores"""
+        self._ensure_fresh()
+        return self._matcher.match(ingredient, top_k=top_k, category=category)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "products": len(self._by_sku),
+            "version": self.version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "reloads": self.reloads,
+            "ttl_seconds": self.ttl_seconds
+        }
@@ -0,0 +1,179 @@
+import json
+from typing import Any, Dict, List, Optional
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage, ToolMessage
+
+# Fields worth keeping when an old tool result is compacted for the prompt
+COMPACT_KEYS = (
+    "sku", "item_name", "product_name", "brand", "price", "unit_price", "quantity", "unit",
+    "stock_quantity", "in_stock", "match_score", "available", "count", "success", "error",
+    "message", "session_id", "order_number", "total_price", "total_amount", "item_count",
+    "recipe", "ingredients", "unavailable", "qty", "stock", "score", "more",
+)
+
+
+def approx_tokens(text: str) -> int:
+    """Cheap token estimate (about four characters per token)"""
+    return len(text) // 4 + 1
+
+
+def message_tokens(message: BaseMessage) -> int:
+    content = message.content if isinstance(message.content, str) else json.dumps(message.content)
+    tokens = approx_tokens(content)
+    for tool_call in getattr(message, "tool_calls", None) or []:
+        tokens += approx_tokens(tool_call["name"] + json.dumps(tool_call.get("args", {})))
+    return tokens
+
+
+def _project(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {key: _project(item) for key, item in value.items() if key in COMPACT_KEYS or isinstance(item, (dict, list))}
+    if isinstance(value, list):
+        return [_project(item) for item in value]
+    return value
+
+
+def compact_tool_content(content: str, max_chars: int) -> str:
+    """Shrink a tool result to its identifying fields, then truncate if still too long"""
+    if len(content) <= max_chars:
+        return content
+    try:
+        content = json.dumps(_project(json.loads(content)), separators=(",", ":"))
+    except (json.JSONDecodeError, TypeError):
+        pass
+    if len(content) > max_chars:
+        content = content[:max_chars] + "…(truncated)"
+    return content
+
+
+def split_turns(messages: List[BaseMessage]) -> List[List[BaseMessage]]:
+    """Group messages into turns, each starting at a user message"""
+    turns: List[List[BaseMessage]] = []
+    for message in messages:
+        if isinstance(message, SystemMessage):
+            continue
+        if isinstance(message, HumanMessage) or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+def _json(content: Any) -> Any:
+    try:
+        return json.loads(content)
+    except (json.JSONDecodeError, TypeError):
+        return None
+
+
+def extract_conversation_state(messages: List[BaseMessage]) -> Dict[str, Any]:
+    """Pull the facts the agent needs from tool traffic: recipe, ingredients, session and cart SKUs"""
+    state: Dict[str, Any] = {}
+    calls: Dict[str, dict] = {}
+    checked: List[str] = []
+    added: Dict[str, int] = {}
+
+    for message in messages:
+        if isinstance(message, AIMessage):
+            for tool_call in message.tool_calls or []:
+                calls[tool_call["id"]] = tool_call
+            continue
+        if not isinstance(message, ToolMessage):
+            continue
+
+        tool_call = calls.get(message.tool_call_id, {})
+        name, args = tool_call.get("name") or message.name, tool_call.get("args", {})
+        result = _json(message.content)
+
+        if name == "extract_recipe_ingredients" and isinstance(result, dict) and result.get("ingredients"):
+            state["recipe"] = result.get("recipe")
+            state["ingredients"] = result["ingredients"]
+        elif name == "create_cart_session" and isinstance(result, dict) and result.get("success"):
+            state["session_id"] = result.get("session_id")
+        elif name == "check_ingredient_availability" and args.get("ingredient_name"):
+            checked.append(args["ingredient_name"])
+        elif name == "check_ingredients_availability":
+            checked.extend(args.get("ingredient_names", []))
+        elif name == "add_to_cart" and isinstance(result, dict) and result.get("success"):
+            added[args.get("sku")] = added.get(args.get("sku"), 0) + int(args.get("quantity", 1))
+        elif name == "remove_from_cart" and isinstance(result, dict) and result.get("success"):
+            added.pop(args.get("sku"), None)
+        elif name == "checkout_cart" and isinstance(result, dict) and result.get("success"):
+            state["last_order_number"] = result.get("order_number")
+            added.clear()
+
+    if checked:
+        state["ingredients_checked"] = list(dict.fromkeys(checked))
+    if added:
+        state["skus_added"] = added
+    return state
+
+
+class ContextWindow:
+    """Builds a bounded prompt for the agent from the full conversation.
+
+    The system prompt and the current turn are always sent. Earlier turns are
+    added newest first, with their tool results compacted, while they fit in
+    `token_budget` and `max_turns`; anything older is represented only by the
+    structured conversation state in the system message.
+    """
+
+    def __init__(self, token_budget: int = 6000, max_turns: int = 6, max_tool_chars: int = 800):
+        self.token_budget = token_budget
+        self.max_turns = max_turns
+        self.max_tool_chars = max_tool_chars
+        self.calls = 0
+        self.prompt_tokens_total = 0
+        self.last_prompt_tokens = 0
+        self.dropped_turns_total = 0
+
+    def _compact_turn(self, turn: List[BaseMessage]) -> List[BaseMessage]:
+        compacted = []
+        for message in turn:
+            if isinstance(message, ToolMessage) and isinstance(message.content, str):
+                content = compact_tool_content(message.content, self.max_tool_chars)
+                if content is not message.content:
+                    message = message.model_copy(update={"content": content})
+            compacted.append(message)
+        return compacted
+
+    def build(self, system_prompt: str, messages: List[BaseMessage], context: Optional[Dict[str, Any]] = None) -> List[BaseMessage]:
+        turns = split_turns(messages)
+        current = turns[-1] if turns else []
+
+        conversation_state = {**(context or {}), **extract_conversation_state(messages)}
+        system_text = system_prompt
+        if conversation_state:
+            system_text += f"\n\nCurrent context: {json.dumps(conversation_state, separators=(',', ':'))}"
+        system = SystemMessage(content=system_text)
+
+        used = message_tokens(system) + sum(message_tokens(message) for message in current)
+        kept: List[List[BaseMessage]] = []
+        for turn in reversed(turns[:-1]):
+            if len(kept) + 1 >= self.max_turns:
+                break
+            turn = self._compact_turn(turn)
+            cost = sum(message_tokens(message) for message in turn)
+            if used + cost > self.token_budget:
+                break
+            kept.append(turn)
+            used += cost
+
+        self.calls += 1
+        self.last_prompt_tokens = used
+        self.prompt_tokens_total += used
+        self.dropped_turns_total += max(0, len(turns) - 1 - len(kept))
+
+        prompt = [system]
+        for turn in reversed(kept):
+            prompt.extend(turn)
+        prompt.extend(current)
+        return prompt
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "token_budget": self.token_budget,
+            "calls": self.calls,
+            "last_prompt_tokens": self.last_prompt_tokens,
+            "average_prompt_tokens": self.prompt_tokens_total // self.calls if self.calls else 0,
+            "dropped_turns_total": self.dropped_turns_total
+        }
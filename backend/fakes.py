@@ -0,0 +1,182 @@
+import re
+import json
+import time
+import uuid
+import asyncio
+from typing import Any, AsyncIterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, SystemMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+# Canned extractions for the deterministic ingredient model
+RECIPE_INGREDIENTS = {
+    "pasta": ["pasta", "tomatoes", "garlic", "olive oil", "cheese", "basil"],
+    "biryani": ["basmati rice", "onions", "curd", "ginger", "garlic", "green chillies", "mint leaves", "biryani masala", "ghee", "saffron"],
+    "paneer butter masala": ["paneer", "butter", "tomatoes", "fresh cream", "cashew nuts", "ginger", "garlic", "garam masala", "kasuri methi", "red chili powder"],
+    "palak paneer": ["spinach", "paneer", "onions", "tomatoes", "garlic", "ginger", "cumin seeds", "fresh cream"],
+}
+
+
+class FakeIngredientModel(BaseChatModel):
+    """Offline stand-in for the ingredient LLM.
+
+    Returns the canned ingredient list of the first known recipe named in the
+    request after sleeping `latency_seconds`, so tool logic can be timed without Groq.
+    """
+
+    latency_seconds: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-ingredient-model"
+
+    def _reply(self, messages: List[BaseMessage]) -> ChatResult:
+        request = str(messages[-1].content).lower()
+        recipe = next((name for name in RECIPE_INGREDIENTS if name in request), request)
+        payload = {"recipe": recipe, "ingredients": RECIPE_INGREDIENTS.get(recipe, ["salt", "oil", "onions"])}
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=json.dumps(payload)))])
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        return self._reply(messages)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        if self.latency_seconds:
+            await asyncio.sleep(self.latency_seconds)
+        return self._reply(messages)
+
+
+class ScriptedShopperModel(BaseChatModel):
+    """Offline stand-in for the agent LLM that follows the shopping flow of SYSTEM_PROMPT.
+
+    Decides the next step from the latest message and the "Current context" JSON
+    that ContextWindow appends to the system prompt: a recipe request triggers
+    extract_recipe_ingredients + create_cart_session, "yes"/"next" checks the next
+    unchecked ingredient, a number adds that option to the cart, and "checkout"
+    places the order. Every reply waits `latency_seconds`; text replies stream
+    word by word with `token_latency_seconds` between tokens.
+    """
+
+    latency_seconds: float = 0.0
+    token_latency_seconds: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted-shopper-model"
+
+    def bind_tools(self, tools: Any, **kwargs: Any) -> "ScriptedShopperModel":
+        return self
+
+    @staticmethod
+    def _context(messages: List[BaseMessage]) -> dict:
+        system = next((message for message in messages if isinstance(message, SystemMessage)), None)
+        if system is None or "Current context: " not in system.content:
+            return {}
+        return json.loads(system.content.rsplit("Current context: ", 1)[1])
+
+    @staticmethod
+    def _last_options(messages: List[BaseMessage]) -> List[dict]:
+        for message in reversed(messages):
+            if isinstance(message, ToolMessage):
+                try:
+                    result = json.loads(message.content)
+                except (json.JSONDecodeError, TypeError):
+                    continue
+                if isinstance(result, dict) and result.get("options"):
+                    return result["options"]
+        return []
+
+    @staticmethod
+    def _call(name: str, **args: Any) -> dict:
+        return {"name": name, "args": args, "id": f"call_{uuid.uuid4().hex[:12]}", "type": "tool_call"}
+
+    def _decide(self, messages: List[BaseMessage]) -> AIMessage:
+        context = self._context(messages)
+        user_id = context.get("user_id", "guest")
+        last = messages[-1]
+
+        if isinstance(last, ToolMessage):
+            return AIMessage(content=self._summarize(messages, context))
+
+        text = str(last.content).strip().lower()
+        if "checkout" in text:
+            return AIMessage(content="", tool_calls=[self._call("checkout_cart", user_id=user_id)])
+        if text.isdigit():
+            options = self._last_options(messages)
+            if not options:
+                return AIMessage(content="Which ingredient should I look up first?")
+            option = options[(int(text) - 1) % len(options)]
+            return AIMessage(content="", tool_calls=[self._call(
+                "add_to_cart", user_id=user_id, sku=option["sku"], quantity=1, session_id=context.get("session_id")
+            )])
+        if text in ("yes", "next", "ok", "sure"):
+            remaining = [name for name in context.get("ingredients", []) if name not in context.get("ingredients_checked", [])]
+            if not remaining:
+                return AIMessage(content="That's every ingredient. Shall I check out?")
+            return AIMessage(content="", tool_calls=[self._call("check_ingredient_availability", ingredient_name=remaining[0])])
+        return AIMessage(content="", tool_calls=[
+            self._call("extract_recipe_ingredients", recipe_request=str(last.content)),
+            self._call("create_cart_session", user_id=user_id),
+        ])
+
+    def _summarize(self, messages: List[BaseMessage], context: dict) -> str:
+        results = []
+        for message in reversed(messages):
+            if not isinstance(message, ToolMessage):
+                break
+            try:
+                results.append((message.name, json.loads(message.content)))
+            except (json.JSONDecodeError, TypeError):
+                results.append((message.name, {}))
+
+        for name, result in results:
+            if name == "extract_recipe_ingredients":
+                ingredients = ", ".join(result.get("ingredients", []))
+                return f"Great, let's shop for {result.get('recipe')}! The ingredients are: {ingredients}. Shall I start?"
+            if name == "check_ingredient_availability":
+                lines = [f"{option.get('option', index)}. {option['item_name']} ({option['brand']}) - ₹{option['price']}"
+                         for index, option in enumerate(result.get("options", []), 1)]
+                return "Here are your options:\n" + "\n".join(lines) if lines else "That isn't available, shall we move on?"
+            if name == "add_to_cart":
+                return result.get("message", "Added to your cart").rstrip(".") + ". Shall I find the next ingredient?"
+            if name == "checkout_cart":
+                if result.get("success"):
+                    return f"Order {result.get('order_number')} placed with {result.get('item_count')} items. Thank you!"
+                return f"Checkout failed: {result.get('error')}"
+        return "Done. What next?"
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        return ChatResult(generations=[ChatGeneration(message=self._decide(messages))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        if self.latency_seconds:
+            await asyncio.sleep(self.latency_seconds)
+        return ChatResult(generations=[ChatGeneration(message=self._decide(messages))])
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        if self.latency_seconds:
+            await asyncio.sleep(self.latency_seconds)
+        message = self._decide(messages)
+        if message.tool_calls:
+            chunks = [AIMessageChunk(content="", tool_call_chunks=[
+                {"name": call["name"], "args": json.dumps(call["args"]), "id": call["id"], "index": index}
+                for index, call in enumerate(message.tool_calls)
+            ])]
+        else:
+            chunks = [AIMessageChunk(content=token) for token in re.findall(r"\S+\s*", message.content)]
+
+        for chunk in chunks:
+            if self.token_latency_seconds:
+                await asyncio.sleep(self.token_latency_seconds)
+            if run_manager and chunk.content:
+                await run_manager.on_llm_new_token(chunk.content, chunk=ChatGenerationChunk(message=chunk))
+            yield ChatGenerationChunk(message=chunk)
@@ -0,0 +1,245 @@
+"""Websocket load generator for capacity planning.
+
+Opens N concurrent /ws connections per concurrency level and replays scripted
+shopping conversations (recipe -> pick options -> checkout) against one uvicorn
+worker running `agent.app`, with both LLMs replaced by deterministic fakes.
+
+    python loadtest.py --concurrency 1,10,50,100 --llm-latency 0.8
+    python loadtest.py --serve --port 8765           # only run the fake-LLM server
+    python loadtest.py --url ws://localhost:8765/ws  # drive a server that is already running
+
+Reports throughput, turn latency percentiles, server event-loop lag and error
+rate for every level.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import asyncio
+import argparse
+import subprocess
+import urllib.request
+from typing import Dict, List, Optional
+
+import websockets
+
+from fakes import RECIPE_INGREDIENTS
+
+# One conversation: ask for a recipe, take an option for two ingredients, then check out
+SCRIPT = ["I want to make {recipe}", "yes", "1", "yes", "2", "checkout"]
+
+ERROR_RESPONSE = "Sorry, an error occurred"
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class LoopLagMonitor:
+    """Samples how late the event loop wakes up from a short sleep"""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.samples: List[float] = []
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - started - self.interval))
+
+    def snapshot(self, reset: bool = False) -> Dict[str, float]:
+        samples = sorted(self.samples)
+        if reset:
+            self.samples = []
+        return {
+            "lag_p50_ms": round(percentile(samples, 0.50) * 1000, 1),
+            "lag_p99_ms": round(percentile(samples, 0.99) * 1000, 1),
+            "lag_max_ms": round((samples[-1] if samples else 0.0) * 1000, 1)
+        }
+
+
+def serve(port: int, llm_latency: float, token_latency: float, ingredient_latency: float) -> None:
+    """Run agent.app in this process with fake LLMs and the local SQLite data backend"""
+    os.environ["DATA_BACKEND"] = "sqlite"
+    os.environ.setdefault("SQLITE_DB_PATH", ":memory:")
+    os.environ["RECIPE_CACHE_PATH"] = ""
+    os.environ["CHECKPOINT_BACKEND"] = "memory"
+    # Load-test users are named by the client; there are no accounts to authenticate
+    os.environ["WS_AUTH"] = "none"
+
+    import uvicorn
+    import agent
+    from fakes import FakeIngredientModel, ScriptedShopperModel
+
+    agent.llm_ing = FakeIngredientModel(latency_seconds=ingredient_latency)
+    agent.llm_with_tools = ScriptedShopperModel(latency_seconds=llm_latency, token_latency_seconds=token_latency)
+
+    monitor = LoopLagMonitor()
+
+    async def loop_lag(reset: bool = False):
+        return monitor.snapshot(reset=reset)
+
+    agent.app.add_api_route("/api/loadtest/lag", loop_lag, methods=["GET"])
+
+    async def main():
+        server = uvicorn.Server(uvicorn.Config(agent.app, host="127.0.0.1", port=port, log_level="warning"))
+        lag_task = asyncio.create_task(monitor.run())
+        try:
+            await server.serve()
+        finally:
+            lag_task.cancel()
+
+    asyncio.run(main())
+
+
+def http_url(ws_url: str, path: str) -> str:
+    base = ws_url.replace("ws://", "http://", 1).replace("wss://", "https://", 1)
+    return base.rsplit("/ws", 1)[0] + path
+
+
+def fetch_json(url: str) -> Optional[dict]:
+    try:
+        with urllib.request.urlopen(url, timeout=5) as response:
+            return json.loads(response.read())
+    except OSError:
+        return None
+
+
+async def converse(ws_url: str, recipe: str, stream: bool, timeout: float, results: dict) -> None:
+    """Replay one scripted conversation on a fresh connection"""
+    user_id = f"load_{uuid.uuid4().hex[:12]}"
+    try:
+        async with websockets.connect(f"{ws_url}?user_id={user_id}", open_timeout=timeout) as websocket:
+            for line in SCRIPT:
+                started = time.perf_counter()
+                await websocket.send(json.dumps({"message": line.format(recipe=recipe), "stream": stream}))
+                while True:
+                    frame = json.loads(await asyncio.wait_for(websocket.recv(), timeout))
+                    if "response" in frame:
+                        break
+                results["latencies"].append(time.perf_counter() - started)
+                results["turns"] += 1
+                if frame["response"].startswith(ERROR_RESPONSE):
+                    results["errors"] += 1
+        results["conversations"] += 1
+    except (OSError, asyncio.TimeoutError, websockets.WebSocketException) as e:
+        results["errors"] += 1
+        results["failures"].append(type(e).__name__)
+
+
+async def run_level(ws_url: str, concurrency: int, conversations: int, stream: bool, timeout: float) -> dict:
+    """Run `concurrency` clients, each replaying `conversations` conversations back to back"""
+    results = {"latencies": [], "turns": 0, "errors": 0, "conversations": 0, "failures": []}
+    recipes = list(RECIPE_INGREDIENTS)
+
+    async def client(index: int) -> None:
+        for round_number in range(conversations):
+            recipe = recipes[(index + round_number) % len(recipes)]
+            await converse(ws_url, recipe, stream, timeout, results)
+
+    await asyncio.to_thread(fetch_json, http_url(ws_url, "/api/loadtest/lag?reset=true"))
+    started = time.perf_counter()
+    await asyncio.gather(*(client(index) for index in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    lag = await asyncio.to_thread(fetch_json, http_url(ws_url, "/api/loadtest/lag?reset=true")) or {}
+
+    latencies = sorted(results["latencies"])
+    attempts = results["turns"] + len(results["failures"])
+    return {
+        "concurrency": concurrency,
+        "conversations": results["conversations"],
+        "turns": results["turns"],
+        "errors": results["errors"],
+        "error_rate": round(results["errors"] / attempts, 4) if attempts else 0.0,
+        "turns_per_second": round(results["turns"] / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "lag_p99_ms": lag.get("lag_p99_ms"),
+        "lag_max_ms": lag.get("lag_max_ms"),
+        "failures": sorted(set(results["failures"]))
+    }
+
+
+def print_row(row: dict) -> None:
+    lag_p99 = "-" if row["lag_p99_ms"] is None else row["lag_p99_ms"]
+    lag_max = "-" if row["lag_max_ms"] is None else row["lag_max_ms"]
+    print(f"{row['concurrency']:>6} {row['turns']:>7} {row['errors']:>7} {row['error_rate']:>7.2%} "
+          f"{row['turns_per_second']:>9} {row['p50_ms']:>9} {row['p95_ms']:>9} {row['p99_ms']:>9} "
+          f"{lag_p99:>9} {lag_max:>9}")
+
+
+def start_server(args) -> subprocess.Popen:
+    command = [
+        sys.executable, os.path.abspath(__file__), "--serve", "--port", str(args.port),
+        "--llm-latency", str(args.llm_latency), "--token-latency", str(args.token_latency),
+        "--ingredient-latency", str(args.ingredient_latency)
+    ]
+    server = subprocess.Popen(command, cwd=os.path.dirname(os.path.abspath(__file__)))
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if fetch_json(f"http://127.0.0.1:{args.port}/") is not None:
+            return server
+        if server.poll() is not None:
+            break
+        time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError("Load test server did not start")
+
+
+async def drive(args) -> List[dict]:
+    print(f"{'conc':>6} {'turns':>7} {'errors':>7} {'err%':>7} {'turns/s':>9} {'p50 ms':>9} "
+          f"{'p95 ms':>9} {'p99 ms':>9} {'lag p99':>9} {'lag max':>9}")
+    rows = []
+    for concurrency in args.concurrency:
+        row = await run_level(args.url, concurrency, args.conversations, args.stream, args.timeout)
+        print_row(row)
+        rows.append(row)
+    return rows
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=lambda value: [int(level) for level in value.split(",")],
+                        default=[1, 5, 10, 25, 50], help="comma-separated concurrency levels")
+    parser.add_argument("--conversations", type=int, default=2, help="conversations per client per level")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="seconds before each agent LLM reply")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="seconds between streamed tokens")
+    parser.add_argument("--ingredient-latency", type=float, default=1.0, help="seconds per ingredient extraction")
+    parser.add_argument("--stream", action="store_true", help="request token/tool streaming frames")
+    parser.add_argument("--timeout", type=float, default=120.0, help="seconds to wait for any single frame")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--url", help="websocket URL of a running server; by default one is started")
+    parser.add_argument("--serve", action="store_true", help="only run the fake-LLM server")
+    parser.add_argument("--json", help="also write results to this file")
+    args = parser.parse_args(argv)
+
+    if args.serve:
+        serve(args.port, args.llm_latency, args.token_latency, args.ingredient_latency)
+        return 0
+
+    server = None
+    if not args.url:
+        server = start_server(args)
+        args.url = f"ws://127.0.0.1:{args.port}/ws"
+    try:
+        rows = asyncio.run(drive(args))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    if args.json:
+        with open(args.json, "w") as handle:
+            json.dump(rows, handle, indent=2)
+    return 1 if any(row["errors"] for row in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,23 @@
+import json
+import asyncio
+from datetime import datetime, timedelta
 
+from agent import (
+    repository,
+    extract_recipe_ingredients,
+    create_cart_session,
+    check_ingredient_availability,
+    get_product_details_for_comparison,
+    add_to_cart,
+    get_user_cart,
+    update_cart_quantity,
+    remove_from_cart,
+    search_alternatives,
+    get_nutrition_comparison,
+    get_cart_nutrition,
+    checkout_cart,
+    session_reaper,
+)
 
 #############################################################################
 # TESTING
@@ -248,6 +267,27 @@ def test_get_nutrition_comparison():
     
     return True
 
+def test_get_cart_nutrition():
+    """Test cart nutrition totals"""
+    print("\n=== Testing get_cart_nutrition ===")
+    
+    test_user = "test_user_001"
+    
+    # Tools return JSON strings
+    result = json.loads(get_cart_nutrition.invoke({"user_id": test_user}))
+    
+    if 'error' not in result:
+        print(f"Nutrition of {result['item_count']} cart items ({result['total_grams']}g):")
+        print(f"  Totals: {result['totals']}")
+        if result.get('not_counted'):
+            print(f"  Not counted (sold by count): {', '.join(result['not_counted'])}")
+        if result.get('missing_data'):
+            print(f"  No data for: {result['missing_data']}")
+    else:
+        print(f"Error: {result['error']}")
+    
+    return True
+
 def test_checkout_cart():
     """Test checkout process"""
     print("\n=== Testing checkout_cart ===")
@@ -287,14 +327,13 @@ def test_checkout_cart():
     
     return result.get('success', False)
 
-def test_clear_expired_sessions():
-    """Test clearing expired sessions"""
-    print("\n=== Testing clear_expired_sessions ===")
+def test_session_reaper():
+    """Test the background session reaper"""
+    print("\n=== Testing session_reaper ===")
     
     # First create an expired session for testing
     test_user = "test_expired_user"
     
-    # Manually create an expired session
     expired_session_data = {
         "user_id": test_user,
         "session_id": f"expired_session_{datetime.now().strftime('%Y%m%d%H%M%S')}",
@@ -305,18 +344,16 @@ def test_clear_expired_sessions():
     }
     
     try:
-        supabase.table('cart_sessions').insert(expired_session_data).execute()
+        repository.create_session(expired_session_data)
         print("Created test expired session")
-    except:
+    except Exception:
         print("Could not create test expired session")
     
-    # Now clear expired sessions
-    result = clear_expired_sessions.invoke({})
+    # Run one reaper pass instead of waiting for the background schedule
+    result = asyncio.run(session_reaper.run_once())
     
-    if result['success']:
-        print(f"✓ Cleared {result['sessions_expired']} expired sessions")
-    else:
-        print(f"✗ Error clearing sessions: {result['error']}")
+    print(f"✓ Expired {result['sessions_expired']} sessions in {result['batches']} batches, "
+          f"released {result['lines_released']} cart lines")
     
     return True
 
@@ -337,8 +374,9 @@ def run_all_tests():
         test_remove_from_cart,
         test_search_alternatives,
         test_get_nutrition_comparison,
+        test_get_cart_nutrition,
         test_checkout_cart,
-        test_clear_expired_sessions
+        test_session_reaper
     ]
     
     results = {}
@@ -434,6 +472,7 @@ def setup_test_data():
         }
     ]
     
+    supabase = repository.inner.client
     for product in test_products:
         try:
             # Check if product exists
@@ -454,6 +493,7 @@ def cleanup_test_data():
     
     try:
         # Mark test user's active cart items as removed
+        supabase = repository.inner.client
         supabase.table('shopping_carts').update({
             'status': 'removed'
         }).eq('user_id', test_user).eq('status', 'active').execute()
@@ -494,8 +534,8 @@ def interactive_test():
                 "remove_from_cart",
                 "search_alternatives",
                 "get_nutrition_comparison",
-                "checkout_cart",
-                "clear_expired_sessions"
+                "get_cart_nutrition",
+                "checkout_cart"
             ]
             for i, tool in enumerate(tools_list, 1):
                 print(f"{i}. {tool}")
@@ -530,10 +570,3 @@ if __name__ == "__main__":
     
     # Option 2: Interactive testing
     interactive_test()
-
-
-
-    # Example usage in LangGraph
-
-# Create tool node
-tool_node = ToolNode(tools)
\ No newline at end of file
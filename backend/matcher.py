@@ -0,0 +1,231 @@
+import re
+from typing import Dict, List, Optional, Set, Tuple
+
+# Multi-word names rewritten to the single word the catalog uses
+PHRASE_SYNONYMS = {
+    "cottage cheese": "paneer",
+    "bell pepper": "capsicum",
+    "lady finger": "okra",
+    "ladies finger": "okra",
+    "gram flour": "besan",
+    "all purpose flour": "maida",
+    "plain flour": "maida",
+    "whole wheat flour": "atta",
+    "wheat flour": "atta",
+    "kidney bean": "rajma",
+    "heavy cream": "cream",
+    "double cream": "cream",
+    "clarified butter": "ghee",
+}
+
+# Spelling variants and Hindi/English names mapped to one canonical token
+TOKEN_SYNONYMS = {
+    "chili": "chilli",
+    "chilly": "chilli",
+    "chile": "chilli",
+    "mirch": "chilli",
+    "cilantro": "coriander",
+    "dhania": "coriander",
+    "brinjal": "eggplant",
+    "aubergine": "eggplant",
+    "yoghurt": "yogurt",
+    "dahi": "curd",
+    "yogurt": "curd",
+    "jeera": "cumin",
+    "haldi": "turmeric",
+    "rava": "sooji",
+    "suji": "sooji",
+    "semolina": "sooji",
+    "garbanzo": "chickpea",
+    "adrak": "ginger",
+    "lahsun": "garlic",
+    "pyaz": "onion",
+    "aloo": "potato",
+    "tamatar": "tomato",
+    "gobi": "cauliflower",
+    "matar": "pea",
+    "pudina": "mint",
+    "gur": "jaggery",
+}
+
+
+def _resolve_chains(synonyms: Dict[str, str]) -> Dict[str, str]:
+    """Point every word at the end of its chain, so one lookup is enough: yoghurt -> yogurt -> curd
+    becomes yoghurt -> curd. A cycle is followed until a word would repeat."""
+    resolved = {}
+    for word, target in synonyms.items():
+        seen = {word}
+        while target in synonyms and target not in seen:
+            seen.add(target)
+            target = synonyms[target]
+        resolved[word] = target
+    return resolved
+
+
+TOKEN_SYNONYMS = _resolve_chains(TOKEN_SYNONYMS)
+
+IRREGULAR_PLURALS = {"leaves": "leaf", "loaves": "loaf", "halves": "half"}
+
+# Quantity and preparation words that never identify a product
+STOPWORDS = {
+    "a", "an", "and", "of", "the", "some", "to", "taste", "for", "fresh", "freshly",
+    "chopped", "sliced", "diced", "minced", "grated", "finely", "large", "small",
+    "medium", "cup", "cups", "tbsp", "tsp", "pinch", "few", "g", "kg", "ml",
+}
+
+# Forms an ingredient comes in (singular, as normalize returns them): 'garam masala powder'
+# is still garam masala, 'garlic cloves' is garlic. Ignored when deciding what a query names.
+FORM_WORDS = {
+    "powder", "leaf", "paste", "cube", "clove", "seed", "puree", "flake", "piece", "stick",
+    "pod", "sprig", "strand", "chunk", "ground", "crushed", "whole", "dried",
+}
+
+_NON_WORD = re.compile(r"[^a-z0-9\s]")
+
+# Token similarity below this counts as no match at all
+MIN_TOKEN_SIMILARITY = 0.5
+
+
+def singularize(token: str) -> str:
+    if token in IRREGULAR_PLURALS:
+        return IRREGULAR_PLURALS[token]
+    if len(token) <= 3:
+        return token
+    if token.endswith("ies"):
+        return token[:-3] + "y"
+    if token.endswith(("oes", "ches", "shes", "sses", "xes")):
+        return token[:-2]
+    if token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def normalize(text: str) -> List[str]:
+    """Lowercase, strip punctuation, apply synonyms and singularize into tokens"""
+    text = _NON_WORD.sub(" ", text.lower())
+    text = " ".join(singularize(token) for token in text.split())
+    for phrase, replacement in PHRASE_SYNONYMS.items():
+        if phrase in text:
+            text = re.sub(rf"\b{phrase}\b", replacement, text)
+    tokens = []
+    for token in text.split():
+        token = TOKEN_SYNONYMS.get(token, token)
+        if token not in STOPWORDS:
+            tokens.append(token)
+    return tokens
+
+
+def trigrams(token: str) -> Set[str]:
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _dice(a: Set[str], b: Set[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return 2 * len(a & b) / (len(a) + len(b))
+
+
+def content_tokens(query: str) -> List[str]:
+    """Normalized tokens of `query` without form words; all of them when nothing else is left ('cloves')"""
+    tokens = normalize(query)
+    return [token for token in tokens if token not in FORM_WORDS] or tokens
+
+
+def name_covers(query: str, name: str, head_only: bool = False) -> bool:
+    """Whether every content token of `query` (only the last one, its head noun, with `head_only`)
+    resembles a word of the product `name`: 'Soy Sauce' does not cover 'fish sauce', 'Butter' has
+    no head for 'butter chicken', and 'Garam Masala' covers 'garam masala powder'"""
+    tokens = content_tokens(query)
+    if head_only:
+        tokens = tokens[-1:]
+    words = [trigrams(word) for word in set(normalize(name)) | set(_NON_WORD.sub(" ", name.lower()).split())]
+    return bool(tokens) and all(
+        any(_dice(trigrams(token), grams) >= MIN_TOKEN_SIMILARITY for grams in words) for token in tokens
+    )
+
+
+class ProductMatcher:
+    """Ranked fuzzy matcher from free-text ingredient names to catalog products.
+
+    Each product is indexed under the normalized tokens of its name, including
+    aliases in parentheses ("Spinach (Palak)"). A trigram index over the token
+    vocabulary finds similar tokens for each query token, and only products
+    containing one of those tokens are scored.
+    """
+
+    def __init__(self, products: List[dict]):
+        self._products: List[dict] = []
+        self._tokens: List[Set[str]] = []
+        self._variants: List[List[List[str]]] = []
+        self._token_grams: Dict[str, Set[str]] = {}
+        self._token_products: Dict[str, Set[int]] = {}
+        self._gram_tokens: Dict[str, Set[str]] = {}
+
+        for product in products:
+            name = product.get("item_name") or ""
+            tokens = normalize(name)
+            if not tokens:
+                continue
+            position = len(self._products)
+            self._products.append(product)
+            self._tokens.append(set(tokens))
+            # "Sooji (Semolina/Rava)" names one product three ways; each is a variant
+            variants = [normalize(part) for part in re.split(r"[()/]", name)]
+            self._variants.append([variant for variant in variants if variant])
+            for token in tokens:
+                self._token_products.setdefault(token, set()).add(position)
+                if token not in self._token_grams:
+                    self._token_grams[token] = trigrams(token)
+                    for gram in self._token_grams[token]:
+                        self._gram_tokens.setdefault(gram, set()).add(token)
+
+    def __len__(self) -> int:
+        return len(self._products)
+
+    def _similar_tokens(self, token: str) -> Dict[str, float]:
+        """Catalog tokens resembling `token`, with their trigram similarity"""
+        grams = trigrams(token)
+        nearby: Set[str] = set()
+        for gram in grams:
+            nearby.update(self._gram_tokens.get(gram, ()))
+
+        similar = {}
+        for other in nearby:
+            value = 1.0 if other == token else _dice(grams, self._token_grams[other])
+            if value >= MIN_TOKEN_SIMILARITY:
+                similar[other] = value
+        return similar
+
+    @staticmethod
+    def _matched(similar: Dict[str, Dict[str, float]], candidates) -> float:
+        return sum(max((scores.get(other, 0.0) for other in candidates), default=0.0)
+                   for scores in similar.values())
+
+    def match(self, query: str, top_k: int = 10, category: Optional[str] = None,
+              min_score: float = 0.55) -> List[Tuple[dict, float]]:
+        """Return up to top_k (product, score) pairs ordered by descending score"""
+        similar = {token: self._similar_tokens(token) for token in normalize(query)}
+        if not similar:
+            return []
+
+        candidates: Set[int] = set()
+        for scores in similar.values():
+            for other in scores:
+                candidates.update(self._token_products[other])
+
+        scored = []
+        for position in candidates:
+            product = self._products[position]
+            if category and product.get("category") != category:
+                continue
+            # Coverage of what was asked, plus a smaller reward for naming one variant exactly
+            coverage = self._matched(similar, self._tokens[position]) / len(similar)
+            precision = max(min(1.0, self._matched(similar, variant) / len(variant))
+                            for variant in self._variants[position])
+            score = 0.7 * coverage + 0.3 * precision
+            if score >= min_score:
+                scored.append((product, round(score, 3)))
+
+        scored.sort(key=lambda pair: (-pair[1], pair[0].get("item_name") or ""))
+        return scored[:top_k]
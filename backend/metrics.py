@@ -0,0 +1,183 @@
+import re
+import time
+import inspect
+import functools
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest
+
+from context import approx_tokens
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+DB_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+COUNT_BUCKETS = (0, 1, 2, 3, 4, 5, 8, 12, 20, 50)
+BYTE_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768, 65536)
+
+TOOL_DURATION = Histogram(
+    "cartbot_tool_duration_seconds", "Time spent in each agent tool", ["tool"], buckets=LATENCY_BUCKETS
+)
+TOOL_CALLS = Counter(
+    "cartbot_tool_calls_total", "Agent tool calls by outcome", ["tool", "outcome"]
+)
+TOOL_DB_ROUND_TRIPS = Histogram(
+    "cartbot_tool_db_round_trips", "Repository round trips made by one tool call", ["tool"], buckets=COUNT_BUCKETS
+)
+TOOL_RESULT_BYTES = Histogram(
+    "cartbot_tool_result_bytes", "Size of each tool result sent to the LLM", ["tool"], buckets=BYTE_BUCKETS
+)
+TOOL_RESULT_TOKENS = Histogram(
+    "cartbot_tool_result_tokens", "Estimated prompt tokens of each tool result", ["tool"],
+    buckets=tuple(size // 4 for size in BYTE_BUCKETS)
+)
+DB_CALL_DURATION = Histogram(
+    "cartbot_db_call_duration_seconds", "Latency of each repository call", ["method"], buckets=DB_LATENCY_BUCKETS
+)
+LLM_DURATION = Histogram(
+    "cartbot_llm_duration_seconds", "Latency of LLM calls", ["model"], buckets=LATENCY_BUCKETS
+)
+LLM_TOKENS = Counter(
+    "cartbot_llm_tokens_total", "Tokens consumed by LLM calls", ["model", "kind"]
+)
+TURN_DURATION = Histogram(
+    "cartbot_turn_duration_seconds", "End-to-end latency of one chat turn", ["mode"], buckets=LATENCY_BUCKETS
+)
+TURN_GRAPH_STEPS = Histogram(
+    "cartbot_turn_graph_steps", "Graph steps (agent and tool node runs) per chat turn", buckets=COUNT_BUCKETS
+)
+ROUTER_DECISIONS = Counter(
+    "cartbot_router_decisions_total", "Intent router outcomes per turn; 'llm' means the agent LLM decided", ["intent"]
+)
+REAPER_BATCH_DURATION = Histogram(
+    "cartbot_reaper_batch_duration_seconds", "Latency of each session-reaper batch", buckets=DB_LATENCY_BUCKETS
+)
+REAPER_ROWS = Counter(
+    "cartbot_reaper_rows_total", "Rows changed by the session reaper: expired sessions and released cart lines", ["kind"]
+)
+REAPER_RUNS = Counter(
+    "cartbot_reaper_runs_total", "Session-reaper runs by outcome", ["outcome"]
+)
+
+# Round trips made by the tool currently running in this context
+_tool_round_trips: contextvars.ContextVar[Optional[list]] = contextvars.ContextVar("tool_round_trips", default=None)
+
+
+def observe_db_call(method: str, seconds: float) -> None:
+    """Repository observer: record call latency and charge the round trip to the running tool"""
+    DB_CALL_DURATION.labels(method).observe(seconds)
+    counter = _tool_round_trips.get()
+    if counter is not None:
+        counter[0] += 1
+
+
+# Tools report failures in their JSON result rather than raising; results may be compact JSON
+_FAILED = re.compile(r'"success": ?false|"error": ?')
+
+
+def _outcome(result: Any) -> str:
+    if isinstance(result, str) and _FAILED.search(result):
+        return "error"
+    return "success"
+
+
+def observe_tool_result(name: str, result: Any) -> None:
+    if isinstance(result, str):
+        TOOL_RESULT_BYTES.labels(name).observe(len(result.encode("utf-8")))
+        TOOL_RESULT_TOKENS.labels(name).observe(approx_tokens(result))
+
+
+def timed_tool(func: Callable, name: Optional[str] = None) -> Callable:
+    """Record duration, outcome, result size and repository round trips of a sync or async tool function; apply under @tool"""
+    name = name or func.__name__
+
+    def start():
+        return _tool_round_trips.set([0]), time.perf_counter()
+
+    def finish(token, started: float, outcome: str, result: Any = None) -> None:
+        TOOL_DURATION.labels(name).observe(time.perf_counter() - started)
+        TOOL_CALLS.labels(name, outcome).inc()
+        TOOL_DB_ROUND_TRIPS.labels(name).observe(_tool_round_trips.get()[0])
+        observe_tool_result(name, result)
+        _tool_round_trips.reset(token)
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def awrapper(*args, **kwargs):
+            token, started = start()
+            outcome, result = "exception", None
+            try:
+                result = await func(*args, **kwargs)
+                outcome = _outcome(result)
+                return result
+            finally:
+                finish(token, started, outcome, result)
+
+        return awrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        token, started = start()
+        outcome, result = "exception", None
+        try:
+            result = func(*args, **kwargs)
+            outcome = _outcome(result)
+            return result
+        finally:
+            finish(token, started, outcome, result)
+
+    return wrapper
+
+
+def observe_llm_call(model: str, seconds: float, response: Any) -> None:
+    """Record the latency and token usage of one LLM response"""
+    LLM_DURATION.labels(model).observe(seconds)
+    usage: Dict[str, int] = getattr(response, "usage_metadata", None) or {}
+    if usage.get("input_tokens"):
+        LLM_TOKENS.labels(model, "input").inc(usage["input_tokens"])
+    if usage.get("output_tokens"):
+        LLM_TOKENS.labels(model, "output").inc(usage["output_tokens"])
+
+
+def observe_route(intent: str) -> None:
+    ROUTER_DECISIONS.labels(intent).inc()
+
+
+def observe_reaper_batch(seconds: float, sessions: int, lines: int) -> None:
+    REAPER_BATCH_DURATION.observe(seconds)
+    REAPER_ROWS.labels("sessions").inc(sessions)
+    REAPER_ROWS.labels("cart_lines").inc(lines)
+
+
+def observe_reaper_run(outcome: str) -> None:
+    REAPER_RUNS.labels(outcome).inc()
+
+
+class GraphStepCounter(BaseCallbackHandler):
+    """Callback that collects the distinct graph steps a run goes through"""
+
+    def __init__(self):
+        self.steps = set()
+
+    def on_chain_start(self, serialized: Any, inputs: Any, *, metadata: Optional[dict] = None, **kwargs: Any) -> None:
+        step = (metadata or {}).get("langgraph_step")
+        if step is not None:
+            self.steps.add(step)
+
+
+@contextmanager
+def track_turn(mode: str):
+    """Time one chat turn; pass the yielded counter in the run's callbacks to count its graph steps"""
+    counter = GraphStepCounter()
+    started = time.perf_counter()
+    try:
+        yield counter
+    finally:
+        TURN_DURATION.labels(mode).observe(time.perf_counter() - started)
+        TURN_GRAPH_STEPS.observe(len(counter.steps))
+
+
+def render_latest() -> tuple:
+    """Current metrics in the Prometheus text format, with its content type"""
+    return generate_latest(), CONTENT_TYPE_LATEST
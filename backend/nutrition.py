@@ -0,0 +1,165 @@
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# Nutrition columns of the products table, all per 100 g (or 100 ml) of product
+FIELDS = ("calories_per_100g", "protein_g", "fat_g", "carbs_g", "sugar_g")
+# Keys for the amounts in a given weight of product, one per entry of FIELDS
+AMOUNTS = ("kcal", "protein_g", "fat_g", "carbs_g", "sugar_g")
+# Short nutrient names accepted by the tools, e.g. "sugar" -> "sugar_g"
+NUTRIENTS = {"calories": "calories_per_100g", "protein": "protein_g", "fat": "fat_g", "carbs": "carbs_g", "sugar": "sugar_g"}
+# Grams per pack unit; millilitres count as grams. Count units (piece, bags) have no known weight.
+UNIT_GRAMS = {
+    "g": 1, "gram": 1, "grams": 1, "kg": 1000,
+    "ml": 1, "l": 1000, "liter": 1000, "liters": 1000, "litre": 1000, "litres": 1000,
+}
+
+
+def nutrient_field(name: str) -> str:
+    """Column for a nutrient name ('sugar', 'sugar_g', 'calories'); raises ValueError for unknown ones"""
+    field = NUTRIENTS.get((name or "").strip().lower(), (name or "").strip().lower())
+    if field not in FIELDS:
+        raise ValueError(f"Unknown nutrient '{name}', expected one of: {', '.join(NUTRIENTS)}")
+    return field
+
+
+def _number(value) -> float:
+    """A catalog value as a float, NaN when it is missing"""
+    return np.nan if value is None or value == "" else float(value)
+
+
+def _value(number: float) -> Optional[float]:
+    """Inverse of _number, for results: NaN becomes None"""
+    return None if np.isnan(number) else float(number)
+
+
+class NutritionStore:
+    """Columnar copy of the catalog's nutrition data for vectorized comparisons.
+
+    Active products are held as one float64 matrix with a row per SKU and a column
+    per entry of FIELDS (NaN where the catalog has no value), next to a vector of
+    pack weights in grams (NaN for count units). `sync(rows)` rebuilds both from a
+    (re)loaded catalog and swaps them in at once. Ranking, filtering,
+    per-ingredient picks and cart totals are then array operations over the rows
+    they need. Missing values never win a ranking or pick, and totals report them
+    instead of counting them as 0.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (row index by SKU, SKUs, values, pack grams), replaced as a whole on sync
+        self._state: Tuple[Dict[str, int], List[str], np.ndarray, np.ndarray] = (
+            {}, [], np.zeros((0, len(FIELDS))), np.zeros(0))
+        self.syncs = 0
+
+    def __len__(self) -> int:
+        return len(self._state[1])
+
+    def sync(self, rows: List[dict]) -> None:
+        """Rebuild the columns from a (re)loaded catalog"""
+        active = [row for row in rows if row.get("is_active", True)]
+        skus = [row["sku"] for row in active]
+        values = np.array([[_number(row.get(field)) for field in FIELDS] for row in active],
+                          dtype=np.float64).reshape(len(active), len(FIELDS))
+        grams = np.array([float(row.get("quantity") or 0) * UNIT_GRAMS.get((row.get("unit") or "").lower(), np.nan)
+                          for row in active], dtype=np.float64)
+        with self._lock:
+            self._state = ({sku: index for index, sku in enumerate(skus)}, skus, values, grams)
+            self.syncs += 1
+
+    def _select(self, skus: Iterable[str]) -> Tuple[List[str], np.ndarray, np.ndarray, np.ndarray]:
+        """Known SKUs in request order (first occurrence), their row indexes, and the matrices they index"""
+        row_of, _, values, grams = self._state
+        found = [sku for sku in dict.fromkeys(skus) if sku in row_of]
+        return found, np.array([row_of[sku] for sku in found], dtype=np.intp), values, grams
+
+    def per_100g(self, skus: Iterable[str]) -> Dict[str, Dict[str, float]]:
+        """{sku: {field: value per 100 g, None if unknown}} for the known SKUs, in request order"""
+        found, rows, values, _ = self._select(skus)
+        return {sku: dict(zip(FIELDS, map(_value, values[row]))) for sku, row in zip(found, rows)}
+
+    def rank(self, skus: Iterable[str], nutrient: str, highest: bool = False) -> List[Tuple[str, float]]:
+        """(sku, value per 100 g) for the known SKUs, lowest first (highest first with `highest`);
+        SKUs without a value come last, with None"""
+        column = FIELDS.index(nutrient_field(nutrient))
+        found, rows, values, _ = self._select(skus)
+        scores = values[rows, column]
+        # Stable, so ties keep the request order; argsort puts NaN last either way
+        order = np.argsort(-scores if highest else scores, kind="stable")
+        return [(found[index], _value(scores[index])) for index in order]
+
+    def filter(self, skus: Optional[Iterable[str]] = None, max_values: Optional[Dict[str, float]] = None,
+               min_values: Optional[Dict[str, float]] = None) -> List[str]:
+        """SKUs (all active ones by default) within every per-100 g bound, e.g. max_values={"sugar": 5};
+        a SKU without a value for a bounded nutrient is left out"""
+        if skus is None:
+            skus = self._state[1]
+        found, rows, values, _ = self._select(skus)
+        selected = values[rows]
+        keep = np.ones(len(found), dtype=bool)
+        for bounds, compare in ((max_values, np.less_equal), (min_values, np.greater_equal)):
+            for nutrient, bound in (bounds or {}).items():
+                keep &= compare(selected[:, FIELDS.index(nutrient_field(nutrient))], bound)
+        return [sku for sku, kept in zip(found, keep) if kept]
+
+    def best_per_group(self, groups: Dict[str, List[str]], nutrient: str,
+                       highest: bool = False) -> Dict[str, Optional[Tuple[str, float]]]:
+        """For each group of candidate SKUs (e.g. the options for one ingredient), the (sku, value) that is
+        lowest in `nutrient` (highest with `highest`), or None when no candidate has a value; one sort for all groups"""
+        column = FIELDS.index(nutrient_field(nutrient))
+        row_of, skus, values, _ = self._state
+        names = list(groups)
+        group_ids = np.array([group for group, name in enumerate(names) for sku in groups[name] if sku in row_of],
+                             dtype=np.intp)
+        rows = np.array([row_of[sku] for name in names for sku in groups[name] if sku in row_of], dtype=np.intp)
+        best: Dict[str, Optional[Tuple[str, float]]] = dict.fromkeys(names)
+        # Candidates without a value for the nutrient cannot be compared
+        known = ~np.isnan(values[rows, column])
+        group_ids, rows = group_ids[known], rows[known]
+        if not len(rows):
+            return best
+        scores = values[rows, column]
+        # Sorted by group, then by value; the first entry of each group is its best
+        order = np.lexsort((-scores if highest else scores, group_ids))
+        groups_sorted = group_ids[order]
+        _, first = np.unique(groups_sorted, return_index=True)
+        for index in order[first]:
+            best[names[group_ids[index]]] = (skus[rows[index]], float(scores[index]))
+        return best
+
+    def totals(self, lines: Iterable[Tuple[str, float]]) -> Dict[str, object]:
+        """Nutrition of (sku, pack count) lines, weighted by pack weight.
+
+        Returns per-line grams and nutrient amounts (keyed by AMOUNTS, None where the catalog
+        has no value), their totals over the known amounts, `missing` ({sku: amount keys
+        left out of the totals}), and the SKUs left out entirely: `unweighted` (packs
+        counted in pieces or bags) and `unknown` (not in the catalog).
+        """
+        lines = list(lines)
+        row_of, _, values, grams = self._state
+        known = [(sku, quantity) for sku, quantity in lines if sku in row_of]
+        rows = np.array([row_of[sku] for sku, _ in known], dtype=np.intp)
+        packs = np.array([float(quantity) for _, quantity in known], dtype=np.float64)
+        line_grams = packs * grams[rows]
+        weighted = ~np.isnan(line_grams)
+        # (lines x 1) grams / 100 times (lines x fields) per-100 g values
+        amounts = np.where(weighted[:, None], np.nan_to_num(line_grams)[:, None] / 100.0 * values[rows], 0.0)
+        missing = np.isnan(amounts)
+        return {
+            "grams": float(np.nan_to_num(line_grams).sum()),
+            "totals": dict(zip(AMOUNTS, map(float, np.nansum(amounts, axis=0)))),
+            "lines": [
+                {"sku": sku, "grams": float(line_grams[index]), **dict(zip(AMOUNTS, map(_value, amounts[index])))}
+                for index, (sku, _) in enumerate(known) if weighted[index]
+            ],
+            "missing": {
+                sku: [key for key, absent in zip(AMOUNTS, missing[index]) if absent]
+                for index, (sku, _) in enumerate(known) if missing[index].any()
+            },
+            "unweighted": [sku for index, (sku, _) in enumerate(known) if not weighted[index]],
+            "unknown": [sku for sku, _ in lines if sku not in row_of],
+        }
+
+    def stats(self) -> Dict[str, int]:
+        return {"products": len(self), "fields": len(FIELDS), "syncs": self.syncs}
@@ -0,0 +1,170 @@
+import os
+import json
+from typing import Any, Callable, Dict, List
+
+# "compact" trims every tool result for the prompt; "full" sends the raw result as before
+TOOL_RESULT_MODE = os.getenv("TOOL_RESULT_MODE", "compact")
+# Product options listed per result, and cart lines per cart, before the rest is summarized as "more"
+MAX_OPTIONS = int(os.getenv("TOOL_RESULT_MAX_OPTIONS", "5"))
+MAX_CART_LINES = int(os.getenv("TOOL_RESULT_MAX_CART_LINES", "25"))
+
+# Columns kept from a product row, as {column: key in the compact result}. Keys the
+# router and prompt rely on (sku, item_name, brand, price) keep their names.
+PRODUCT_FIELDS = {
+    "option": "option", "sku": "sku", "item_name": "item_name", "brand": "brand", "price": "price", "quantity": "qty",
+    "unit": "unit", "stock_quantity": "stock", "match_score": "score", "approximate": "approximate",
+}
+CART_LINE_FIELDS = {
+    "sku": "sku", "product_name": "product_name", "brand": "brand", "quantity": "quantity",
+    "unit_price": "unit_price", "total_price": "total_price",
+}
+NUTRITION_FIELDS = {
+    "calories_per_100g": "kcal", "protein_g": "protein_g", "fat_g": "fat_g", "carbs_g": "carbs_g", "sugar_g": "sugar_g",
+}
+CART_NUTRITION_FIELDS = {
+    "sku": "sku", "product_name": "product_name", "grams": "grams", "kcal": "kcal", "protein_g": "protein_g",
+    "fat_g": "fat_g", "carbs_g": "carbs_g", "sugar_g": "sugar_g",
+}
+
+
+def dumps(value: Any) -> str:
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+
+def project(row: dict, fields: Dict[str, str]) -> dict:
+    """Keep the listed columns of a row under their compact keys, dropping empty values"""
+    return {key: row[column] for column, key in fields.items() if row.get(column) not in (None, "")}
+
+
+def cap(rows: List[dict], fields: Dict[str, str], limit: int) -> Dict[str, Any]:
+    """{"rows": first `limit` rows projected, "more": how many were left out (only when some were)}"""
+    capped = {"rows": [project(row, fields) for row in rows[:limit]]}
+    if len(rows) > limit:
+        capped["more"] = len(rows) - limit
+    return capped
+
+
+def _availability(result: dict) -> dict:
+    capped = cap(result.get("options") or [], PRODUCT_FIELDS, MAX_OPTIONS)
+    compact = {**result, "options": capped["rows"]}
+    if "more" in capped:
+        compact["more"] = capped["more"]
+    return compact
+
+
+def _batch_availability(result: dict) -> dict:
+    return {**result, "results": {name: _availability(entry) for name, entry in result.get("results", {}).items()}}
+
+
+def _session(result: dict) -> dict:
+    return {key: result[key] for key in ("success", "session_id") if key in result}
+
+
+def _comparison(products: list) -> list:
+    compact = []
+    for product in products:
+        row = project(product, PRODUCT_FIELDS)
+        row.update(project(product.get("nutritional_info") or {}, NUTRITION_FIELDS))
+        if product.get("allergens"):
+            row["allergens"] = product["allergens"]
+        compact.append(row)
+    return compact
+
+
+def _cart_line(result: dict) -> dict:
+    if isinstance(result.get("data"), dict):
+        return {**result, "data": project(result["data"], CART_LINE_FIELDS)}
+    return result
+
+
+def _cart(result: dict) -> dict:
+    compact = {key: value for key, value in result.items() if key not in ("user_id", "items")}
+    if "items" in result:
+        capped = cap(result["items"], CART_LINE_FIELDS, MAX_CART_LINES)
+        compact["items"] = capped["rows"]
+        if "more" in capped:
+            compact["more"] = capped["more"]
+    return compact
+
+
+def _alternatives(products: list) -> list:
+    return [project(product, PRODUCT_FIELDS) for product in products[:MAX_OPTIONS]]
+
+
+def _checkout(result: dict) -> dict:
+    # The order UUID is never shown to the user; the order number is
+    return {key: value for key, value in result.items() if key != "order_id"}
+
+
+def _nutrition(products: list) -> list:
+    compact = []
+    for product in products:
+        row = {"sku": product.get("sku"), "name": product.get("name")}
+        row.update(project(product.get("nutrition_per_100g") or {}, NUTRITION_FIELDS))
+        if product.get("allergens") and product["allergens"] != ["None"]:
+            row["allergens"] = product["allergens"]
+        compact.append(row)
+    return compact
+
+
+def _best_nutrition(result: dict) -> dict:
+    results = {}
+    for name, product in result.get("results", {}).items():
+        row = project(product, PRODUCT_FIELDS)
+        row.update(project(product, NUTRITION_FIELDS))
+        row["options_compared"] = product.get("options_compared")
+        results[name] = row
+    return {**result, "results": results}
+
+
+def _cart_nutrition(result: dict) -> dict:
+    compact = {key: value for key, value in result.items() if key not in ("user_id", "items", "not_counted", "missing_data")}
+    capped = cap(result.get("items") or [], CART_NUTRITION_FIELDS, MAX_CART_LINES)
+    compact["items"] = capped["rows"]
+    if "more" in capped:
+        compact["more"] = capped["more"]
+    for key in ("not_counted", "missing_data"):
+        if result.get(key):
+            compact[key] = result[key]
+    return compact
+
+
+# Per-tool compaction of the full result; tools not listed are only re-serialized compactly
+COMPACTORS: Dict[str, Callable[[Any], Any]] = {
+    "check_ingredient_availability": _availability,
+    "check_ingredients_availability": _batch_availability,
+    "create_cart_session": _session,
+    "get_product_details_for_comparison": _comparison,
+    "add_to_cart": _cart_line,
+    "update_cart_quantity": _cart_line,
+    "get_user_cart": _cart,
+    "search_alternatives": _alternatives,
+    "checkout_cart": _checkout,
+    "get_nutrition_comparison": _nutrition,
+    "find_best_nutrition_options": _best_nutrition,
+    "get_cart_nutrition": _cart_nutrition,
+}
+
+
+def number_options(tool_name: str, result: Any) -> Any:
+    """Give each product the user can pick from its number ("option": 1, 2, ...), in result order.
+
+    The assistant lists options under these numbers and the intent router resolves a
+    reply like "2" against them, so both agree on what "2" means.
+    """
+    if tool_name == "check_ingredient_availability" and isinstance(result, dict) and result.get("options"):
+        return {**result, "options": [{**option, "option": number} for number, option in enumerate(result["options"], 1)]}
+    if tool_name == "search_alternatives" and isinstance(result, list):
+        return [{**option, "option": number} for number, option in enumerate(result, 1)]
+    return result
+
+
+def tool_result(tool_name: str, result: Any, full: bool = False) -> str:
+    """Serialize a tool result for the LLM: compacted unless `full` is requested or TOOL_RESULT_MODE=full"""
+    result = number_options(tool_name, result)
+    if full or TOOL_RESULT_MODE == "full":
+        return json.dumps(result)
+    compactor = COMPACTORS.get(tool_name)
+    if compactor is not None and isinstance(result, (dict, list)):
+        result = compactor(result)
+    return dumps(result)
@@ -0,0 +1,88 @@
+import time
+import random
+import asyncio
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from metrics import observe_reaper_batch, observe_reaper_run
+
+
+class SessionReaper:
+    """Background expiry of cart sessions, releasing the active cart lines of each.
+
+    Every `interval` seconds, spread by up to +/- `jitter` of the interval so
+    workers started together do not reap in lockstep, one run calls
+    `repository.expire_sessions_batch(now, batch_size)` until a batch comes back
+    short or `max_batches` batches have run. Each batch is one short transaction
+    over at most `batch_size` sessions, with a `pause` between batches. The
+    released lines are also dropped from the in-memory carts of `cart_store`.
+    """
+
+    def __init__(self, repository, cart_store, interval: float = 300, jitter: float = 0.2,
+                 batch_size: int = 500, max_batches: int = 20, pause: float = 0.05):
+        self._repository = repository
+        self._cart_store = cart_store
+        self.interval = interval
+        self.jitter = jitter
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self.pause = pause
+        self.runs = 0
+        self.failures = 0
+        self.batches = 0
+        self.sessions_expired = 0
+        self.lines_released = 0
+        self.last_run: Optional[str] = None
+
+    def next_delay(self) -> float:
+        return self.interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    async def run_once(self) -> Dict[str, int]:
+        """Expire everything that had expired when the run started, in bounded batches"""
+        now = datetime.now().isoformat()
+        totals = {"batches": 0, "sessions_expired": 0, "lines_released": 0}
+        for _ in range(self.max_batches):
+            started = time.perf_counter()
+            result = await self._repository.aexpire_sessions_batch(now, self.batch_size)
+            observe_reaper_batch(time.perf_counter() - started, result["sessions_expired"], result["lines_released"])
+            self._cart_store.release_sessions(result["session_ids"])
+            totals["batches"] += 1
+            totals["sessions_expired"] += result["sessions_expired"]
+            totals["lines_released"] += result["lines_released"]
+            if result["sessions_expired"] < self.batch_size:
+                break
+            # Leave room for other queries between batches
+            await asyncio.sleep(self.pause)
+
+        self.runs += 1
+        self.batches += totals["batches"]
+        self.sessions_expired += totals["sessions_expired"]
+        self.lines_released += totals["lines_released"]
+        self.last_run = now
+        return totals
+
+    async def run(self) -> None:
+        """Background task: run_once every interval (with jitter); a failed run is retried at the next one"""
+        while True:
+            await asyncio.sleep(self.next_delay())
+            try:
+                totals = await self.run_once()
+                observe_reaper_run("success")
+                if totals["sessions_expired"]:
+                    print(f"Expired {totals['sessions_expired']} sessions, released {totals['lines_released']} cart lines")
+            except Exception as e:
+                self.failures += 1
+                observe_reaper_run("error")
+                print(f"Session reaper error: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "interval_seconds": self.interval,
+            "batch_size": self.batch_size,
+            "runs": self.runs,
+            "failures": self.failures,
+            "batches": self.batches,
+            "sessions_expired": self.sessions_expired,
+            "lines_released": self.lines_released,
+            "last_run": self.last_run
+        }
@@ -0,0 +1,172 @@
+import os
+import re
+import json
+import time
+import asyncio
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+# Words that only frame the request ("I want to make ... for dinner") and don't change the recipe
+FILLER_WORDS = {
+    "i", "id", "im", "we", "want", "wanna", "would", "like", "love", "to", "make", "cook", "prepare",
+    "let", "lets", "us", "please", "recipe", "for", "a", "an", "the", "some", "me", "help", "can",
+    "could", "you", "how", "do", "today", "tonight", "dinner", "lunch", "breakfast", "need",
+    "ingredients", "of", "going", "planning", "try",
+}
+
+_NON_WORD = re.compile(r"[^a-z0-9\s]")
+# Relative cache paths are resolved here, not against the process working directory
+CACHE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def normalize_recipe_request(recipe_request: str) -> str:
+    """Reduce a free-text recipe request to a stable cache key, e.g. 'I want to make Pasta!' -> 'pasta'"""
+    words = _NON_WORD.sub(" ", recipe_request.lower().replace("'", "")).split()
+    key = " ".join(word for word in words if word not in FILLER_WORDS)
+    return key or " ".join(words)
+
+
+class RecipeCache:
+    """Two-level cache of recipe ingredient extractions.
+
+    An in-memory LRU of `max_memory_entries` sits in front of an optional SQLite
+    file shared by all workers and kept across restarts. Entries older than
+    `ttl_seconds` are ignored and the file is trimmed to `max_disk_entries`,
+    least recently used first.
+
+    The file is opened on first use. A relative `path` is resolved against this
+    module's directory. `aget`/`aput` serve memory hits inline and run the SQLite
+    reads and writes in a worker thread, off the event loop.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_memory_entries: int = 256,
+                 max_disk_entries: int = 5000, ttl_seconds: float = 30 * 24 * 3600):
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl_seconds = ttl_seconds
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Held for SQLite work only, so memory lookups never wait on disk I/O
+        self._db_lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._miss_latency_total = 0.0
+        self._miss_latency_count = 0
+
+        self.path = os.path.join(CACHE_DIR, path) if path and path != ":memory:" else path or None
+        self._db: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        """The SQLite connection, opened and set up on first use; call with _db_lock held"""
+        if self._db is None:
+            db = sqlite3.connect(self.path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS recipe_ingredients ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            db.commit()
+            self._db = db
+        return self._db
+
+    def get(self, recipe_request: str) -> Optional[dict]:
+        key = normalize_recipe_request(recipe_request)
+        value = self._memory_get(key)
+        return value if value is not None else self._disk_get(key)
+
+    async def aget(self, recipe_request: str) -> Optional[dict]:
+        key = normalize_recipe_request(recipe_request)
+        value = self._memory_get(key)
+        return value if value is not None else await asyncio.to_thread(self._disk_get, key)
+
+    def put(self, recipe_request: str, value: dict, latency_seconds: Optional[float] = None) -> None:
+        """Store an extraction; latency_seconds is the LLM time it took, used to report savings"""
+        key, now = self._memory_put(recipe_request, value, latency_seconds)
+        self._disk_put(key, value, now)
+
+    async def aput(self, recipe_request: str, value: dict, latency_seconds: Optional[float] = None) -> None:
+        key, now = self._memory_put(recipe_request, value, latency_seconds)
+        await asyncio.to_thread(self._disk_put, key, value, now)
+
+    def _memory_get(self, key: str) -> Optional[dict]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry and now - entry[0] < self.ttl_seconds:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return entry[1]
+            if self.path is None:
+                self.misses += 1
+            return None
+
+    def _disk_get(self, key: str) -> Optional[dict]:
+        """Look a key up in the file after a memory miss; blocking"""
+        if self.path is None:
+            return None
+        now = time.time()
+        with self._db_lock:
+            db = self._connect()
+            row = db.execute(
+                "SELECT value, created_at FROM recipe_ingredients WHERE key = ? AND created_at > ?",
+                (key, now - self.ttl_seconds)
+            ).fetchone()
+            if row:
+                db.execute("UPDATE recipe_ingredients SET last_used = ? WHERE key = ?", (now, key))
+                db.commit()
+        with self._lock:
+            if not row:
+                self.misses += 1
+                return None
+            value = json.loads(row[0])
+            self._remember(key, row[1], value)
+            self.disk_hits += 1
+            return value
+
+    def _memory_put(self, recipe_request: str, value: dict, latency_seconds: Optional[float]):
+        key = normalize_recipe_request(recipe_request)
+        now = time.time()
+        with self._lock:
+            if latency_seconds is not None:
+                self._miss_latency_total += latency_seconds
+                self._miss_latency_count += 1
+            self._remember(key, now, value)
+        return key, now
+
+    def _disk_put(self, key: str, value: dict, now: float) -> None:
+        """Write an entry through to the file and trim it; blocking"""
+        if self.path is None:
+            return
+        with self._db_lock:
+            db = self._connect()
+            db.execute(
+                "INSERT OR REPLACE INTO recipe_ingredients (key, value, created_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now, now)
+            )
+            db.execute(
+                "DELETE FROM recipe_ingredients WHERE key IN ("
+                "SELECT key FROM recipe_ingredients ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_disk_entries,)
+            )
+            db.commit()
+
+    def _remember(self, key: str, created_at: float, value: dict) -> None:
+        self._memory[key] = (created_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def stats(self) -> Dict[str, float]:
+        hits = self.memory_hits + self.disk_hits
+        average_miss = self._miss_latency_total / self._miss_latency_count if self._miss_latency_count else 0.0
+        return {
+            "memory_entries": len(self._memory),
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "average_miss_latency_seconds": round(average_miss, 3),
+            "saved_latency_seconds": round(hits * average_miss, 3)
+        }
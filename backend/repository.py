@@ -0,0 +1,607 @@
+import os
+import re
+import asyncio
+import inspect
+import json
+import uuid
+import sqlite3
+import time
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+SCHEMA_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SQL_FILES = (
+    os.path.join(SCHEMA_DIR, "supabase.sql"),
+    os.path.join(SCHEMA_DIR, "product_catelogue.sql"),
+)
+
+
+class Repository(ABC):
+    """Data access used by the agent tools.
+
+    Every method corresponds to one round trip against the backing store, so
+    tool logic can be measured separately from network latency. Each method has
+    an async twin prefixed with "a"; by default it runs the sync method in a
+    worker thread, and backends with a native async client override it.
+    """
+
+    # products
+    @abstractmethod
+    def list_products(self) -> List[dict]:
+        """All rows of the products table, active or not"""
+
+    # cart_sessions
+    @abstractmethod
+    def create_session(self, session: dict) -> dict:
+        """Insert a cart session and return the stored row"""
+
+    @abstractmethod
+    def expire_sessions_batch(self, now: str, limit: int) -> dict:
+        """Deactivate up to `limit` sessions that expired before `now`, oldest first, and mark their
+        active cart lines 'expired', in one transaction (see expire_sessions_batch in supabase.sql).
+
+        Returns {"sessions_expired": int, "lines_released": int, "session_ids": [...]}.
+        """
+
+    # shopping_carts
+    @abstractmethod
+    def add_cart_item(self, user_id: str, session_id: str, sku: str, quantity: int,
+                      product_name: str, brand: str, unit_price: float, notes: str = "") -> dict:
+        """Add-or-increment the active line for (user_id, session_id, sku); the session must be active and unexpired.
+
+        Returns {"success": True, "inserted": bool, "data": row, "session_expires_at": str}
+        or {"success": False, "error": str}.
+        """
+
+    @abstractmethod
+    def get_cart(self, user_id: str, status: str = "active") -> List[dict]:
+        """Cart lines for a user with the given status"""
+
+    @abstractmethod
+    def cart_summary(self, user_id: str, status: str = "active") -> dict:
+        """Totals and projected lines of a user's cart, aggregated by the database (see get_cart_summary in supabase.sql).
+
+        Returns {"item_count", "total_items", "total_price", "brands_summary", "items"}.
+        """
+
+    @abstractmethod
+    def apply_cart_changes(self, user_id: str, changes: List[dict]) -> dict:
+        """Persist absolute cart line states in one transaction (see apply_cart_changes in supabase.sql).
+
+        Lines whose stored row is no longer active (purchased, expired), and edits to
+        sessions that are inactive or expired, are skipped.
+        Returns {"success": True, "applied": int, "stale": [line ids skipped]} or {"success": False, "error": str}.
+        """
+
+    # orders / order_items
+    @abstractmethod
+    def checkout(self, user_id: str, shipping_address: str, delivery_date: str,
+                 special_instructions: str = "") -> dict:
+        """Atomically turn the active cart into an order; same result shape as the checkout_cart RPC"""
+
+    async def alist_products(self) -> List[dict]:
+        return await asyncio.to_thread(self.list_products)
+
+    async def acreate_session(self, session: dict) -> dict:
+        return await asyncio.to_thread(self.create_session, session)
+
+    async def aexpire_sessions_batch(self, now: str, limit: int) -> dict:
+        return await asyncio.to_thread(self.expire_sessions_batch, now, limit)
+
+    async def aadd_cart_item(self, user_id: str, session_id: str, sku: str, quantity: int,
+                             product_name: str, brand: str, unit_price: float, notes: str = "") -> dict:
+        return await asyncio.to_thread(self.add_cart_item, user_id, session_id, sku, quantity,
+                                       product_name, brand, unit_price, notes)
+
+    async def aget_cart(self, user_id: str, status: str = "active") -> List[dict]:
+        return await asyncio.to_thread(self.get_cart, user_id, status)
+
+    async def acart_summary(self, user_id: str, status: str = "active") -> dict:
+        return await asyncio.to_thread(self.cart_summary, user_id, status)
+
+    async def aapply_cart_changes(self, user_id: str, changes: List[dict]) -> dict:
+        return await asyncio.to_thread(self.apply_cart_changes, user_id, changes)
+
+    async def acheckout(self, user_id: str, shipping_address: str, delivery_date: str,
+                        special_instructions: str = "") -> dict:
+        return await asyncio.to_thread(self.checkout, user_id, shipping_address, delivery_date, special_instructions)
+
+    async def aclose(self) -> None:
+        """Release connections held by the async client, if any"""
+
+    async def aauthenticate(self, access_token: str) -> Optional[str]:
+        """Id of the user an access token was issued to, or None if it is invalid or expired.
+        Backends without user accounts authenticate nobody."""
+        return None
+
+
+class SupabaseRepository(Repository):
+    """Repository backed by the Supabase PostgREST API.
+
+    The async methods share one keep-alive HTTP connection pool of `pool_size`
+    connections (SUPABASE_POOL_SIZE), so concurrent tool calls overlap on the
+    event loop instead of each holding a thread.
+    """
+
+    def __init__(self, url: Optional[str] = None, key: Optional[str] = None,
+                 pool_size: Optional[int] = None, timeout: Optional[float] = None):
+        self._url = url or os.getenv("SUPABASE_URL")
+        self._key = key or os.getenv("SUPABASE_KEY")
+        self.pool_size = pool_size or int(os.getenv("SUPABASE_POOL_SIZE", "20"))
+        self.timeout = timeout or float(os.getenv("SUPABASE_TIMEOUT", "30"))
+        self._client = None
+        self._async_client = None
+        self._http = None
+        self._async_lock: Optional[asyncio.Lock] = None
+
+    @property
+    def client(self):
+        # Created on first use so importing the app never needs credentials
+        if self._client is None:
+            from supabase import create_client
+            self._client = create_client(self._url, self._key)
+        return self._client
+
+    async def aclient(self):
+        """The async client, created on first use over the shared connection pool"""
+        if self._async_client is not None:
+            return self._async_client
+        if self._async_lock is None:
+            self._async_lock = asyncio.Lock()
+        async with self._async_lock:
+            if self._async_client is None:
+                import httpx
+                from supabase import AsyncClientOptions, acreate_client
+                self._http = httpx.AsyncClient(
+                    limits=httpx.Limits(
+                        max_connections=self.pool_size,
+                        max_keepalive_connections=self.pool_size,
+                        keepalive_expiry=float(os.getenv("SUPABASE_KEEPALIVE_SECONDS", "60"))
+                    ),
+                    timeout=self.timeout,
+                    follow_redirects=True
+                )
+                self._async_client = await acreate_client(
+                    self._url, self._key, options=AsyncClientOptions(httpx_client=self._http)
+                )
+        return self._async_client
+
+    async def aclose(self) -> None:
+        if self._http is not None:
+            await self._http.aclose()
+        self._http = self._async_client = None
+
+    async def aauthenticate(self, access_token: str) -> Optional[str]:
+        client = await self.aclient()
+        try:
+            response = await client.auth.get_user(access_token)
+        except Exception as e:
+            print(f"Access token rejected: {e}")
+            return None
+        return response.user.id if response and response.user else None
+
+    def list_products(self) -> List[dict]:
+        return self.client.table('products').select('*').execute().data
+
+    def create_session(self, session: dict) -> dict:
+        return self.client.table('cart_sessions').insert(session).execute().data[0]
+
+    def expire_sessions_batch(self, now: str, limit: int) -> dict:
+        return self.client.rpc('expire_sessions_batch', {'p_now': now, 'p_limit': limit}).execute().data
+
+    def add_cart_item(self, user_id, session_id, sku, quantity, product_name, brand, unit_price, notes=""):
+        return self.client.rpc('add_cart_item', {
+            'p_user_id': user_id,
+            'p_session_id': session_id,
+            'p_sku': sku,
+            'p_quantity': quantity,
+            'p_product_name': product_name,
+            'p_brand': brand,
+            'p_unit_price': unit_price,
+            'p_notes': notes or ''
+        }).execute().data
+
+    def get_cart(self, user_id: str, status: str = "active") -> List[dict]:
+        return self.client.table('shopping_carts').select('*').match({'user_id': user_id, 'status': status}).execute().data
+
+    def cart_summary(self, user_id: str, status: str = "active") -> dict:
+        return self.client.rpc('get_cart_summary', {'p_user_id': user_id, 'p_status': status}).execute().data
+
+    def apply_cart_changes(self, user_id: str, changes: List[dict]) -> dict:
+        return self.client.rpc('apply_cart_changes', {'p_user_id': user_id, 'p_changes': changes}).execute().data
+
+    def checkout(self, user_id, shipping_address, delivery_date, special_instructions=""):
+        return self.client.rpc('checkout_cart', {
+            'p_user_id': user_id,
+            'p_shipping_address': shipping_address,
+            'p_delivery_date': delivery_date,
+            'p_special_instructions': special_instructions or ''
+        }).execute().data
+
+    async def alist_products(self) -> List[dict]:
+        client = await self.aclient()
+        return (await client.table('products').select('*').execute()).data
+
+    async def acreate_session(self, session: dict) -> dict:
+        client = await self.aclient()
+        return (await client.table('cart_sessions').insert(session).execute()).data[0]
+
+    async def aexpire_sessions_batch(self, now: str, limit: int) -> dict:
+        client = await self.aclient()
+        return (await client.rpc('expire_sessions_batch', {'p_now': now, 'p_limit': limit}).execute()).data
+
+    async def aadd_cart_item(self, user_id, session_id, sku, quantity, product_name, brand, unit_price, notes=""):
+        client = await self.aclient()
+        return (await client.rpc('add_cart_item', {
+            'p_user_id': user_id,
+            'p_session_id': session_id,
+            'p_sku': sku,
+            'p_quantity': quantity,
+            'p_product_name': product_name,
+            'p_brand': brand,
+            'p_unit_price': unit_price,
+            'p_notes': notes or ''
+        }).execute()).data
+
+    async def aget_cart(self, user_id: str, status: str = "active") -> List[dict]:
+        client = await self.aclient()
+        return (await client.table('shopping_carts').select('*').match({'user_id': user_id, 'status': status}).execute()).data
+
+    async def acart_summary(self, user_id: str, status: str = "active") -> dict:
+        client = await self.aclient()
+        return (await client.rpc('get_cart_summary', {'p_user_id': user_id, 'p_status': status}).execute()).data
+
+    async def aapply_cart_changes(self, user_id: str, changes: List[dict]) -> dict:
+        client = await self.aclient()
+        return (await client.rpc('apply_cart_changes', {'p_user_id': user_id, 'p_changes': changes}).execute()).data
+
+    async def acheckout(self, user_id, shipping_address, delivery_date, special_instructions=""):
+        client = await self.aclient()
+        return (await client.rpc('checkout_cart', {
+            'p_user_id': user_id,
+            'p_shipping_address': shipping_address,
+            'p_delivery_date': delivery_date,
+            'p_special_instructions': special_instructions or ''
+        }).execute()).data
+
+
+def split_sql_statements(script: str) -> List[str]:
+    """Split a SQL script on semicolons outside quotes, comments and $$ bodies"""
+    statements, current = [], []
+    i, quote, dollar = 0, False, False
+    while i < len(script):
+        char = script[i]
+        if not quote and not dollar and script.startswith("--", i):
+            end = script.find("\n", i)
+            i = len(script) if end == -1 else end
+            continue
+        if not quote and script.startswith("$$", i):
+            dollar = not dollar
+            current.append("$$")
+            i += 2
+            continue
+        if char == "'" and not dollar:
+            quote = not quote
+        if char == ";" and not quote and not dollar:
+            statements.append("".join(current).strip())
+            current = []
+        else:
+            current.append(char)
+        i += 1
+    statements.append("".join(current).strip())
+    return [statement for statement in statements if statement]
+
+
+# Postgres-only statements that have no SQLite equivalent; their behaviour lives in SQLiteRepository
+_SKIPPED_STATEMENTS = re.compile(r"^\s*CREATE\s+(EXTENSION|(OR\s+REPLACE\s+)?FUNCTION)\b", re.IGNORECASE)
+
+_TYPE_REWRITES = (
+    (re.compile(r"UUID PRIMARY KEY DEFAULT uuid_generate_v4\(\)", re.IGNORECASE), "TEXT PRIMARY KEY DEFAULT (lower(hex(randomblob(16))))"),
+    (re.compile(r"\bTIMESTAMPTZ DEFAULT NOW\(\)", re.IGNORECASE), "TEXT DEFAULT CURRENT_TIMESTAMP"),
+    (re.compile(r"\b(UUID|TIMESTAMPTZ|JSONB)\b"), "TEXT"),
+)
+
+
+def postgres_to_sqlite(statement: str) -> Optional[str]:
+    """Translate one statement of the schema/seed files to SQLite, or None to skip it"""
+    if _SKIPPED_STATEMENTS.match(statement):
+        return None
+    for pattern, replacement in _TYPE_REWRITES:
+        statement = pattern.sub(replacement, statement)
+    return statement
+
+
+class SQLiteRepository(Repository):
+    """Local stand-in for Supabase that runs the real schema and catalog in SQLite.
+
+    `path` defaults to a private in-memory database. The Postgres functions
+    (checkout_cart, add_cart_item, apply_cart_changes, expire_sessions_batch) are
+    reimplemented here with the same transactional behaviour and result shapes.
+    """
+
+    _BOOLEAN_COLUMNS = {"is_active", "active"}
+    _JSON_COLUMNS = {"metadata"}
+
+    def __init__(self, path: str = ":memory:", sql_files=DEFAULT_SQL_FILES):
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA foreign_keys = ON")
+        self._lock = threading.RLock()
+
+        already_loaded = self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'products'"
+        ).fetchone()
+        if not already_loaded:
+            for sql_file in sql_files:
+                with open(sql_file, encoding="utf-8") as handle:
+                    for statement in split_sql_statements(handle.read()):
+                        statement = postgres_to_sqlite(statement)
+                        if statement:
+                            self._conn.execute(statement)
+
+    def _row(self, row: Optional[sqlite3.Row]) -> Optional[dict]:
+        if row is None:
+            return None
+        data = dict(row)
+        for column in self._BOOLEAN_COLUMNS & data.keys():
+            if data[column] is not None:
+                data[column] = bool(data[column])
+        for column in self._JSON_COLUMNS & data.keys():
+            if isinstance(data[column], str):
+                data[column] = json.loads(data[column])
+        return data
+
+    def _rows(self, rows) -> List[dict]:
+        return [self._row(row) for row in rows]
+
+    def list_products(self) -> List[dict]:
+        with self._lock:
+            return self._rows(self._conn.execute("SELECT * FROM products"))
+
+    def create_session(self, session: dict) -> dict:
+        session = {**session, "metadata": json.dumps(session.get("metadata"))}
+        columns = ", ".join(session)
+        placeholders = ", ".join("?" for _ in session)
+        with self._lock:
+            row = self._conn.execute(
+                f"INSERT INTO cart_sessions ({columns}) VALUES ({placeholders}) RETURNING *",
+                list(session.values())
+            ).fetchone()
+            return self._row(row)
+
+    def expire_sessions_batch(self, now: str, limit: int) -> dict:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                session_ids = [row[0] for row in self._conn.execute(
+                    "SELECT session_id FROM cart_sessions WHERE active = 1 AND expires_at < ? ORDER BY expires_at LIMIT ?",
+                    (now, limit)
+                )]
+                released = 0
+                if session_ids:
+                    placeholders = ", ".join("?" for _ in session_ids)
+                    self._conn.execute(f"UPDATE cart_sessions SET active = 0 WHERE session_id IN ({placeholders})", session_ids)
+                    released = self._conn.execute(
+                        "UPDATE shopping_carts SET status = 'expired', updated_at = CURRENT_TIMESTAMP "
+                        f"WHERE status = 'active' AND session_id IN ({placeholders})",
+                        session_ids
+                    ).rowcount
+                self._conn.execute("COMMIT")
+                return {"sessions_expired": len(session_ids), "lines_released": released, "session_ids": session_ids}
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def add_cart_item(self, user_id, session_id, sku, quantity, product_name, brand, unit_price, notes=""):
+        with self._lock:
+            session = self._conn.execute(
+                "SELECT active, expires_at FROM cart_sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if not session:
+                return {"success": False, "error": f"Session {session_id} does not exist. Please create a cart session first."}
+            if not self._session_open(session):
+                return {"success": False, "error": f"Session {session_id} has expired. Please create a new cart session."}
+            if not self._conn.execute("SELECT 1 FROM products WHERE sku = ?", (sku,)).fetchone():
+                return {"success": False, "error": "Product not found"}
+
+            existing = self._conn.execute(
+                "SELECT 1 FROM shopping_carts WHERE user_id = ? AND session_id = ? AND sku = ? AND status = 'active'",
+                (user_id, session_id, sku)
+            ).fetchone()
+            row = self._conn.execute(
+                "INSERT INTO shopping_carts (user_id, sku, product_name, brand, quantity, unit_price, notes, status, session_id) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, 'active', ?) "
+                "ON CONFLICT (user_id, session_id, sku) WHERE status = 'active' "
+                "DO UPDATE SET quantity = quantity + excluded.quantity, updated_at = CURRENT_TIMESTAMP "
+                "RETURNING *",
+                (user_id, sku, product_name, brand, quantity, unit_price, notes or '', session_id)
+            ).fetchone()
+            return {"success": True, "inserted": existing is None, "data": self._row(row),
+                    "session_expires_at": session["expires_at"]}
+
+    def get_cart(self, user_id: str, status: str = "active") -> List[dict]:
+        with self._lock:
+            return self._rows(self._conn.execute(
+                "SELECT * FROM shopping_carts WHERE user_id = ? AND status = ?", (user_id, status)
+            ))
+
+    def cart_summary(self, user_id: str, status: str = "active") -> dict:
+        with self._lock:
+            totals = self._conn.execute(
+                "SELECT item_count, total_items, total_price FROM cart_summaries WHERE user_id = ? AND status = ?",
+                (user_id, status)
+            ).fetchone()
+            brands = self._conn.execute(
+                "SELECT COALESCE(brand, 'Unknown'), COUNT(*) FROM shopping_carts WHERE user_id = ? AND status = ? GROUP BY 1",
+                (user_id, status)
+            ).fetchall()
+            items = self._rows(self._conn.execute(
+                "SELECT sku, product_name, brand, quantity, unit_price, total_price "
+                "FROM shopping_carts WHERE user_id = ? AND status = ? ORDER BY added_at",
+                (user_id, status)
+            ))
+        item_count, total_items, total_price = totals or (0, 0, 0)
+        return {
+            "item_count": item_count,
+            "total_items": total_items,
+            "total_price": round(float(total_price), 2),
+            "brands_summary": dict(brands),
+            "items": items
+        }
+
+    @staticmethod
+    def _session_open(session: sqlite3.Row) -> bool:
+        return bool(session["active"]) and (session["expires_at"] is None or session["expires_at"] > datetime.now().isoformat())
+
+    def apply_cart_changes(self, user_id: str, changes: List[dict]) -> dict:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                stale = []
+                for change in changes:
+                    stored = self._conn.execute(
+                        "SELECT status FROM shopping_carts WHERE id = ?", (change.get("id"),)
+                    ).fetchone()
+                    session = self._conn.execute(
+                        "SELECT active, expires_at FROM cart_sessions WHERE session_id = ?", (change["session_id"],)
+                    ).fetchone()
+                    if (stored is not None and stored["status"] != "active") or (
+                            change["status"] != "removed" and not (session and self._session_open(session))):
+                        stale.append(change["id"])
+                        continue
+                    if change["status"] == "removed":
+                        self._conn.execute(
+                            "UPDATE shopping_carts SET status = 'removed', updated_at = CURRENT_TIMESTAMP "
+                            "WHERE user_id = ? AND session_id = ? AND sku = ? AND status = 'active'",
+                            (user_id, change["session_id"], change["sku"])
+                        )
+                    else:
+                        self._conn.execute(
+                            "INSERT INTO shopping_carts (id, user_id, sku, product_name, brand, quantity, unit_price, notes, status, session_id) "
+                            "VALUES (COALESCE(?, lower(hex(randomblob(16)))), ?, ?, ?, ?, ?, ?, ?, 'active', ?) "
+                            "ON CONFLICT (user_id, session_id, sku) WHERE status = 'active' "
+                            "DO UPDATE SET quantity = excluded.quantity, notes = excluded.notes, updated_at = CURRENT_TIMESTAMP",
+                            (change.get("id"), user_id, change["sku"], change.get("product_name"), change.get("brand"),
+                             change["quantity"], change["unit_price"], change.get("notes") or '', change["session_id"])
+                        )
+                self._conn.execute("COMMIT")
+                return {"success": True, "applied": len(changes) - len(stale), "stale": stale}
+            except sqlite3.IntegrityError as e:
+                self._conn.execute("ROLLBACK")
+                return {"success": False, "error": str(e)}
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def checkout(self, user_id, shipping_address, delivery_date, special_instructions=""):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = self._checkout(user_id, shipping_address, delivery_date, special_instructions)
+                self._conn.execute("COMMIT")
+                return result
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _checkout(self, user_id, shipping_address, delivery_date, special_instructions) -> Dict[str, Any]:
+        active = "FROM shopping_carts WHERE user_id = ? AND status = 'active'"
+        total, item_count = self._conn.execute(
+            "SELECT total_price, item_count FROM cart_summaries WHERE user_id = ? AND status = 'active'", (user_id,)
+        ).fetchone() or (0, 0)
+        if item_count == 0:
+            return {"success": False, "error": "Cart is empty"}
+
+        order_id = str(uuid.uuid4())
+        order_number = f"ORD-{user_id}-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+        total = round(float(total), 2)
+        self._conn.execute(
+            "INSERT INTO orders (id, user_id, order_number, total_amount, order_status, shipping_address, delivery_date, special_instructions) "
+            "VALUES (?, ?, ?, ?, 'pending', ?, ?, ?)",
+            (order_id, user_id, order_number, total, shipping_address, delivery_date, special_instructions or '')
+        )
+        self._conn.execute(
+            "INSERT INTO order_items (order_id, sku, product_name, brand, quantity, unit_price) "
+            f"SELECT ?, sku, product_name, brand, quantity, unit_price {active}",
+            (order_id, user_id)
+        )
+        self._conn.execute(
+            "UPDATE products SET stock_quantity = MAX(0, stock_quantity - c.quantity), updated_at = CURRENT_TIMESTAMP "
+            f"FROM (SELECT sku, SUM(quantity) AS quantity {active} GROUP BY sku) AS c "
+            "WHERE products.sku = c.sku",
+            (user_id,)
+        )
+        self._conn.execute(
+            "UPDATE shopping_carts SET status = 'purchased', order_id = ?, updated_at = CURRENT_TIMESTAMP "
+            "WHERE user_id = ? AND status = 'active'",
+            (order_id, user_id)
+        )
+        return {
+            "success": True,
+            "order_id": order_id,
+            "order_number": order_number,
+            "total_amount": total,
+            "item_count": item_count,
+            "message": f"Order placed successfully! Order number: {order_number}"
+        }
+
+
+class CountingRepository:
+    """Transparent wrapper that counts round trips per repository method.
+
+    If given, `observer(method, seconds)` is called after every call, e.g. to
+    record latency metrics.
+    """
+
+    NOT_ROUND_TRIPS = {"aclose"}
+
+    def __init__(self, inner: Repository, observer: Optional[Callable[[str, float], None]] = None):
+        self.inner = inner
+        self.observer = observer
+        self.round_trips = 0
+        self.calls: Dict[str, int] = {}
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self.inner, name)
+        if name.startswith("_") or name in self.NOT_ROUND_TRIPS or not callable(attribute):
+            return attribute
+
+        if inspect.iscoroutinefunction(attribute):
+            async def acounted(*args, **kwargs):
+                started = self._count(name)
+                try:
+                    return await attribute(*args, **kwargs)
+                finally:
+                    self._observe(name, started)
+
+            return acounted
+
+        def counted(*args, **kwargs):
+            started = self._count(name)
+            try:
+                return attribute(*args, **kwargs)
+            finally:
+                self._observe(name, started)
+
+        return counted
+
+    def _count(self, name: str) -> float:
+        self.round_trips += 1
+        self.calls[name] = self.calls.get(name, 0) + 1
+        return time.perf_counter()
+
+    def _observe(self, name: str, started: float) -> None:
+        if self.observer is not None:
+            self.observer(name, time.perf_counter() - started)
+
+
+def create_repository(backend: Optional[str] = None) -> Repository:
+    """Create the repository selected by DATA_BACKEND (supabase or sqlite)"""
+    backend = backend or os.getenv("DATA_BACKEND", "supabase")
+    if backend == "supabase":
+        return SupabaseRepository()
+    if backend == "sqlite":
+        return SQLiteRepository(os.getenv("SQLITE_DB_PATH", ":memory:"))
+    raise ValueError(f"Unknown DATA_BACKEND: {backend}")
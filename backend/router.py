@@ -0,0 +1,169 @@
+import re
+import json
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+
+from context import extract_conversation_state
+from matcher import normalize
+
+AFFIRMATIVE = {
+    "y", "yes", "yeah", "yep", "yup", "ok", "okay", "sure", "next", "go ahead", "continue", "yes please",
+    "sounds good", "next one", "next ingredient", "lets go", "go on", "ok next", "yes next",
+}
+_PICK = re.compile(r"^(?:option|number|no|#)?\s*(\d{1,2})$")
+_CHECKOUT = re.compile(r"^(?:please )?(?:check ?out|proceed to check ?out|place (?:my |the )?order)(?: please)?$")
+_SHOW_CART = re.compile(r"^(?:(?:show|view|see|open)(?: me)? (?:my |the )?cart|whats in my cart|my cart|cart)$")
+_REMOVE = re.compile(r"^(?:please )?(?:remove|delete|drop) (?:the )?(.+?)(?: from (?:my |the )?cart)?$")
+
+# Tool results after which the assistant has just offered to look up the next ingredient
+_NEXT_STEP_TOOLS = {"extract_recipe_ingredients", "add_to_cart", "remove_from_cart"}
+
+
+def _text(message: BaseMessage) -> str:
+    text = str(message.content).lower().replace("'", "")
+    return " ".join(re.sub(r"[^a-z0-9#\s]", " ", text).split())
+
+
+def _parse(content: Any) -> Any:
+    try:
+        return json.loads(content)
+    except (json.JSONDecodeError, TypeError):
+        return None
+
+
+def last_tool_results(messages: List[BaseMessage]) -> List[Tuple[str, Any]]:
+    """(tool name, parsed result) for the most recent batch of tool calls before the current user message"""
+    results = []
+    for message in reversed(messages[:-1]):
+        if isinstance(message, ToolMessage):
+            results.append((message.name, _parse(message.content)))
+        elif isinstance(message, AIMessage) and message.tool_calls:
+            break
+        elif results:
+            # Walked past the block already; anything earlier is stale
+            break
+        elif isinstance(message, HumanMessage):
+            break
+    return results
+
+
+def _last_reply(messages: List[BaseMessage]) -> Optional[str]:
+    """Lowercased text of the assistant's reply just before the current user message, if it wrote one"""
+    for message in reversed(messages[:-1]):
+        if isinstance(message, AIMessage):
+            return str(message.content).lower() if message.content and not message.tool_calls else None
+        if isinstance(message, HumanMessage):
+            return None
+    return None
+
+
+class IntentRouter:
+    """Recognizes trivially structured user turns and turns them into tool calls without the LLM.
+
+    Handles picking a presented option ("2"), moving to the next ingredient
+    ("yes", "next"), checkout, showing the cart and "remove <item>". Anything
+    ambiguous returns None so the LLM decides as usual.
+    """
+
+    def __init__(self):
+        self.routed: Dict[str, int] = {}
+        self.fallbacks = 0
+
+    @staticmethod
+    def _call(name: str, **args: Any) -> AIMessage:
+        return AIMessage(
+            content="",
+            tool_calls=[{"name": name, "args": args, "id": f"route_{uuid.uuid4().hex[:16]}", "type": "tool_call"}],
+            response_metadata={"router": name}
+        )
+
+    def _pick_option(self, choice: int, results, messages: List[BaseMessage], user_id: str,
+                     session_id: Optional[str]) -> Optional[AIMessage]:
+        """Resolve "N" against the option numbers in the tool result (see payloads.number_options),
+        and only when the reply the user saw names that product"""
+        options = []
+        for name, result in results:
+            if name == "check_ingredient_availability" and isinstance(result, dict):
+                options = result.get("options") or []
+            elif name == "search_alternatives" and isinstance(result, list):
+                options = result
+        chosen = [option for option in options if isinstance(option, dict) and option.get("option") == choice]
+        if not session_id or len(chosen) != 1:
+            return None
+        shown = _last_reply(messages)
+        item_name = str(chosen[0].get("item_name") or "").lower()
+        if shown is not None and item_name and item_name not in shown:
+            return None
+        return self._call("add_to_cart", user_id=user_id, sku=chosen[0]["sku"], quantity=1, session_id=session_id)
+
+    def _next_ingredient(self, results, conversation: dict) -> Optional[AIMessage]:
+        names = {name for name, _ in results}
+        unavailable = any(
+            name == "check_ingredient_availability" and isinstance(result, dict) and not result.get("available")
+            for name, result in results
+        )
+        if not (names & _NEXT_STEP_TOOLS or unavailable):
+            return None
+        checked = set(conversation.get("ingredients_checked", []))
+        remaining = [name for name in conversation.get("ingredients", []) if name not in checked]
+        if not remaining:
+            return None
+        return self._call("check_ingredient_availability", ingredient_name=remaining[0])
+
+    def _remove(self, item: str, messages: List[BaseMessage], user_id: str, conversation: dict) -> Optional[AIMessage]:
+        in_cart = conversation.get("skus_added", {})
+        names = {}
+        for message in messages:
+            if isinstance(message, ToolMessage) and message.name == "add_to_cart":
+                data = (_parse(message.content) or {}).get("data") or {}
+                if data.get("sku") in in_cart:
+                    names[data["sku"]] = data.get("product_name") or ""
+        wanted = set(normalize(item))
+        matches = [sku for sku, name in names.items() if wanted and wanted <= set(normalize(name))]
+        if len(matches) != 1:
+            return None
+        return self._call("remove_from_cart", user_id=user_id, sku=matches[0])
+
+    def route(self, messages: List[BaseMessage], user_id: str, session_id: Optional[str] = None) -> Optional[AIMessage]:
+        """A tool-calling AIMessage for the current user turn, or None to defer to the LLM"""
+        decision = None
+        if messages and isinstance(messages[-1], HumanMessage) and user_id:
+            decision = self._decide(messages, user_id, session_id)
+
+        if decision is None:
+            self.fallbacks += 1
+        else:
+            intent = decision.response_metadata["router"]
+            self.routed[intent] = self.routed.get(intent, 0) + 1
+        return decision
+
+    def _decide(self, messages: List[BaseMessage], user_id: str, session_id: Optional[str]) -> Optional[AIMessage]:
+        text = _text(messages[-1])
+        if _CHECKOUT.match(text):
+            return self._call("checkout_cart", user_id=user_id)
+        if _SHOW_CART.match(text):
+            return self._call("get_user_cart", user_id=user_id)
+
+        conversation = extract_conversation_state(messages)
+        results = last_tool_results(messages)
+        session_id = conversation.get("session_id") or session_id
+
+        pick = _PICK.match(text)
+        if pick:
+            return self._pick_option(int(pick.group(1)), results, messages, user_id, session_id)
+        if text in AFFIRMATIVE:
+            return self._next_ingredient(results, conversation)
+        remove = _REMOVE.match(text)
+        if remove:
+            return self._remove(remove.group(1), messages, user_id, conversation)
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        total = sum(self.routed.values()) + self.fallbacks
+        return {
+            "routed": dict(self.routed),
+            "fallbacks": self.fallbacks,
+            "routed_fraction": round(sum(self.routed.values()) / total, 3) if total else 0.0
+        }
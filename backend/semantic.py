@@ -0,0 +1,167 @@
+import re
+import zlib
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from matcher import name_covers, normalize
+
+_NON_WORD = re.compile(r"[^a-z0-9\s]")
+
+
+def features(text: str, ngram_sizes: Sequence[int] = (3, 4)) -> List[str]:
+    """Whole tokens plus their padded character n-grams: 'curd' -> ['w:curd', ' cu', 'cur', ...].
+
+    Tokens are the matcher's normalized ones (synonyms, singulars) and the raw words,
+    so 'yoghurt' still shares n-grams with 'Greek Yogurt' after yogurt -> curd.
+    """
+    tokens = list(dict.fromkeys(normalize(text) + _NON_WORD.sub(" ", text.lower()).split()))
+    grams = [f"w:{token}" for token in tokens]
+    for token in tokens:
+        padded = f" {token} "
+        for size in ngram_sizes:
+            grams.extend(padded[i:i + size] for i in range(len(padded) - size + 1))
+    return grams
+
+
+class SemanticIndex:
+    """Local vector index from ingredient phrases to products, with no network or model download.
+
+    Each product name becomes a hashed bag of character n-grams and whole tokens
+    (`dimensions` buckets, signed hashing), with sublinear term frequency, stored
+    as one row of a float32 matrix. Rows are weighted by inverse document frequency
+    and L2-normalized. `top_k_many` scores a whole ingredient list with one matrix
+    multiply. `add` and `remove` update a single row and the document-frequency
+    counts; the weighted matrix is rebuilt lazily, vectorized, on the next query.
+
+    Shared n-grams alone make loose matches ('fish sauce' scores 0.55 against
+    'Soy Sauce'), so with `covering` a hit must also name every query token.
+    """
+
+    def __init__(self, dimensions: int = 4096, ngram_sizes: Sequence[int] = (3, 4)):
+        self.dimensions = dimensions
+        self.ngram_sizes = tuple(ngram_sizes)
+        self._counts = np.zeros((0, dimensions), dtype=np.float32)
+        self._size = 0
+        self._skus: List[str] = []
+        self._row_of: Dict[str, int] = {}
+        self._texts: Dict[str, str] = {}
+        self._categories: List[Optional[str]] = []
+        self._document_frequency = np.zeros(dimensions, dtype=np.int32)
+        self._weighted: Optional[np.ndarray] = None
+        self._idf: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+        self.queries = 0
+        self.rebuilds = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def vectorize(self, text: str) -> np.ndarray:
+        """Raw hashed term-frequency vector of one text"""
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for gram in features(text, self.ngram_sizes):
+            digest = zlib.crc32(gram.encode())
+            vector[digest % self.dimensions] += 1.0 if digest & 0x80000000 else -1.0
+        # Sublinear term frequency, keeping the hash sign
+        return np.sign(vector) * np.log1p(np.abs(vector))
+
+    def add(self, sku: str, text: str, category: Optional[str] = None) -> None:
+        """Index or re-index one product"""
+        with self._lock:
+            if sku in self._row_of:
+                if self._texts[sku] == text and self._categories[self._row_of[sku]] == category:
+                    return
+                self._remove(sku)
+            if self._size == len(self._counts):
+                grown = np.zeros((max(64, 2 * self._size), self.dimensions), dtype=np.float32)
+                grown[:self._size] = self._counts[:self._size]
+                self._counts = grown
+            row = self._size
+            self._counts[row] = self.vectorize(text)
+            self._document_frequency += self._counts[row] != 0
+            self._skus.append(sku)
+            self._categories.append(category)
+            self._row_of[sku] = row
+            self._texts[sku] = text
+            self._size += 1
+            self._weighted = None
+
+    def remove(self, sku: str) -> None:
+        with self._lock:
+            if sku in self._row_of:
+                self._remove(sku)
+
+    def _remove(self, sku: str) -> None:
+        # Move the last row into the freed slot so the matrix stays dense
+        row, last = self._row_of.pop(sku), self._size - 1
+        self._document_frequency -= self._counts[row] != 0
+        if row != last:
+            self._counts[row] = self._counts[last]
+            self._skus[row] = self._skus[last]
+            self._categories[row] = self._categories[last]
+            self._row_of[self._skus[row]] = row
+        self._counts[last] = 0
+        self._skus.pop()
+        self._categories.pop()
+        del self._texts[sku]
+        self._size -= 1
+        self._weighted = None
+
+    def sync(self, rows: List[dict]) -> None:
+        """Match the index to a (re)loaded catalog: add new or renamed products, drop missing or inactive ones"""
+        current = {row["sku"]: row for row in rows if row.get("is_active", True) and row.get("item_name")}
+        for sku in [sku for sku in self._row_of if sku not in current]:
+            self.remove(sku)
+        for sku, row in current.items():
+            self.add(sku, row["item_name"], row.get("category"))
+
+    def _ensure_weighted(self) -> Tuple[np.ndarray, np.ndarray]:
+        if self._weighted is None:
+            counts = self._counts[:self._size]
+            idf = np.log((1 + self._size) / (1 + self._document_frequency)).astype(np.float32) + 1.0
+            weighted = counts * idf
+            norms = np.linalg.norm(weighted, axis=1, keepdims=True)
+            self._weighted, self._idf = weighted / np.maximum(norms, 1e-9), idf
+            self.rebuilds += 1
+        return self._weighted, self._idf
+
+    def top_k_many(self, queries: Sequence[str], k: int = 5, min_score: float = 0.0,
+                   category: Optional[str] = None, covering: bool = False) -> List[List[Tuple[str, float]]]:
+        """For each query, up to k (sku, cosine similarity) pairs, best first, in one matrix multiply;
+        with `covering`, only products whose name covers every token of the query (see name_covers)"""
+        if not queries:
+            return []
+        with self._lock:
+            if not self._size:
+                return [[] for _ in queries]
+            matrix, idf = self._ensure_weighted()
+            skus, categories, texts = list(self._skus), list(self._categories), dict(self._texts)
+            self.queries += len(queries)
+
+        vectors = np.stack([self.vectorize(query) for query in queries]) * idf
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-9)
+        scores = vectors @ matrix.T
+        if category:
+            scores[:, np.array([value != category for value in categories])] = -1.0
+
+        # Look further down the ranking when some candidates will fail the coverage check
+        wanted = min(4 * k if covering else k, scores.shape[1])
+        top = np.argpartition(-scores, wanted - 1, axis=1)[:, :wanted]
+        results = []
+        for row, candidates in enumerate(top):
+            ranked = candidates[np.argsort(-scores[row, candidates])]
+            hits = [(skus[column], round(float(scores[row, column]), 3))
+                    for column in ranked if scores[row, column] >= min_score]
+            if covering:
+                hits = [(sku, score) for sku, score in hits if name_covers(queries[row], texts[sku])]
+            results.append(hits[:k])
+        return results
+
+    def top_k(self, query: str, k: int = 5, min_score: float = 0.0, category: Optional[str] = None,
+              covering: bool = False) -> List[Tuple[str, float]]:
+        return self.top_k_many([query], k, min_score, category, covering)[0]
+
+    def stats(self) -> Dict[str, int]:
+        return {"products": self._size, "dimensions": self.dimensions, "queries": self.queries, "rebuilds": self.rebuilds}
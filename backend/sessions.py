@@ -0,0 +1,94 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from langgraph.checkpoint.memory import InMemorySaver
+
+
+class BoundedMemorySaver(InMemorySaver):
+    """In-memory checkpointer that keeps at most `max_threads` conversations.
+
+    Threads are evicted least-recently-used first once the cap is reached,
+    and any thread idle for longer than `ttl_seconds` is dropped on the next access.
+    """
+
+    def __init__(self, max_threads: int = 1000, ttl_seconds: float = 3600, *, serde=None):
+        super().__init__(serde=serde)
+        self.max_threads = max_threads
+        self.ttl_seconds = ttl_seconds
+        self._last_seen: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = {"lru": 0, "ttl": 0}
+
+    def _touch(self, config) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        now = time.monotonic()
+        with self._lock:
+            # Expire idle threads; the dict is ordered oldest access first
+            while self._last_seen:
+                oldest_id, last_seen = next(iter(self._last_seen.items()))
+                if now - last_seen <= self.ttl_seconds:
+                    break
+                self._evict(oldest_id, "ttl")
+
+            self._last_seen[thread_id] = now
+            self._last_seen.move_to_end(thread_id)
+
+            while len(self._last_seen) > self.max_threads:
+                oldest_id = next(iter(self._last_seen))
+                self._evict(oldest_id, "lru")
+
+    def _evict(self, thread_id: str, reason: str) -> None:
+        self._last_seen.pop(thread_id, None)
+        super().delete_thread(thread_id)
+        self.evictions[reason] += 1
+
+    def get_tuple(self, config):
+        self._touch(config)
+        return super().get_tuple(config)
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        self._touch(config)
+        return super().put(config, checkpoint, metadata, new_versions)
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        self._touch(config)
+        return super().put_writes(config, writes, task_id, task_path)
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            self._last_seen.pop(thread_id, None)
+            super().delete_thread(thread_id)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "backend": "memory",
+            "threads": len(self._last_seen),
+            "max_threads": self.max_threads,
+            "ttl_seconds": self.ttl_seconds,
+            "evictions_lru": self.evictions["lru"],
+            "evictions_ttl": self.evictions["ttl"]
+        }
+
+
+def create_checkpointer(backend: Optional[str] = None):
+    """Create the conversation checkpointer selected by CHECKPOINT_BACKEND (memory or sqlite)"""
+    backend = backend or os.getenv("CHECKPOINT_BACKEND", "memory")
+
+    if backend == "memory":
+        return BoundedMemorySaver(
+            max_threads=int(os.getenv("SESSION_MAX_THREADS", "1000")),
+            ttl_seconds=float(os.getenv("SESSION_TTL_SECONDS", "3600"))
+        )
+
+    if backend == "sqlite":
+        import aiosqlite
+        from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+        # The connection is opened lazily by the saver on first use inside the event loop
+        path = os.getenv("CHECKPOINT_SQLITE_PATH", "checkpoints.sqlite")
+        return AsyncSqliteSaver(aiosqlite.connect(path))
+
+    raise ValueError(f"Unknown CHECKPOINT_BACKEND: {backend}")
@@ -0,0 +1,140 @@
+import re
+import bisect
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+
+# Suggestion kinds, in ranking order
+KINDS = ("product", "brand", "category")
+
+
+def fold(text: str) -> str:
+    """Lowercase and reduce punctuation to single spaces: 'Bell Pepper (Capsicum)' -> 'bell pepper capsicum'"""
+    return " ".join(_NON_WORD.sub(" ", (text or "").lower()).split())
+
+
+def _word_starts(texts: Tuple[str, ...]) -> List[str]:
+    """Every suffix of each text that starts at a word, so 'amul paneer' is found by 'pan' as well as 'am'"""
+    suffixes = set()
+    for text in texts:
+        words = text.split(" ")
+        suffixes.update(" ".join(words[index:]) for index in range(len(words)))
+    return sorted(suffixes)
+
+
+class PrefixIndex:
+    """Type-ahead over product names, brands and categories, held as one sorted array.
+
+    Each suggestion is stored under every word-start suffix of its folded text;
+    products also under "<brand> <name>", so "amul b" finds Amul Butter.
+    A lookup is a bisect to the first key with the prefix, followed by a scan over
+    the matching run, capped at `max_scan` keys. `sync(rows)` diffs a reloaded
+    catalog against the indexed one and inserts or deletes only the changed keys.
+    A brand or category stays indexed while any active product still uses it.
+    """
+
+    def __init__(self, max_scan: int = 2000):
+        self.max_scan = max_scan
+        self._keys: List[Tuple[str, str]] = []  # (folded suffix, suggestion id), sorted
+        self._suggestions: Dict[str, dict] = {}
+        self._refs: Dict[str, int] = {}
+        self._products: Dict[str, tuple] = {}  # sku -> indexed (item_name, brand, category, in_stock)
+        self._lock = threading.Lock()
+        self.syncs = 0
+        self.keys_inserted = 0
+        self.keys_deleted = 0
+
+    def _add(self, suggestion_id: str, suggestion: dict, bulk: bool = False) -> None:
+        self._refs[suggestion_id] = self._refs.get(suggestion_id, 0) + 1
+        if self._refs[suggestion_id] > 1:
+            return
+        self._suggestions[suggestion_id] = suggestion
+        for suffix in _word_starts(suggestion["texts"]):
+            if bulk:
+                # Sorted once at the end of the sync
+                self._keys.append((suffix, suggestion_id))
+            else:
+                bisect.insort(self._keys, (suffix, suggestion_id))
+            self.keys_inserted += 1
+
+    def _discard(self, suggestion_id: str) -> None:
+        self._refs[suggestion_id] -= 1
+        if self._refs[suggestion_id]:
+            return
+        del self._refs[suggestion_id]
+        suggestion = self._suggestions.pop(suggestion_id)
+        for suffix in _word_starts(suggestion["texts"]):
+            index = bisect.bisect_left(self._keys, (suffix, suggestion_id))
+            if index < len(self._keys) and self._keys[index] == (suffix, suggestion_id):
+                del self._keys[index]
+                self.keys_deleted += 1
+
+    def _product_entries(self, sku: str, indexed: tuple) -> List[Tuple[str, dict]]:
+        item_name, brand, category, in_stock = indexed
+        product_texts = tuple(text for text in (fold(item_name), fold(f"{brand} {item_name}")) if text)
+        entries = [(f"product:{sku}", {"kind": "product", "text": item_name, "texts": product_texts,
+                                        "sku": sku, "brand": brand, "in_stock": in_stock})]
+        if brand:
+            entries.append((f"brand:{fold(brand)}", {"kind": "brand", "text": brand, "texts": (fold(brand),)}))
+        if category:
+            entries.append((f"category:{fold(category)}", {"kind": "category", "text": category, "texts": (fold(category),)}))
+        return [(suggestion_id, suggestion) for suggestion_id, suggestion in entries if suggestion["texts"] and suggestion["texts"][0]]
+
+    def sync(self, rows: List[dict]) -> None:
+        """Bring the index in line with a (re)loaded catalog, touching only changed products"""
+        current = {
+            row["sku"]: (row.get("item_name") or "", row.get("brand") or "", row.get("category") or "",
+                         (row.get("stock_quantity") or 0) > 0)
+            for row in rows if row.get("is_active", True)
+        }
+        with self._lock:
+            bulk = not self._products
+            for sku, indexed in list(self._products.items()):
+                if current.get(sku) != indexed:
+                    for suggestion_id, _ in self._product_entries(sku, indexed):
+                        self._discard(suggestion_id)
+                    del self._products[sku]
+            for sku, indexed in current.items():
+                if sku not in self._products:
+                    for suggestion_id, suggestion in self._product_entries(sku, indexed):
+                        self._add(suggestion_id, suggestion, bulk)
+                    self._products[sku] = indexed
+            if bulk:
+                self._keys.sort()
+            self.syncs += 1
+
+    def suggest(self, prefix: str, limit: int = 8, kinds: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Ranked completions for what the user has typed so far"""
+        folded = fold(prefix)
+        if not folded:
+            return []
+        with self._lock:
+            keys, suggestions = self._keys, self._suggestions
+            index = bisect.bisect_left(keys, (folded, ""))
+            best: Dict[str, tuple] = {}
+            for suffix, suggestion_id in keys[index:index + self.max_scan]:
+                if not suffix.startswith(folded):
+                    break
+                suggestion = suggestions[suggestion_id]
+                if kinds and suggestion["kind"] not in kinds:
+                    continue
+                # Start of the name, then a later word of it, then "<brand> <name>"; within a tier
+                # products before brands before categories, in-stock first, then shorter and alphabetical
+                name = suggestion["texts"][0]
+                tier = 0 if suffix == name else 1 if name.endswith(" " + suffix) else 2
+                rank = (tier, KINDS.index(suggestion["kind"]),
+                        not suggestion.get("in_stock", True), len(suggestion["text"]), suggestion["text"].lower())
+                if suggestion_id not in best or rank < best[suggestion_id][0]:
+                    best[suggestion_id] = (rank, suggestion)
+        ranked = sorted(best.values(), key=lambda pair: pair[0])[:limit]
+        return [{key: value for key, value in suggestion.items() if key != "texts"} for _, suggestion in ranked]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "suggestions": len(self._suggestions),
+            "keys": len(self._keys),
+            "syncs": self.syncs,
+            "keys_inserted": self.keys_inserted,
+            "keys_deleted": self.keys_deleted
+        }
@@ -101,3 +101,274 @@ CREATE INDEX idx_orders_created_at ON orders(created_at);
 
 CREATE INDEX idx_order_items_order_id ON order_items(order_id);
 CREATE INDEX idx_order_items_sku ON order_items(sku);
+
+-- Per-user, per-status cart totals; total_price sums the generated line totals
+CREATE INDEX idx_shopping_carts_user_status ON shopping_carts(user_id, status);
+-- Expired-but-active sessions, oldest first, for the session reaper
+CREATE INDEX idx_cart_sessions_expiring ON cart_sessions(expires_at) WHERE active;
+
+CREATE VIEW cart_summaries AS
+SELECT user_id,
+       status,
+       COUNT(*) AS item_count,
+       SUM(quantity) AS total_items,
+       SUM(total_price) AS total_price
+FROM shopping_carts
+GROUP BY user_id, status;
+
+-- Atomic checkout: turns a user's active cart into an order in a single transaction
+-- (order, order items, cart status and stock decrements) and returns the result as JSON.
+CREATE OR REPLACE FUNCTION checkout_cart(
+    p_user_id TEXT,
+    p_shipping_address TEXT DEFAULT 'Default Delivery Address',
+    p_delivery_date DATE DEFAULT CURRENT_DATE,
+    p_special_instructions TEXT DEFAULT ''
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_order_id UUID;
+    v_order_number TEXT;
+    v_total NUMERIC(10,2);
+    v_item_count INTEGER;
+BEGIN
+    -- Lock the cart lines so concurrent checkouts of the same cart serialize
+    PERFORM 1 FROM shopping_carts
+    WHERE user_id = p_user_id AND status = 'active'
+    FOR UPDATE;
+
+    SELECT total_price, item_count
+    INTO v_total, v_item_count
+    FROM cart_summaries
+    WHERE user_id = p_user_id AND status = 'active';
+
+    IF v_item_count IS NULL THEN
+        RETURN jsonb_build_object('success', false, 'error', 'Cart is empty');
+    END IF;
+
+    v_order_number := 'ORD-' || p_user_id || '-' || to_char(clock_timestamp(), 'YYYYMMDDHH24MISS');
+
+    INSERT INTO orders (user_id, order_number, total_amount, order_status, shipping_address, delivery_date, special_instructions)
+    VALUES (p_user_id, v_order_number, v_total, 'pending', p_shipping_address, p_delivery_date, COALESCE(p_special_instructions, ''))
+    RETURNING id INTO v_order_id;
+
+    INSERT INTO order_items (order_id, sku, product_name, brand, quantity, unit_price)
+    SELECT v_order_id, sku, product_name, brand, quantity, unit_price
+    FROM shopping_carts
+    WHERE user_id = p_user_id AND status = 'active';
+
+    UPDATE products p
+    SET stock_quantity = GREATEST(0, p.stock_quantity - c.quantity),
+        updated_at = NOW()
+    FROM (
+        SELECT sku, SUM(quantity) AS quantity
+        FROM shopping_carts
+        WHERE user_id = p_user_id AND status = 'active'
+        GROUP BY sku
+    ) c
+    WHERE p.sku = c.sku;
+
+    UPDATE shopping_carts
+    SET status = 'purchased', order_id = v_order_id, updated_at = NOW()
+    WHERE user_id = p_user_id AND status = 'active';
+
+    RETURN jsonb_build_object(
+        'success', true,
+        'order_id', v_order_id,
+        'order_number', v_order_number,
+        'total_amount', v_total,
+        'item_count', v_item_count,
+        'message', 'Order placed successfully! Order number: ' || v_order_number
+    );
+END;
+$$;
+
+-- At most one active line per (user, session, product); repeated adds merge into it
+CREATE UNIQUE INDEX IF NOT EXISTS uq_shopping_carts_active_line
+    ON shopping_carts(user_id, session_id, sku)
+    WHERE status = 'active';
+
+-- Add-or-increment a cart line in one round trip. Product details come from the caller's
+-- catalog cache; session validity is enforced by the foreign key on session_id.
+CREATE OR REPLACE FUNCTION add_cart_item(
+    p_user_id TEXT,
+    p_session_id TEXT,
+    p_sku TEXT,
+    p_quantity INTEGER,
+    p_product_name TEXT,
+    p_brand TEXT,
+    p_unit_price NUMERIC,
+    p_notes TEXT DEFAULT ''
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_line JSONB;
+    v_inserted BOOLEAN;
+    v_constraint TEXT;
+    v_open BOOLEAN;
+    v_expires_at TIMESTAMPTZ;
+BEGIN
+    -- Only open sessions take new lines; a missing session is reported by the foreign key below
+    SELECT active AND (expires_at IS NULL OR expires_at > NOW()), expires_at
+    INTO v_open, v_expires_at
+    FROM cart_sessions WHERE session_id = p_session_id;
+    IF FOUND AND NOT v_open THEN
+        RETURN jsonb_build_object('success', false, 'error',
+            'Session ' || p_session_id || ' has expired. Please create a new cart session.');
+    END IF;
+
+    INSERT INTO shopping_carts (user_id, sku, product_name, brand, quantity, unit_price, notes, status, session_id)
+    VALUES (p_user_id, p_sku, p_product_name, p_brand, p_quantity, p_unit_price, COALESCE(p_notes, ''), 'active', p_session_id)
+    ON CONFLICT (user_id, session_id, sku) WHERE status = 'active'
+    DO UPDATE SET quantity = shopping_carts.quantity + EXCLUDED.quantity, updated_at = NOW()
+    RETURNING to_jsonb(shopping_carts.*), (xmax = 0) INTO v_line, v_inserted;
+
+    RETURN jsonb_build_object('success', true, 'inserted', v_inserted, 'data', v_line,
+                              'session_expires_at', v_expires_at);
+EXCEPTION
+    WHEN foreign_key_violation THEN
+        GET STACKED DIAGNOSTICS v_constraint = CONSTRAINT_NAME;
+        IF v_constraint LIKE '%session_id%' THEN
+            RETURN jsonb_build_object('success', false, 'error',
+                'Session ' || p_session_id || ' does not exist. Please create a cart session first.');
+        END IF;
+        RETURN jsonb_build_object('success', false, 'error', 'Product not found');
+END;
+$$;
+
+-- Write-behind cart flush: persist a batch of cart line states for one user in a single
+-- transaction. Each change is {id, session_id, sku, status, quantity, product_name, brand,
+-- unit_price, notes}; active lines are upserted to exactly that quantity, removed lines are
+-- marked removed. Either every change in the batch is applied or none is.
+CREATE OR REPLACE FUNCTION apply_cart_changes(
+    p_user_id TEXT,
+    p_changes JSONB
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_change JSONB;
+    v_applied INTEGER := 0;
+    v_stale JSONB := '[]'::jsonb;
+BEGIN
+    FOR v_change IN SELECT * FROM jsonb_array_elements(p_changes) LOOP
+        -- A line that left 'active' meanwhile (purchased, expired), or an edit to a session
+        -- that is no longer open, is reported instead of being written
+        IF EXISTS (
+            SELECT 1 FROM shopping_carts
+            WHERE id = (v_change->>'id')::UUID AND status <> 'active'
+        ) OR (v_change->>'status' <> 'removed' AND NOT EXISTS (
+            SELECT 1 FROM cart_sessions
+            WHERE session_id = v_change->>'session_id' AND active AND (expires_at IS NULL OR expires_at > NOW())
+        )) THEN
+            v_stale := v_stale || to_jsonb(v_change->>'id');
+            CONTINUE;
+        END IF;
+
+        IF v_change->>'status' = 'removed' THEN
+            UPDATE shopping_carts
+            SET status = 'removed', updated_at = NOW()
+            WHERE user_id = p_user_id
+              AND session_id = v_change->>'session_id'
+              AND sku = v_change->>'sku'
+              AND status = 'active';
+        ELSE
+            INSERT INTO shopping_carts (id, user_id, sku, product_name, brand, quantity, unit_price, notes, status, session_id)
+            VALUES (
+                COALESCE((v_change->>'id')::UUID, uuid_generate_v4()), p_user_id, v_change->>'sku',
+                v_change->>'product_name', v_change->>'brand', (v_change->>'quantity')::INTEGER,
+                (v_change->>'unit_price')::NUMERIC, COALESCE(v_change->>'notes', ''), 'active', v_change->>'session_id'
+            )
+            ON CONFLICT (user_id, session_id, sku) WHERE status = 'active'
+            DO UPDATE SET quantity = EXCLUDED.quantity, notes = EXCLUDED.notes, updated_at = NOW();
+        END IF;
+        v_applied := v_applied + 1;
+    END LOOP;
+
+    RETURN jsonb_build_object('success', true, 'applied', v_applied, 'stale', v_stale);
+EXCEPTION
+    WHEN foreign_key_violation OR check_violation OR not_null_violation OR unique_violation THEN
+        RETURN jsonb_build_object('success', false, 'error', SQLERRM);
+END;
+$$;
+
+-- Cart read for the assistant: totals from cart_summaries plus only the columns the
+-- prompt needs for each line, in one round trip.
+CREATE OR REPLACE FUNCTION get_cart_summary(
+    p_user_id TEXT,
+    p_status TEXT DEFAULT 'active'
+)
+RETURNS JSONB
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT jsonb_build_object(
+        'item_count', COALESCE(s.item_count, 0),
+        'total_items', COALESCE(s.total_items, 0),
+        'total_price', COALESCE(s.total_price, 0),
+        'brands_summary', COALESCE((
+            SELECT jsonb_object_agg(b.brand, b.lines)
+            FROM (
+                SELECT COALESCE(brand, 'Unknown') AS brand, COUNT(*) AS lines
+                FROM shopping_carts
+                WHERE user_id = p_user_id AND status = p_status
+                GROUP BY 1
+            ) b
+        ), '{}'::jsonb),
+        'items', COALESCE((
+            SELECT jsonb_agg(jsonb_build_object(
+                'sku', c.sku, 'product_name', c.product_name, 'brand', c.brand,
+                'quantity', c.quantity, 'unit_price', c.unit_price, 'total_price', c.total_price
+            ) ORDER BY c.added_at)
+            FROM shopping_carts c
+            WHERE c.user_id = p_user_id AND c.status = p_status
+        ), '[]'::jsonb)
+    )
+    FROM (SELECT 1) AS one
+    LEFT JOIN cart_summaries s ON s.user_id = p_user_id AND s.status = p_status;
+$$;
+
+-- Session housekeeping for the background reaper: deactivate up to p_limit sessions that
+-- expired before p_now, oldest first, and mark their active cart lines 'expired', in one
+-- short transaction. SKIP LOCKED lets several workers reap at once without waiting on each other.
+CREATE OR REPLACE FUNCTION expire_sessions_batch(
+    p_now TIMESTAMPTZ,
+    p_limit INTEGER
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_session_ids TEXT[];
+    v_released INTEGER := 0;
+BEGIN
+    SELECT COALESCE(array_agg(session_id), '{}') INTO v_session_ids
+    FROM (
+        SELECT session_id
+        FROM cart_sessions
+        WHERE active AND expires_at < p_now
+        ORDER BY expires_at
+        LIMIT p_limit
+        FOR UPDATE SKIP LOCKED
+    ) expired;
+
+    IF cardinality(v_session_ids) > 0 THEN
+        UPDATE cart_sessions SET active = false WHERE session_id = ANY(v_session_ids);
+
+        UPDATE shopping_carts
+        SET status = 'expired', updated_at = NOW()
+        WHERE session_id = ANY(v_session_ids) AND status = 'active';
+        GET DIAGNOSTICS v_released = ROW_COUNT;
+    END IF;
+
+    RETURN jsonb_build_object(
+        'sessions_expired', cardinality(v_session_ids),
+        'lines_released', v_released,
+        'session_ids', to_jsonb(v_session_ids)
+    );
+END;
+$$;
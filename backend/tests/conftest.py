@@ -0,0 +1,40 @@
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Tests that import the agent module run it offline, as benchmark.py does
+os.environ["DATA_BACKEND"] = "sqlite"
+os.environ["SQLITE_DB_PATH"] = ":memory:"
+os.environ["RECIPE_CACHE_PATH"] = ""
+os.environ["WS_AUTH"] = "none"
+
+from repository import SQLiteRepository
+
+
+@pytest.fixture
+def repository():
+    """Private in-memory database with the real schema and catalog"""
+    return SQLiteRepository(":memory:")
+
+
+@pytest.fixture
+def make_session(repository):
+    """Create a cart session for a user; expired ones start an hour in the past"""
+    def make(user_id: str, session_id: str, expired: bool = False) -> str:
+        offset = timedelta(hours=-1 if expired else 1)
+        repository.create_session({
+            "user_id": user_id, "session_id": session_id, "session_type": "guest",
+            "active": True, "expires_at": (datetime.now() + offset).isoformat(), "metadata": {}
+        })
+        return session_id
+    return make
+
+
+@pytest.fixture(scope="session")
+def agent():
+    """The agent module on the local SQLite catalog"""
+    import agent
+    return agent
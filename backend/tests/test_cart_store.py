@@ -0,0 +1,313 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from cart_store import CartStore
+
+
+def add(store, user_id, session_id, sku="VEG-005", quantity=1):
+    return store.add(user_id, session_id, sku, quantity, "Green Chillies", "Fresh Farm", 10.0)
+
+
+def active_lines(repository, user_id):
+    return {(row["sku"], row["quantity"]) for row in repository.get_cart(user_id, "active")}
+
+
+def checkout(repository, user_id):
+    return repository.checkout(user_id, "Test Address", datetime.now().date().isoformat())
+
+
+class FailingRepository:
+    """Delegates to a real repository but fails the next `failures` cart flushes"""
+
+    def __init__(self, inner, failures=1):
+        self.inner = inner
+        self.failures = failures
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+    def apply_cart_changes(self, user_id, changes):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("database unavailable")
+        return self.inner.apply_cart_changes(user_id, changes)
+
+
+class BlockingRepository:
+    """Delegates to a real repository; async flushes hang until `release` is set"""
+
+    def __init__(self, inner):
+        self.inner = inner
+        self.started = asyncio.Event()
+        self.release = asyncio.Event()
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+    async def aapply_cart_changes(self, user_id, changes):
+        self.started.set()
+        await self.release.wait()
+        return self.inner.apply_cart_changes(user_id, changes)
+
+
+def test_batched_mode_queues_until_flush(repository, make_session):
+    store = CartStore(repository, durability="batched")
+    store.remember_session(make_session("u1", "s1"))
+
+    add(store, "u1", "s1", quantity=2)
+    assert active_lines(repository, "u1") == set()
+    assert store.summary("u1")["total_items"] == 2
+
+    assert store.flush()
+    assert active_lines(repository, "u1") == {("VEG-005", 2)}
+    assert store.stats()["pending_changes"] == 0
+
+
+def test_batched_mode_flushes_at_max_pending(repository, make_session):
+    store = CartStore(repository, durability="batched", max_pending=2)
+    store.remember_session(make_session("u1", "s1"))
+
+    add(store, "u1", "s1", sku="VEG-005")
+    assert active_lines(repository, "u1") == set()
+    add(store, "u1", "s1", sku="VEG-006")
+    assert active_lines(repository, "u1") == {("VEG-005", 1), ("VEG-006", 1)}
+
+
+def test_sync_mode_writes_every_edit(repository, make_session):
+    store = CartStore(repository, durability="sync")
+    store.remember_session(make_session("u1", "s1"))
+
+    add(store, "u1", "s1")
+    assert active_lines(repository, "u1") == {("VEG-005", 1)}
+    store.set_quantity("u1", "VEG-005", 5)
+    assert active_lines(repository, "u1") == {("VEG-005", 5)}
+    store.remove("u1", "VEG-005")
+    assert active_lines(repository, "u1") == set()
+
+
+def test_unknown_session_is_written_through(repository, make_session):
+    store = CartStore(repository, durability="batched")
+    make_session("u1", "s1")
+
+    assert add(store, "u1", "s1")["success"]
+    assert active_lines(repository, "u1") == {("VEG-005", 1)}
+    assert not add(store, "u1", "missing")["success"]
+
+
+def test_failed_flush_is_retried(repository, make_session):
+    failing = FailingRepository(repository)
+    store = CartStore(failing, durability="batched")
+    store.remember_session(make_session("u1", "s1"))
+    add(store, "u1", "s1")
+
+    assert not store.flush()
+    assert store.stats()["pending_changes"] == 1
+    assert store.stats()["flush_failures"] == 1
+
+    # Edits made after the failed batch win over its queued state
+    store.set_quantity("u1", "VEG-005", 3)
+    assert store.flush()
+    assert active_lines(repository, "u1") == {("VEG-005", 3)}
+
+
+def test_cancelled_flush_requeues_its_batch(repository, make_session):
+    async def scenario():
+        blocking = BlockingRepository(repository)
+        store = CartStore(blocking, durability="batched", flush_wait=0.5)
+        store.remember_session(make_session("u1", "s1"))
+        add(store, "u1", "s1")
+
+        flush = asyncio.create_task(store.aflush())
+        await blocking.started.wait()
+        flush.cancel()
+        await asyncio.gather(flush, return_exceptions=True)
+
+        assert store.stats()["pending_changes"] == 1
+        blocking.release.set()
+        assert await asyncio.wait_for(store.aflush(), timeout=2)
+        assert active_lines(repository, "u1") == {("VEG-005", 1)}
+
+    asyncio.run(scenario())
+
+
+def test_flush_waits_for_another_flush_only_up_to_flush_wait(repository, make_session):
+    async def scenario():
+        blocking = BlockingRepository(repository)
+        store = CartStore(blocking, durability="batched", flush_wait=0.05)
+        store.remember_session(make_session("u1", "s1"))
+        add(store, "u1", "s1")
+
+        first = asyncio.create_task(store.aflush())
+        await blocking.started.wait()
+        assert not await asyncio.wait_for(store.aflush("u1"), timeout=1)
+        blocking.release.set()
+        assert await first
+
+    asyncio.run(scenario())
+
+
+def test_checkout_purchases_flushed_lines_and_drops_the_cart(repository, make_session):
+    store = CartStore(repository, durability="batched")
+    store.remember_session(make_session("u1", "s1"))
+    add(store, "u1", "s1", quantity=2)
+
+    assert store.flush()
+    result = checkout(repository, "u1")
+    assert result["success"]
+    store.checked_out("u1")
+
+    assert store.summary("u1")["items"] == []
+    assert active_lines(repository, "u1") == set()
+    assert len(repository.get_cart("u1", "purchased")) == 1
+
+
+def test_refused_changes_are_dropped_not_retried(repository, make_session):
+    store = CartStore(repository, durability="batched")
+    store.remember_session(make_session("u1", "s1"))
+    add(store, "u1", "s1", sku="VEG-005")
+    # Not in the catalog: the foreign key refuses it every time
+    add(store, "u1", "s1", sku="NOT-A-SKU", quantity=2)
+    add(store, "u1", "s1", sku="VEG-006")
+
+    assert store.flush()
+    assert store.stats()["rejected_changes"] == 1
+    assert store.stats()["pending_changes"] == 0
+    assert active_lines(repository, "u1") == {("VEG-005", 1), ("VEG-006", 1)}
+    # The cart is re-read, so memory matches the database again
+    assert {item["sku"] for item in store.summary("u1")["items"]} == {"VEG-005", "VEG-006"}
+    assert checkout(repository, "u1")["success"]
+
+
+def test_a_refused_single_change_does_not_block_checkout(repository, make_session):
+    store = CartStore(repository, durability="batched")
+    store.remember_session(make_session("u1", "s1"))
+    add(store, "u1", "s1", sku="NOT-A-SKU")
+
+    async def scenario():
+        assert await store.aflush("u1")
+        assert await store.aflush("u1")
+
+    asyncio.run(scenario())
+    assert store.stats()["rejected_changes"] == 1
+    assert store.stats()["flush_failures"] == 0
+    assert store.summary("u1")["items"] == []
+
+
+class SlowCheckoutRepository:
+    """Delegates to a real repository; async checkouts wait for `release` before running"""
+
+    def __init__(self, inner):
+        self.inner = inner
+        self.started = asyncio.Event()
+        self.release = asyncio.Event()
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+    async def acheckout(self, *args):
+        self.started.set()
+        await self.release.wait()
+        return self.inner.checkout(*args)
+
+
+def test_lines_added_during_checkout_survive_it(repository, make_session):
+    slow = SlowCheckoutRepository(repository)
+    store = CartStore(slow, durability="batched")
+    store.remember_session(make_session("u1", "s1"))
+
+    async def scenario():
+        add(store, "u1", "s1", sku="VEG-005")
+        assert await store.aflush("u1")
+        purchase = asyncio.create_task(slow.acheckout("u1", "Test Address", datetime.now().date().isoformat()))
+        await slow.started.wait()
+        # A parallel tool call adds a new line and edits the one being purchased
+        assert (await store.aadd("u1", "s1", "VEG-006", 2, "Ginger", "Fresh Farm", 20.0))["success"]
+        await store.aset_quantity("u1", "VEG-005", 3)
+        slow.release.set()
+        assert (await purchase)["success"]
+        store.checked_out("u1")
+        assert await store.aflush("u1")
+
+    asyncio.run(scenario())
+    assert [item["sku"] for item in store.summary("u1")["items"]] == ["VEG-006"]
+    assert active_lines(repository, "u1") == {("VEG-006", 2)}
+    assert {row["sku"] for row in repository.get_cart("u1", "purchased")} == {"VEG-005"}
+
+
+def test_lines_in_flight_during_checkout_survive_it(repository, make_session):
+    blocking = BlockingRepository(repository)
+    store = CartStore(blocking, durability="batched")
+    store.remember_session(make_session("u1", "s1"))
+
+    async def scenario():
+        add(store, "u1", "s1", sku="VEG-005")
+        assert store.flush("u1")
+        add(store, "u1", "s1", sku="VEG-006")
+        flushing = asyncio.create_task(store.aflush("u1"))
+        await blocking.started.wait()
+        assert checkout(repository, "u1")["success"]
+        store.checked_out("u1")
+        blocking.release.set()
+        await flushing
+        assert await store.aflush("u1")
+
+    asyncio.run(scenario())
+    assert [item["sku"] for item in store.summary("u1")["items"]] == ["VEG-006"]
+    assert active_lines(repository, "u1") == {("VEG-006", 1)}
+
+
+def test_edits_to_purchased_lines_are_dropped_not_retried(repository, make_session):
+    store = CartStore(repository, durability="batched")
+    store.remember_session(make_session("u1", "s1"))
+    add(store, "u1", "s1")
+    assert store.flush()
+
+    # Another worker checks the cart out; this process still holds the line as active
+    assert checkout(repository, "u1")["success"]
+    store.set_quantity("u1", "VEG-005", 4)
+
+    assert store.flush()
+    assert store.stats()["stale_lines"] == 1
+    assert store.summary("u1")["items"] == []
+    assert store.flush()
+    assert active_lines(repository, "u1") == set()
+
+
+@pytest.mark.parametrize("durability", ["sync", "batched"])
+def test_totals_match_the_database(repository, make_session, durability):
+    store = CartStore(repository, durability=durability)
+    store.remember_session(make_session("u1", "s1"))
+    add(store, "u1", "s1", sku="VEG-005", quantity=2)
+    add(store, "u1", "s1", sku="VEG-006", quantity=1)
+    store.set_quantity("u1", "VEG-006", 4)
+    store.remove("u1", "VEG-005")
+    assert store.flush()
+
+    memory = store.summary("u1")
+    stored = repository.cart_summary("u1", "active")
+    assert (memory["item_count"], memory["total_items"]) == (stored["item_count"], stored["total_items"])
+    assert memory["total_price"] == pytest.approx(float(stored["total_price"]))
+
+
+def test_adds_to_expired_sessions_are_rejected(repository, make_session):
+    store = CartStore(repository, durability="batched")
+    make_session("u1", "old", expired=True)
+
+    result = add(store, "u1", "old")
+    assert not result["success"]
+    assert "expired" in result["error"]
+    assert active_lines(repository, "u1") == set()
+
+
+def test_queued_adds_to_a_session_reaped_meanwhile_are_dropped(repository, make_session):
+    store = CartStore(repository, durability="batched")
+    store.remember_session(make_session("u1", "s1"))
+    add(store, "u1", "s1")
+
+    # Another worker's reaper deactivates the session before this process flushes
+    repository.expire_sessions_batch("9999-12-31T00:00:00", 10)
+    assert store.flush()
+    assert store.summary("u1")["items"] == []
+    assert active_lines(repository, "u1") == set()
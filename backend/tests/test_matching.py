@@ -0,0 +1,76 @@
+import pytest
+
+from matcher import content_tokens, name_covers, normalize
+from semantic import SemanticIndex
+
+
+def names(options):
+    return [option["item_name"] for option in options]
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("garam masala powder", "Garam Masala"),
+    ("spinach leaves", "Spinach (Palak)"),
+    ("paneer cubes", "Paneer"),
+    ("ginger paste", "Ginger"),
+    ("tomato puree", "Tomatoes"),
+    ("fresh cream", "Fresh Cream"),
+    ("basmati", "Basmati Rice"),
+    ("bhindi", "Okra (Bhindi)"),
+    ("yoghurt", "Greek Yogurt"),
+    ("cloves", "Cloves (Laung)"),
+])
+def test_ingredient_options_find_the_product(agent, query, expected):
+    assert expected in names(agent._ingredient_options([query], None)[query])
+
+
+def test_form_word_does_not_pick_a_different_product(agent):
+    assert names(agent._ingredient_options(["garlic cloves"], None)["garlic cloves"]) == ["Garlic"]
+
+
+@pytest.mark.parametrize("query", ["butter chicken", "fish sauce", "chilli flakes"])
+def test_ingredient_options_reject_other_products(agent, query):
+    assert agent._ingredient_options([query], None)[query] == []
+
+
+def test_fuzzy_options_are_exact(agent):
+    options = agent._ingredient_options(["paneer"], None)["paneer"]
+    assert options and not any(option.get("approximate") for option in options)
+
+
+def test_semantic_options_are_marked_approximate(agent, monkeypatch):
+    # Leave every ingredient to the semantic fallback
+    monkeypatch.setattr(agent.product_cache, "match", lambda *args, **kwargs: [])
+    options = agent._ingredient_options(["greek yoghurt", "garam masala powder", "fish sauce"], None)
+    assert names(options["greek yoghurt"]) == ["Greek Yogurt"]
+    assert "Garam Masala" in names(options["garam masala powder"])
+    assert options["greek yoghurt"][0]["approximate"] is True
+    assert options["fish sauce"] == []
+
+
+def test_content_tokens_drop_form_words_unless_nothing_is_left():
+    assert content_tokens("garam masala powder") == ["garam", "masala"]
+    assert content_tokens("Cloves") == ["clove"]
+
+
+def test_name_covers():
+    assert name_covers("garam masala powder", "Garam Masala")
+    assert name_covers("spinach leaves", "Spinach (Palak)", head_only=True)
+    assert not name_covers("fish sauce", "Soy Sauce")
+    assert not name_covers("butter chicken", "Butter", head_only=True)
+    assert not name_covers("garlic cloves", "Cloves (Laung)", head_only=True)
+
+
+def test_synonym_chains_resolve_in_one_lookup():
+    assert normalize("Greek Yoghurt") == normalize("greek yogurt") == ["greek", "curd"]
+
+
+def test_semantic_index_covering_and_incremental_updates():
+    index = SemanticIndex(dimensions=1024)
+    index.add("SAUCE-1", "Soy Sauce")
+    index.add("CURD-1", "Greek Yogurt")
+    assert index.top_k("fish sauce", min_score=0.3)
+    assert index.top_k("fish sauce", min_score=0.3, covering=True) == []
+    assert [sku for sku, _ in index.top_k("yoghurt", covering=True)] == ["CURD-1"]
+    index.remove("CURD-1")
+    assert index.top_k("yoghurt", covering=True) == []
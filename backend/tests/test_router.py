@@ -0,0 +1,121 @@
+import json
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from payloads import tool_result
+from router import IntentRouter
+
+OPTIONS = {
+    "available": True,
+    "options": [
+        {"sku": "VEG-005", "item_name": "Green Chillies", "brand": "Fresh Farm", "price": 10},
+        {"sku": "VEG-006", "item_name": "Ginger", "brand": "Fresh Farm", "price": 20},
+        {"sku": "VEG-007", "item_name": "Garlic", "brand": "Fresh Farm", "price": 30},
+    ],
+    "count": 3,
+}
+
+
+def tool_turn(*calls):
+    """One assistant message calling tools in parallel, then their results; calls are (name, args, result, id)"""
+    return [
+        AIMessage(content="", tool_calls=[{"name": name, "args": args, "id": call_id, "type": "tool_call"}
+                                          for name, args, _, call_id in calls]),
+        *[ToolMessage(content=tool_result(name, result), name=name, tool_call_id=call_id)
+          for name, _, result, call_id in calls],
+    ]
+
+
+def recipe_start():
+    return [
+        HumanMessage(content="I want to make pasta"),
+        *tool_turn(("extract_recipe_ingredients", {"recipe_request": "pasta"},
+                    {"recipe": "pasta", "ingredients": ["chilli", "ginger", "garlic"]}, "c1"),
+                   ("create_cart_session", {"user_id": "u1"}, {"success": True, "session_id": "s1"}, "c2")),
+        AIMessage(content="The ingredients are chilli, ginger and garlic. Shall I start with chilli?"),
+    ]
+
+
+def options_turn(reply):
+    return [
+        HumanMessage(content="yes"),
+        *tool_turn(("check_ingredient_availability", {"ingredient_name": "chilli"}, OPTIONS, "c3")),
+        AIMessage(content=reply),
+    ]
+
+
+def route(messages, text):
+    return IntentRouter().route(messages + [HumanMessage(content=text)], "u1")
+
+
+def call(decision):
+    assert decision is not None
+    tool_call = decision.tool_calls[0]
+    return tool_call["name"], tool_call["args"]
+
+
+def test_pick_adds_the_numbered_option():
+    messages = recipe_start() + options_turn("1. Green Chillies - ₹10\n2. Ginger - ₹20\n3. Garlic - ₹30")
+    assert call(route(messages, "2")) == (
+        "add_to_cart", {"user_id": "u1", "sku": "VEG-006", "quantity": 1, "session_id": "s1"})
+    assert call(route(messages, "option 3"))[1]["sku"] == "VEG-007"
+
+
+def test_payload_numbers_the_options():
+    result = json.loads(tool_result("check_ingredient_availability", OPTIONS))
+    assert [option["option"] for option in result["options"]] == [1, 2, 3]
+
+
+def test_pick_follows_the_option_numbers_when_the_reply_leaves_some_out():
+    messages = recipe_start() + options_turn("1. Green Chillies - ₹10\n3. Garlic - ₹30")
+    assert call(route(messages, "3"))[1]["sku"] == "VEG-007"
+
+
+def test_pick_defers_when_the_reply_did_not_show_that_product():
+    # The reply renumbered the list: its "2" is Garlic, the payload's 2 is Ginger
+    messages = recipe_start() + options_turn("1. Green Chillies - ₹10\n2. Garlic - ₹30")
+    assert route(messages, "2") is None
+
+
+def test_pick_outside_the_options_defers_to_the_llm():
+    messages = recipe_start() + options_turn("1. Green Chillies\n2. Ginger\n3. Garlic")
+    assert route(messages, "7") is None
+
+
+def test_pick_without_a_session_defers_to_the_llm():
+    messages = options_turn("1. Green Chillies\n2. Ginger\n3. Garlic")
+    assert route(messages, "1") is None
+
+
+def test_affirmative_checks_the_next_unchecked_ingredient():
+    assert call(route(recipe_start(), "yes")) == ("check_ingredient_availability", {"ingredient_name": "chilli"})
+    messages = recipe_start() + options_turn("1. Green Chillies\n2. Ginger\n3. Garlic") + [
+        HumanMessage(content="1"),
+        *tool_turn(("add_to_cart", {"user_id": "u1", "sku": "VEG-005", "quantity": 1, "session_id": "s1"},
+                    {"success": True, "data": {"sku": "VEG-005", "product_name": "Green Chillies"}}, "c4")),
+        AIMessage(content="Added Green Chillies. Next up: ginger?"),
+    ]
+    assert call(route(messages, "next")) == ("check_ingredient_availability", {"ingredient_name": "ginger"})
+
+
+def test_checkout_and_show_cart():
+    assert call(route([], "checkout please")) == ("checkout_cart", {"user_id": "u1"})
+    assert call(route([], "Place my order")) == ("checkout_cart", {"user_id": "u1"})
+    assert call(route([], "show my cart")) == ("get_user_cart", {"user_id": "u1"})
+
+
+def test_remove_names_one_line_in_the_cart():
+    messages = recipe_start() + [
+        HumanMessage(content="add ginger"),
+        *tool_turn(("add_to_cart", {"user_id": "u1", "sku": "VEG-006", "quantity": 1, "session_id": "s1"},
+                    {"success": True, "data": {"sku": "VEG-006", "product_name": "Ginger"}}, "c4")),
+        AIMessage(content="Added Ginger."),
+    ]
+    assert call(route(messages, "remove ginger from my cart")) == ("remove_from_cart", {"user_id": "u1", "sku": "VEG-006"})
+    assert route(messages, "remove garlic") is None
+
+
+def test_free_form_text_defers_to_the_llm():
+    router = IntentRouter()
+    assert router.route(recipe_start() + [HumanMessage(content="what goes well with pasta?")], "u1") is None
+    assert router.stats()["fallbacks"] == 1
@@ -0,0 +1,48 @@
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+
+@pytest.fixture
+def client(agent):
+    # No lifespan: these tests never reach the graph
+    return TestClient(agent.app)
+
+
+def test_thread_of_another_user_is_rejected(client):
+    with pytest.raises(WebSocketDisconnect) as rejected:
+        with client.websocket_connect("/ws?user_id=alice&thread_id=bob:1234"):
+            pass
+    assert rejected.value.code == 1008
+
+
+def test_thread_id_must_be_scoped_by_the_full_user_id(client):
+    with pytest.raises(WebSocketDisconnect):
+        with client.websocket_connect("/ws?user_id=bob&thread_id=bobby:1234"):
+            pass
+
+
+def test_own_thread_is_accepted(client):
+    with client.websocket_connect("/ws?user_id=alice&thread_id=alice:1234") as websocket:
+        websocket.send_json({"message": ""})
+
+
+def test_token_mode_needs_a_valid_token(client, agent, monkeypatch):
+    monkeypatch.setattr(agent, "WS_AUTH", "supabase")
+    with pytest.raises(WebSocketDisconnect):
+        with client.websocket_connect("/ws?user_id=alice"):
+            pass
+
+    async def authenticate(token):
+        return "alice" if token == "good" else None
+
+    monkeypatch.setattr(agent.repository, "aauthenticate", authenticate)
+    with pytest.raises(WebSocketDisconnect):
+        with client.websocket_connect("/ws?access_token=bad"):
+            pass
+    # The user comes from the token, never from ?user_id
+    with pytest.raises(WebSocketDisconnect):
+        with client.websocket_connect("/ws?access_token=good&user_id=bob&thread_id=bob:1"):
+            pass
+    with client.websocket_connect("/ws?access_token=good&thread_id=alice:1") as websocket:
+        websocket.send_json({"message": ""})
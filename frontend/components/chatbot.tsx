@@ -11,6 +11,7 @@ import { X } from "lucide-react";
 interface Message {
   role: "user" | "assistant";
   content: string;
+  streaming?: boolean;
 }
 
 interface ChatbotProps {
@@ -25,6 +26,7 @@ export default function Chatbot({ isOpen, onClose }: ChatbotProps) {
   const [inputText, setInputText] = useState("");
   const [messages, setMessages] = useState<Message[]>([]);
   const [isLoading, setIsLoading] = useState(false);
+  const [toolStatus, setToolStatus] = useState<string | null>(null);
   const wsRef = useRef<WebSocket | null>(null);
   const messagesEndRef = useRef<HTMLDivElement | null>(null);
 
@@ -37,14 +39,30 @@ export default function Chatbot({ isOpen, onClose }: ChatbotProps) {
   }, [messages]);
 
   useEffect(() => {
-    if (user && isOpen) {
-      // Set up WebSocket connection
-      wsRef.current = new WebSocket("ws://localhost:8000/ws");
+    if (user && session && isOpen) {
+      // Set up WebSocket connection; the backend takes the user from the access token
+      wsRef.current = new WebSocket(`ws://localhost:8000/ws?access_token=${encodeURIComponent(session.access_token)}`);
 
       wsRef.current.onmessage = (event) => {
         const data = JSON.parse(event.data);
-        if (data.response) {
-          setMessages((prev) => [...prev, { role: "assistant", content: data.response }]);
+        if (data.type === "token") {
+          // Grow the in-progress assistant message until the final frame arrives
+          setMessages((prev) => {
+            const last = prev[prev.length - 1];
+            if (last && last.streaming) {
+              return [...prev.slice(0, -1), { ...last, content: last.content + data.content }];
+            }
+            return [...prev, { role: "assistant", content: data.content, streaming: true }];
+          });
+        } else if (data.type === "tool") {
+          setToolStatus(data.status === "start" ? data.message : null);
+        } else if (data.response) {
+          setMessages((prev) => {
+            const last = prev[prev.length - 1];
+            const settled = last && last.streaming ? prev.slice(0, -1) : prev;
+            return [...settled, { role: "assistant", content: data.response }];
+          });
+          setToolStatus(null);
           setIsLoading(false);
         }
       };
@@ -66,7 +84,7 @@ export default function Chatbot({ isOpen, onClose }: ChatbotProps) {
         }
       };
     }
-  }, [user, isOpen]);
+  }, [user, session, isOpen]);
 
   const handleSubmit = async (e: React.FormEvent) => {
     e.preventDefault();
@@ -75,7 +93,7 @@ export default function Chatbot({ isOpen, onClose }: ChatbotProps) {
     setIsLoading(true);
     setMessages((prev) => [...prev, { role: "user", content: inputText }]);
     
-    wsRef.current.send(JSON.stringify({ message: inputText }));
+    wsRef.current.send(JSON.stringify({ message: inputText, stream: true }));
     setInputText("");
   };
 
@@ -156,6 +174,9 @@ export default function Chatbot({ isOpen, onClose }: ChatbotProps) {
               </div>
             </div>
           ))}
+          {toolStatus && (
+            <div className="text-sm text-gray-500 italic">{toolStatus}</div>
+          )}
           <div ref={messagesEndRef} />
         </div>
         <form onSubmit={handleSubmit} className="p-4 border-t">